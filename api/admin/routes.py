@@ -1,35 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+import datetime
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Header
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from typing import List, AsyncGenerator
+from typing import List, Optional
 from fastapi import Request
 
-from api.db.session import SessionLocal
-from api.db.models import User
-from api.db.schemas import UserOut
+from api.db.session import get_db
+from api.db.stats import STATS_TOP_LIMIT, slow_query_report
+from api.db.schemas import AuditPage, BulkDeleteRequest, BulkDeleteResponse, UserChangePage, UserOut
+from api.db.services import (
+    AUDIT_EVENT_FIELDS, USER_CHANGE_FIELDS, USER_OUT_FIELDS, count_users, delete_users, feed_horizon,
+    get_user_role, get_users_version, list_audit_events, list_user_changes, list_user_page, search_users,
+    tombstone_horizon, user_reads
+)
+from api.core.audit import audit_log
+from api.core.crypto import key_cache
+from api.core.deadline import deadline_stats
+from api.core.idempotency import idempotency_store
+from api.core.jobs import jobs
+from api.core.lifecycle import in_flight
+from api.core.ratelimit import client_ip, password_gate
+from api.core.http_cache import cache_headers, is_not_modified, make_etag, not_modified
+from api.core.responses import FastJSONResponse, rows_to_dicts, trusted_json
 from api.logger import logger
 
 router = APIRouter()
 
-async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
-    async with SessionLocal() as session:
-        request.state.db = session
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            logger.exception("Erreur lors de la gestion de la session DB")
-            raise
-        finally:
-            await session.close()
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "100"))
+ADMIN_MAX_PAGE_SIZE = int(os.getenv("ADMIN_MAX_PAGE_SIZE", "1000"))
 
 async def get_admin_user(
     x_user: str = Header(...),
     db: AsyncSession = Depends(get_db)
-) -> User:
-    result = await db.execute(select(User).where(User.username == x_user))
-    user = result.scalars().first()
+):
+    """Profil ROLE : (id, username, role) de l'admin, une requête sur trois colonnes."""
+    user = await get_user_role(db, x_user)
     if not user or user.role != "admin":
         logger.warning(f"Tentative d'accès admin refusée pour {x_user}")
         raise HTTPException(
@@ -38,28 +43,197 @@ async def get_admin_user(
         )
     return user
 
-@router.get("/users", response_model=List[UserOut])
+@router.get("/users", response_model=List[UserOut], response_class=FastJSONResponse)
 async def list_all_users(
+    request: Request,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    after_id: Optional[int] = Query(None, ge=0),
+    q: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db),
+    admin = Depends(get_admin_user)
+):
+    """
+    Page d'utilisateurs triée par id, après `after_id` (pagination par clé). La liste n'est jamais
+    complète d'office : tant qu'il reste des utilisateurs, X-Next-After-Id et l'en-tête Link
+    (rel="next") donnent la page suivante. X-Total-Count : nombre total correspondant à `q`.
+    """
+    q = q.strip() if q else None
+    count, last_update = await get_users_version(db)
+    etag = make_etag("users", count, last_update, limit, after_id or 0, q or "")
+    headers = cache_headers(etag, last_update)
+    if is_not_modified(request, etag, last_update):
+        logger.debug(f"Page d'utilisateurs inchangée pour l'admin {admin.username} (304)")
+        return not_modified(headers)
+    total = await count_users(db, q) if q else count
+    rows = await list_user_page(db, limit, after_id, q)
+    headers["X-Total-Count"] = str(total)
+    if len(rows) == limit:
+        next_after_id = rows[-1].id
+        headers["X-Next-After-Id"] = str(next_after_id)
+        headers["Link"] = f'<{request.url.include_query_params(after_id=next_after_id)}>; rel="next"'
+    logger.info(f"Admin {admin.username} a listé {len(rows)}/{total} utilisateurs (after_id={after_id}, q={q!r})")
+    return trusted_json(rows_to_dicts(rows, USER_OUT_FIELDS), headers=headers)
+
+@router.get("/users/search", response_model=List[UserOut], response_class=FastJSONResponse)
+async def search_all_users(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    admin = Depends(get_admin_user)
+):
+    """
+    Recherche insensible à la casse sur username et email : exact, préfixe, puis (à partir de
+    3 caractères) sous-chaîne et similarité. Résultats classés par pertinence ; total dans X-Total-Count.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Empty search query")
+    rows, total = await search_users(db, q, limit, offset)
+    logger.info(f"Admin {admin.username} a recherché '{q}' : {len(rows)}/{total} résultats")
+    return trusted_json(rows_to_dicts(rows, USER_OUT_FIELDS), headers={"X-Total-Count": str(total)})
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+def _encode_cursor(changed_at: datetime.datetime, row_id: int) -> str:
+    """Curseur opaque « <microsecondes depuis l'epoch>-<id> », croissant avec le flux."""
+    micros = (changed_at - _EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{micros}-{row_id}"
+
+def _decode_cursor(cursor: str) -> tuple:
+    micros, _, row_id = cursor.partition("-")
+    try:
+        return _EPOCH + datetime.timedelta(microseconds=int(micros)), int(row_id)
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+@router.get("/users/changes", response_model=UserChangePage, response_class=FastJSONResponse)
+async def list_changes(
+    since: Optional[str] = Query(None, max_length=64),
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_db),
-    admin: User = Depends(get_admin_user)
+    admin = Depends(get_admin_user)
 ):
-    result = await db.execute(select(User))
-    users = result.scalars().all()
-    logger.info(f"Admin {admin.username} a listé tous les utilisateurs ({len(users)} trouvés)")
-    return [UserOut.model_validate(u) for u in users]
+    """
+    Modifications et suppressions d'utilisateurs après le curseur `since` (toute la table sans curseur),
+    dans l'ordre. Appeler de nouveau avec `since=next_cursor` tant que `has_more` est vrai, puis
+    périodiquement. 410 : curseur plus ancien que la rétention des suppressions, resynchroniser via /admin/users.
+    """
+    cursor = _decode_cursor(since) if since else None
+    if cursor is not None and cursor[0] < tombstone_horizon():
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Cursor expired, full resync required")
+    until = feed_horizon()
+    rows = await list_user_changes(db, cursor, limit, until)
+    changes = []
+    for row in rows_to_dicts(rows, USER_CHANGE_FIELDS):
+        change = {"op": row["op"], "id": row["id"], "changed_at": row["changed_at"].isoformat()}
+        if row["op"] == "delete":
+            change["username"] = row["username"]
+        else:
+            change["user"] = {field: row[field] for field in USER_OUT_FIELDS}
+        changes.append(change)
+    if rows:
+        next_cursor = _encode_cursor(rows[-1].changed_at, rows[-1].id)
+    elif cursor is not None and cursor > (until, 0):
+        next_cursor = since
+    else:
+        # Page vide : tout ce qui précède l'horizon est lu, le curseur avance jusqu'à lui
+        # (sinon un curseur ancien finirait en 410 sans qu'aucune modification n'ait eu lieu)
+        next_cursor = _encode_cursor(until, 0)
+    logger.info(f"Admin {admin.username} a lu {len(changes)} modification(s) depuis {since or 'le début'}")
+    return trusted_json({"changes": changes, "next_cursor": next_cursor, "has_more": len(rows) == limit})
+
+@router.post("/users/bulk-delete", response_model=BulkDeleteResponse)
+async def bulk_delete_users(
+    payload: BulkDeleteRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    admin = Depends(get_admin_user)
+):
+    if admin.id in payload.ids:
+        logger.warning(f"Admin {admin.username} a tenté de supprimer son propre compte par lot")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot delete your own account")
+    deleted = await delete_users(db, payload.ids)
+    await db.commit()
+    await audit_log.record("admin.user_delete", actor=admin.username, ip=client_ip(request),
+                           details={"ids": deleted, "requested": len(payload.ids)})
+    logger.info(f"Admin {admin.username} a supprimé {len(deleted)} utilisateurs par lot : {deleted}")
+    return BulkDeleteResponse(deleted=deleted)
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    admin: User = Depends(get_admin_user)
+    admin = Depends(get_admin_user)
 ):
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
-    if not user:
+    if user_id == admin.id:
+        logger.warning(f"Admin {admin.username} a tenté de supprimer son propre compte")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot delete your own account")
+    if not await delete_users(db, [user_id]):
         logger.warning(f"Tentative de suppression d'utilisateur inexistant (id={user_id}) par admin {admin.username}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    await db.delete(user)
     await db.commit()
+    await audit_log.record("admin.user_delete", actor=admin.username, target=user_id, ip=client_ip(request))
     logger.info(f"Admin {admin.username} a supprimé l'utilisateur id={user_id}")
     return
+
+@router.get("/audit", response_model=AuditPage, response_class=FastJSONResponse)
+async def list_audit(
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    before_id: Optional[int] = Query(None, ge=1),
+    event_type: Optional[str] = Query(None, max_length=64),
+    actor: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db),
+    admin = Depends(get_admin_user)
+):
+    """Journal d'audit, du plus récent au plus ancien ; page suivante avec `before_id=next_before_id`."""
+    rows = await list_audit_events(db, limit, before_id, event_type, actor)
+    events = rows_to_dicts(rows, AUDIT_EVENT_FIELDS)
+    for event in events:
+        event["created_at"] = event["created_at"].isoformat()
+    next_before_id = events[-1]["id"] if len(events) == limit else None
+    logger.info(f"Admin {admin.username} a consulté le journal d'audit ({len(events)} événements)")
+    return trusted_json({"events": events, "next_before_id": next_before_id})
+
+@router.get("/metrics")
+async def runtime_metrics(admin = Depends(get_admin_user)) -> dict:
+    """
+    Compteurs du worker qui répond : files de tâches, journal d'audit, calcul des mots de passe,
+    cache de clés, idempotence, lectures mutualisées et échéances.
+    """
+    return {
+        "pid": os.getpid(),
+        "in_flight_requests": in_flight.count,
+        "jobs": jobs.metrics(),
+        "audit": {
+            "pending": audit_log.pending,
+            "written": audit_log.written,
+            "dropped": audit_log.dropped,
+            "failed_batches": audit_log.failed_batches,
+        },
+        "password_work": {
+            "concurrency": password_gate.concurrency,
+            "waiting": password_gate.waiting,
+            "running": password_gate.running,
+            "rejected": password_gate.rejected,
+            "abandoned": password_gate.abandoned,
+        },
+        "key_cache": key_cache.metrics(),
+        "idempotency": idempotency_store.metrics(),
+        "user_reads": user_reads.metrics(),
+        "deadlines": deadline_stats.metrics(),
+    }
+
+@router.get("/db/slow-queries")
+async def slow_queries(
+    limit: int = Query(STATS_TOP_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    admin = Depends(get_admin_user)
+) -> dict:
+    """
+    Requêtes les plus coûteuses (temps total et moyen, pg_stat_statements) et parcours séquentiels
+    sur les tables surveillées. Même rapport que `python -m api.db.stats --json`.
+    """
+    report = await slow_query_report(db, limit)
+    logger.info(f"Admin {admin.username} a consulté le rapport des requêtes lentes")
+    return report
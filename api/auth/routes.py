@@ -1,51 +1,57 @@
+import hmac
 import os
-from datetime import timedelta
-from fastapi import APIRouter, HTTPException, Depends, status, Request
+import time
+from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Header, Response
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
+from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from typing import AsyncGenerator
+from typing import Optional
 
-from api.core.tokens import create_access_token
-from api.db.session import SessionLocal
-from api.db.models import User, UserSensitiveData
-from api.core.crypto import encrypt_sensitive_data, decrypt_sensitive_data
+from api.core.audit import audit_log
+from api.core.ratelimit import client_ip
+from api.core.tokens import create_access_token, decode_token, hash_token
+from api.core.keys import keyring
+from api.core.http_cache import is_not_modified, make_etag, not_modified
+from api.core.responses import trusted_json
+from api.core.security import verify_token_claims
+from api.db.schemas import IntrospectionRequest, IntrospectionResponse, TokenIntrospection
+from api.db.services import get_token_states, revoke_session, rotate_session
+from api.db.session import get_db
 from api.logger import logger
 
 router = APIRouter()
+wellknown_router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 refresh_token_scheme = HTTPBearer()
 
-SECRET_KEY = os.getenv("SECRET_KEY", "secret")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
-
-async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
-    async with SessionLocal() as session:
-        request.state.db = session
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            logger.exception("Erreur lors de la gestion de la session DB")
-            raise
-        finally:
-            await session.close()
+# Délai pendant lequel le refresh token remplacé par la dernière rotation reste accepté
+REFRESH_REUSE_GRACE = float(os.getenv("REFRESH_REUSE_GRACE", "10"))
+# Doit rester inférieur à JWT_KEY_PUBLISH_AHEAD_MINUTES pour que les clés programmées soient vues à temps
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
+# Secret partagé avec les gateways ; l'introspection est désactivée s'il n'est pas défini
+INTROSPECTION_SECRET = os.getenv("INTROSPECTION_SECRET")
+INTROSPECTION_MAX_BATCH = int(os.getenv("INTROSPECTION_MAX_BATCH", "500"))
+INTROSPECTION_MAX_TTL = int(os.getenv("INTROSPECTION_MAX_TTL", "60"))
 
 @router.post("/refresh", tags=["Auth"])
 async def refresh_and_rotate_token(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(refresh_token_scheme),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Rotation du refresh token. Seules la vérification du token et la mise à jour conditionnelle de la
+    session sont sur le chemin critique ; l'audit est différé (file de tâches).
+    """
     logger.debug("/auth/refresh route called")
     token = credentials.credentials
     # 1. Décodage et vérification du JWT refresh token
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         if payload.get("type") != "refresh":
             logger.warning("Token reçu n'est pas de type refresh")
             raise HTTPException(
@@ -68,68 +74,136 @@ async def refresh_and_rotate_token(
             detail="Invalid refresh token"
         )
 
-    # DEBUG: Affiche tout le contenu de user_sensitive_data avant le JOIN
-    result_debug = await db.execute(select(UserSensitiveData))
-    all_sensitive_data = result_debug.scalars().all()
-    logger.debug(f"ALL user_sensitive_data = {all_sensitive_data}")
-
-    # 2. Récupération de l'utilisateur et de sa sensitive_data via OUTERJOIN
-    result = await db.execute(
-        select(User, UserSensitiveData)
-        .outerjoin(UserSensitiveData, User.id == UserSensitiveData.user_id)
-        .where(User.username == username)
-    )
-    row = result.first()
-    if row:
-        user, sensitive_data = row
-    else:
-        user, sensitive_data = None, None
-        logger.debug(f"JOIN row is None for username {username}")
-
-    logger.debug(f"user = {user}")
-    logger.debug(f"sensitive_data = {sensitive_data}")
-    if sensitive_data:
-        logger.debug(f"sensitive_data.encrypted_refresh_token = {sensitive_data.encrypted_refresh_token}")
-
-    if not user or not sensitive_data or not sensitive_data.encrypted_refresh_token:
-        # SELECT brut pour voir ce qu'il y a pour cet utilisateur
-        result2 = await db.execute(
-            select(UserSensitiveData).where(UserSensitiveData.user_id == user.id if user else -1)
-        )
-        sds = result2.scalars().all()
-        logger.debug(f"brute SELECT user_sensitive_data for user_id = {user.id if user else None} -> {sds}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid refresh token"
-        )
-
-    # 3. Déchiffrement du refresh token stocké
-    stored = decrypt_sensitive_data(sensitive_data.encrypted_refresh_token, user.encryption_key)
-    logger.debug(f"REFRESH: token reçu = {repr(token)}")
-    logger.debug(f"REFRESH: token stocké déchiffré = {repr(stored)}")
-
-    # 4. Comparaison stricte (strip pour éviter les espaces parasites)
-    if not stored or stored.strip() != token.strip():
-        logger.warning("Refresh token reçu différent du token stocké")
+    sid = payload.get("sid")
+    if not sid:
+        # Refresh tokens émis avant les sessions par appareil : reconnexion nécessaire
+        logger.warning(f"Refresh token sans session pour {username}")
+        audit_log.defer("auth.refresh", actor=username, ip=client_ip(request), success=False,
+                        details={"reason": "no session"})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token"
         )
 
-    # 5. Génération et stockage des nouveaux tokens
+    # 2. Nouveaux tokens pour la même session
     new_access = create_access_token(
-        data={"sub": username, "role": role, "scopes": scopes},
+        data={"sub": username, "role": role, "scopes": scopes, "sid": sid},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     new_refresh = create_access_token(
-        data={"sub": username, "role": role, "scopes": scopes, "type": "refresh"},
+        data={"sub": username, "role": role, "scopes": scopes, "type": "refresh", "sid": sid},
         expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     )
-    sensitive_data.encrypted_refresh_token = encrypt_sensitive_data(new_refresh, user.encryption_key)
+
+    # 3. Rotation conditionnelle : la session doit exister et avoir ce token comme token courant
+    #    (ou comme token précédent, remplacé il y a moins de REFRESH_REUSE_GRACE secondes)
+    rotated = await rotate_session(
+        db, sid, username,
+        old_hash=hash_token(token),
+        new_hash=hash_token(new_refresh),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        grace_seconds=REFRESH_REUSE_GRACE,
+    )
+    if not rotated:
+        # Token plus ancien, ou remplacé hors fenêtre de grâce : réutilisation, la session est fermée
+        reused = await revoke_session(db, sid)
+        await db.commit()
+        reason = "token reuse, session revoked" if reused else "session closed"
+        logger.warning(f"Refresh refusé pour {username} (session {sid}) : {reason}")
+        audit_log.defer("auth.refresh", actor=username, ip=client_ip(request), success=False,
+                        details={"reason": reason, "sid": sid})
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
     await db.commit()
+    audit_log.defer("auth.refresh", actor=username, ip=client_ip(request), details={"sid": sid})
     logger.info(f"Refresh token rotaté pour l'utilisateur {username}")
     return {
         "access_token": new_access,
         "refresh_token": new_refresh,
         "token_type": "bearer"
     }
+
+def _introspection_result(token: str, claims: Optional[dict], error: Optional[str], states: dict, now: int) -> TokenIntrospection:
+    if claims is None:
+        return TokenIntrospection(active=False, error=error)
+    username = claims["sub"]
+    token_type = claims.get("type", "access")
+    if username not in states:
+        return TokenIntrospection(active=False, sub=username, error="User not found")
+    sid = claims.get("sid")
+    sessions = states[username]
+    if sid is not None and sid not in sessions:
+        return TokenIntrospection(active=False, sub=username, token_type=token_type, error="Session revoked")
+    if token_type == "refresh":
+        if sid is None or not hmac.compare_digest(sessions[sid], hash_token(token)):
+            return TokenIntrospection(active=False, sub=username, token_type=token_type, error="Token revoked")
+    exp = int(claims["exp"])
+    return TokenIntrospection(
+        active=True,
+        sub=username,
+        role=claims.get("role"),
+        scopes=claims.get("scopes", []),
+        token_type=token_type,
+        exp=exp,
+        iat=int(claims["iat"]) if claims.get("iat") is not None else None,
+        jti=claims.get("jti"),
+        cache_ttl=max(0, min(exp - now, INTROSPECTION_MAX_TTL)),
+    )
+
+@router.post("/introspect", response_model=IntrospectionResponse, tags=["Auth"])
+async def introspect_tokens(
+    body: IntrospectionRequest,
+    response: Response,
+    x_introspection_secret: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Introspection par lot pour les gateways : signature, expiration, scopes demandés et révocation
+    (utilisateur supprimé, refresh token remplacé) sont vérifiés pour chaque token, avec une seule
+    requête SQL pour tout le lot. `cache_ttl`/`ttl` indiquent combien de temps le résultat peut être gardé.
+    """
+    if not INTROSPECTION_SECRET:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Introspection disabled")
+    if not x_introspection_secret or not hmac.compare_digest(x_introspection_secret, INTROSPECTION_SECRET):
+        logger.warning("Appel à /auth/introspect avec un secret invalide")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid introspection credentials")
+    if len(body.tokens) > INTROSPECTION_MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many tokens (max {INTROSPECTION_MAX_BATCH})"
+        )
+
+    # Chaque token distinct n'est vérifié qu'une fois
+    verified = {}
+    for token in dict.fromkeys(body.tokens):
+        try:
+            verified[token] = (verify_token_claims(token, body.scopes), None)
+        except HTTPException as e:
+            verified[token] = (None, e.detail)
+
+    valid_claims = [claims for claims, _ in verified.values() if claims]
+    states = await get_token_states(
+        db,
+        (claims["sub"] for claims in valid_claims),
+        (claims["sid"] for claims in valid_claims if claims.get("sid")),
+    )
+    now = int(time.time())
+    by_token = {token: _introspection_result(token, claims, error, states, now) for token, (claims, error) in verified.items()}
+    results = [by_token[token] for token in body.tokens]
+    active_ttls = [r.cache_ttl for r in results if r.active]
+    ttl = min(active_ttls) if active_ttls else INTROSPECTION_MAX_TTL
+    response.headers["Cache-Control"] = "no-store"
+    logger.info(f"Introspection de {len(body.tokens)} token(s) : {len(active_ttls)} actif(s)")
+    return IntrospectionResponse(results=results, ttl=ttl)
+
+@wellknown_router.get("/.well-known/jwks.json", tags=["Auth"])
+async def jwks(request: Request):
+    """Clés publiques de vérification des JWT (actives, programmées et en période de rétention)."""
+    document = keyring.jwks()
+    etag = make_etag("jwks", *(k["kid"] for k in document["keys"]))
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={JWKS_MAX_AGE}"}
+    if is_not_modified(request, etag):
+        return not_modified(headers)
+    return trusted_json(document, headers=headers)
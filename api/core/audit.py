@@ -0,0 +1,177 @@
+"""
+Journal d'audit en écriture différée.
+
+Les handlers ajoutent des événements à un tampon mémoire borné (`await audit_log.record(...)`),
+sans aller-retour vers la base. Une tâche de fond les écrit par lots (INSERT multi-lignes)
+toutes les AUDIT_FLUSH_INTERVAL secondes, ou dès qu'un lot complet est disponible.
+Tampon plein : l'appelant attend au plus AUDIT_BACKPRESSURE_WAIT secondes qu'un lot parte,
+puis l'événement est abandonné (compté dans `dropped`) plutôt que de bloquer la requête.
+"""
+import asyncio
+import datetime
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from api.core.jobs import jobs
+from api.core.retry import backoff_delay
+from api.db.models import AuditEvent
+from api.db.session import SessionLocal
+from api.logger import logger
+
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+# Un lot = un INSERT multi-lignes : 7 paramètres par événement, 32767 au plus par requête
+AUDIT_BATCH_SIZE = min(int(os.getenv("AUDIT_BATCH_SIZE", "500")), 32767 // 7)
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+AUDIT_BACKPRESSURE_WAIT = float(os.getenv("AUDIT_BACKPRESSURE_WAIT", "0.5"))
+AUDIT_FLUSH_RETRIES = int(os.getenv("AUDIT_FLUSH_RETRIES", "3"))
+
+class AuditBuffer:
+    def __init__(
+        self,
+        capacity: int = AUDIT_BUFFER_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        backpressure_wait: float = AUDIT_BACKPRESSURE_WAIT,
+    ) -> None:
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure_wait = backpressure_wait
+        self._events: deque = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def _events_init(self) -> None:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+            self._space = asyncio.Event()
+            self._space.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    async def record(
+        self,
+        event_type: str,
+        actor: Optional[str] = None,
+        target: Optional[Any] = None,
+        ip: Optional[str] = None,
+        success: bool = True,
+        details: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime.datetime] = None,
+    ) -> bool:
+        """Ajoute un événement ; renvoie False s'il a été abandonné (tampon plein)."""
+        self._events_init()
+        if len(self._events) >= self.capacity:
+            self._wake.set()
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), self.backpressure_wait)
+            except asyncio.TimeoutError:
+                pass
+            if len(self._events) >= self.capacity:
+                self.dropped += 1
+                logger.warning(f"Tampon d'audit plein ({self.capacity}) : événement {event_type} abandonné")
+                return False
+        self._events.append({
+            "created_at": created_at or datetime.datetime.utcnow(),
+            "event_type": event_type,
+            "actor": actor,
+            "target": str(target) if target is not None else None,
+            "ip": ip,
+            "success": success,
+            "details": details,
+        })
+        if len(self._events) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def defer(self, event_type: str, **fields: Any) -> bool:
+        """
+        Comme `record`, sans jamais attendre : l'ajout passe par la file de tâches "default", et
+        l'attente éventuelle (tampon plein) ne retarde pas la réponse. Horodaté à l'appel.
+        """
+        fields.setdefault("created_at", datetime.datetime.utcnow())
+        return jobs.submit("default", self.record, event_type, **fields)
+
+    def _take_batch(self) -> List[dict]:
+        batch = []
+        while self._events and len(batch) < self.batch_size:
+            batch.append(self._events.popleft())
+        if len(self._events) < self.capacity:
+            self._space.set()
+        return batch
+
+    async def _write(self, batch: List[dict]) -> None:
+        # Un seul INSERT ... VALUES (...), (...) : passer le lot en paramètres d'execute() donnerait un
+        # executemany asyncpg (une exécution par ligne), SQLAlchemy ne regroupant les lignes qu'avec RETURNING.
+        async with SessionLocal() as session:
+            await session.execute(insert(AuditEvent).values(batch))
+            await session.commit()
+
+    async def flush(self) -> int:
+        """Écrit tout le contenu du tampon, lot par lot ; renvoie le nombre d'événements écrits."""
+        self._events_init()
+        written = 0
+        while self._events:
+            batch = self._take_batch()
+            for attempt in range(1, AUDIT_FLUSH_RETRIES + 1):
+                try:
+                    await self._write(batch)
+                    written += len(batch)
+                    self.written += len(batch)
+                    break
+                except Exception as e:
+                    if attempt == AUDIT_FLUSH_RETRIES:
+                        self.failed_batches += 1
+                        self.dropped += len(batch)
+                        logger.error(f"Lot d'audit de {len(batch)} événements perdu après {attempt} essais : {e}")
+                        break
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"Échec d'écriture du lot d'audit (essai {attempt}) : {e} ; nouvel essai dans {delay:.2f}s")
+                    await asyncio.sleep(delay)
+        return written
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        self._events_init()
+        self._stopping = False
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="audit-flusher")
+            logger.info(f"Journal d'audit démarré (lots de {self.batch_size}, toutes les {self.flush_interval}s)")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Arrête la tâche de fond puis écrit ce qui reste dans le tampon, en `timeout` secondes au total."""
+        self._stopping = True
+        deadline = asyncio.get_running_loop().time() + timeout
+        if self._task is not None:
+            self._wake.set()
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), max(deadline - asyncio.get_running_loop().time(), 0))
+        except asyncio.TimeoutError:
+            logger.warning(f"Vidage du journal d'audit interrompu ({self.pending} événements perdus)")
+        logger.info(f"Journal d'audit arrêté : {self.written} écrits, {self.dropped} abandonnés")
+
+audit_log = AuditBuffer()
@@ -0,0 +1,225 @@
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Types déjà compressés (ou incompressibles) : on les laisse passer tels quels
+EXCLUDED_CONTENT_TYPE_PREFIXES = ("image/", "video/", "audio/", "font/woff")
+EXCLUDED_CONTENT_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zstd",
+    "application/x-bzip2",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/pdf",
+}
+COMPRESSIBLE_EXCEPTIONS = {"image/svg+xml"}
+
+class _GzipEncoder:
+    def __init__(self, level: int) -> None:
+        self._c = zlib.compressobj(max(1, min(level, 9)), zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._c.compress(data)
+        if flush:
+            out += self._c.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        return self._c.flush(zlib.Z_FINISH)
+
+class _BrotliEncoder:
+    def __init__(self, level: int) -> None:
+        self._c = brotli.Compressor(quality=max(0, min(level, 11)))
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._c.process(data)
+        if flush:
+            out += self._c.flush()
+        return out
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+class _ZstdEncoder:
+    def __init__(self, level: int) -> None:
+        self._c = zstandard.ZstdCompressor(level=max(1, min(level, 19))).compressobj()
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._c.compress(data)
+        if flush:
+            out += self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return out
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+def available_encoders() -> Dict[str, type]:
+    """Encodages supportés, par ordre de préférence du serveur à qualité égale."""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = _ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = _BrotliEncoder
+    encoders["gzip"] = _GzipEncoder
+    return encoders
+
+ENCODERS = available_encoders()
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Choisit l'encodage de plus haute qualité accepté par le client (q > 0)."""
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[name] = q
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = qualities.get(name, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+def parse_route_levels(value: str) -> Dict[str, int]:
+    """« /admin=6,/users/profile=1 » -> {"/admin": 6, "/users/profile": 1}"""
+    levels = {}
+    for item in value.split(","):
+        prefix, _, level = item.strip().partition("=")
+        if prefix and level:
+            levels[prefix.strip()] = int(level)
+    return levels
+
+class CompressionMiddleware:
+    """
+    Compression des réponses (zstd, br ou gzip selon Accept-Encoding).
+    - réponses d'un seul bloc : compressées seulement au-delà de `minimum_size` ;
+    - réponses en streaming : chaque bloc est compressé puis vidé (flush) sans bufferiser le corps ;
+    - niveau par préfixe de route via `route_levels` (0 désactive la compression pour la route).
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        level: int = 5,
+        route_levels: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        # Préfixe le plus long en premier
+        self.route_levels = sorted((route_levels or {}).items(), key=lambda kv: len(kv[0]), reverse=True)
+
+    def level_for(self, path: str) -> int:
+        for prefix, level in self.route_levels:
+            if path.startswith(prefix):
+                return level
+        return self.level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        level = self.level_for(scope["path"])
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", "")) if level > 0 else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encoding, level, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, level: int, minimum_size: int) -> None:
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    @staticmethod
+    def _is_compressible(start: Message) -> bool:
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        headers = Headers(raw=start["headers"])
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in COMPRESSIBLE_EXCEPTIONS:
+            return True
+        if content_type in EXCLUDED_CONTENT_TYPES:
+            return False
+        return not content_type.startswith(EXCLUDED_CONTENT_TYPE_PREFIXES)
+
+    def _encoded_start(self, content_length: Optional[int]) -> Message:
+        headers = MutableHeaders(raw=list(self.start_message["headers"]))
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        # La représentation change : un ETag fort devient faible
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        return {**self.start_message, "headers": headers.raw}
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not self._is_compressible(self.start_message) or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+            self.encoder = ENCODERS[self.encoding](self.level)
+            if not more_body:
+                # Corps complet en un bloc : Content-Length connu après compression
+                compressed = self.encoder.compress(body, flush=False) + self.encoder.finish()
+                await self._send(self._encoded_start(len(compressed)))
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(self._encoded_start(None))
+
+        if more_body:
+            chunk = self.encoder.compress(body, flush=True)
+            if chunk:
+                await self._send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            chunk = self.encoder.compress(body, flush=False) + self.encoder.finish()
+            await self._send({"type": "http.response.body", "body": chunk})
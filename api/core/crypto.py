@@ -1,15 +1,204 @@
+"""
+Chiffrement des données sensibles par enveloppe.
+
+Chaque utilisateur a sa propre clé de données (Fernet). Elle n'est jamais stockée en clair :
+`users.encryption_key` contient `<kid>$<clé chiffrée par la clé maître kid>`. Les clés maîtres
+viennent de l'environnement ; la rotation ne fait que ré-envelopper les clés de données, les
+données chiffrées ne sont jamais réécrites.
+
+    MASTER_ENCRYPTION_KEYS="2024a:<clé fernet>,2025a:<clé fernet>"
+    MASTER_ENCRYPTION_KEY_ID=2025a          # clé d'enveloppement des nouvelles clés (défaut : la dernière)
+
+    python -m api.core.crypto generate-master   # nouvelle clé maître à ajouter à MASTER_ENCRYPTION_KEYS
+    python -m api.core.crypto rewrap            # ré-enveloppe les clés avec MASTER_ENCRYPTION_KEY_ID
+
+Les chiffrements déballés sont gardés dans un cache mémoire borné (KEY_CACHE_SIZE entrées,
+KEY_CACHE_TTL secondes) : le déballage est payé une fois par utilisateur et par fenêtre, pas à
+chaque requête. Une clé sans préfixe `kid$` est une ancienne clé en clair, toujours acceptée
+jusqu'au passage de `rewrap`.
+
+`rewrap` tourne dans un autre process : il termine en ajoutant une ligne à `key_rotations`.
+Chaque worker de l'API relève cette table toutes les KEY_ROTATION_CHECK_INTERVAL secondes et vide
+son cache dès qu'une nouvelle rotation apparaît ; les clés déballées sous l'ancienne enveloppe ne
+survivent donc pas plus longtemps que cet intervalle.
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
 from cryptography.fernet import Fernet, InvalidToken
-from typing import Optional
 from api.logger import logger
 
+MASTER_ENCRYPTION_KEYS = os.getenv("MASTER_ENCRYPTION_KEYS", "")
+MASTER_ENCRYPTION_KEY_ID = os.getenv("MASTER_ENCRYPTION_KEY_ID", "")
+KEY_CACHE_SIZE = int(os.getenv("KEY_CACHE_SIZE", "10000"))
+KEY_CACHE_TTL = float(os.getenv("KEY_CACHE_TTL", "300"))
+REWRAP_BATCH_SIZE = int(os.getenv("REWRAP_BATCH_SIZE", "500"))
+KEY_ROTATION_CHECK_INTERVAL = float(os.getenv("KEY_ROTATION_CHECK_INTERVAL", "30"))
+
+WRAP_SEPARATOR = "$"
+
+def parse_master_keys(value: str) -> Dict[str, Fernet]:
+    """'k1:<clé>,k2:<clé>' -> {'k1': Fernet, 'k2': Fernet} (ordre conservé)."""
+    keys = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        kid, _, key = item.partition(":")
+        kid = kid.strip()
+        if not kid or not key or WRAP_SEPARATOR in kid:
+            raise ValueError(f"Entrée invalide dans MASTER_ENCRYPTION_KEYS : '{kid}'")
+        keys[kid] = Fernet(key.strip().encode())
+    return keys
+
+class MasterKeyring:
+    def __init__(self, value: str = MASTER_ENCRYPTION_KEYS, active_kid: str = MASTER_ENCRYPTION_KEY_ID) -> None:
+        self.keys = parse_master_keys(value)
+        self.active_kid = active_kid or (list(self.keys)[-1] if self.keys else "")
+        if self.keys and self.active_kid not in self.keys:
+            raise ValueError(f"MASTER_ENCRYPTION_KEY_ID '{self.active_kid}' absent de MASTER_ENCRYPTION_KEYS")
+        if not self.keys:
+            logger.warning("MASTER_ENCRYPTION_KEYS non défini : les clés utilisateur sont stockées en clair")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    def wrap(self, data_key: str) -> str:
+        if not self.enabled:
+            return data_key
+        token = self.keys[self.active_kid].encrypt(data_key.encode()).decode()
+        return f"{self.active_kid}{WRAP_SEPARATOR}{token}"
+
+    def unwrap(self, stored: str) -> str:
+        """Clé de données en clair ; une clé sans préfixe `kid$` est renvoyée telle quelle (ancien format)."""
+        kid, sep, token = stored.partition(WRAP_SEPARATOR)
+        if not sep:
+            return stored
+        master = self.keys.get(kid)
+        if master is None:
+            raise KeyError(f"Clé maître inconnue : {kid}")
+        return master.decrypt(token.encode()).decode()
+
+    def needs_rewrap(self, stored: str) -> bool:
+        kid, sep, _ = stored.partition(WRAP_SEPARATOR)
+        return self.enabled and (not sep or kid != self.active_kid)
+
+class KeyCache:
+    """Cache LRU borné à expiration : clé stockée (enveloppée) -> Fernet déballé."""
+
+    def __init__(self, capacity: int = KEY_CACHE_SIZE, ttl: float = KEY_CACHE_TTL) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Fernet]]" = OrderedDict()
+        # Le préchauffage appelle le chiffrement depuis un thread
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, stored: str) -> Optional[Fernet]:
+        with self._lock:
+            entry = self._entries.get(stored)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[stored]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(stored)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, stored: str, fernet: Fernet) -> None:
+        if self.capacity <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[stored] = (time.monotonic() + self.ttl, fernet)
+            self._entries.move_to_end(stored)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+class RotationWatcher:
+    """Vide le cache de clés du worker quand un ré-enveloppement se termine (table key_rotations)."""
+
+    def __init__(self, cache: KeyCache, interval: float = KEY_ROTATION_CHECK_INTERVAL) -> None:
+        self.cache = cache
+        self.interval = interval
+        self.last_rotation: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    async def check(self) -> bool:
+        """Relève la dernière rotation ; renvoie True si le cache a été vidé."""
+        # Import local : api.db.services dépend de ce module
+        from api.db.services import latest_key_rotation
+        from api.db.session import SessionLocal
+
+        async with SessionLocal() as session:
+            latest = await latest_key_rotation(session)
+        previous, self.last_rotation = self.last_rotation, latest
+        if previous is None or latest == previous:
+            return False
+        self.cache.clear()
+        logger.info(f"Rotation des clés maîtres n°{latest} détectée : cache des clés utilisateur vidé")
+        return True
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Échec de la lecture de key_rotations : {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="key-rotation-watcher")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+master_keys = MasterKeyring()
+key_cache = KeyCache()
+rotation_watcher = RotationWatcher(key_cache)
+
 def generate_user_key() -> str:
-    """Génère une clé de chiffrement unique pour un utilisateur."""
-    key = Fernet.generate_key().decode()
+    """Génère une clé de chiffrement unique pour un utilisateur, enveloppée par la clé maître active."""
+    key = master_keys.wrap(Fernet.generate_key().decode())
     logger.debug("Nouvelle clé de chiffrement générée pour un utilisateur")
     return key
 
 def get_fernet(key: str) -> Fernet:
-    return Fernet(key.encode())
+    fernet = key_cache.get(key)
+    if fernet is None:
+        fernet = Fernet(master_keys.unwrap(key).encode())
+        key_cache.put(key, fernet)
+    return fernet
 
 def encrypt_sensitive_data(data: str, key: Optional[str]) -> str:
     """
@@ -44,3 +233,45 @@ def decrypt_sensitive_data(encrypted_data: str, key: Optional[str]) -> str:
     except InvalidToken:
         logger.warning("Échec du déchiffrement : clé invalide ou donnée non chiffrée")
         return ""
+
+async def rewrap_all(batch_size: int = REWRAP_BATCH_SIZE) -> int:
+    """Ré-enveloppe toutes les clés utilisateur avec la clé maître active, par lots ; renvoie le nombre de clés modifiées."""
+    # Import local : api.db.services dépend de ce module
+    from api.db.services import record_key_rotation, rewrap_user_keys
+    from api.db.session import SessionLocal, async_engine
+
+    if not master_keys.enabled:
+        raise RuntimeError("MASTER_ENCRYPTION_KEYS non défini : rien à envelopper")
+    total = 0
+    after_id = 0
+    try:
+        while True:
+            async with SessionLocal() as session:
+                rewrapped, after_id = await rewrap_user_keys(session, after_id, batch_size)
+                await session.commit()
+            total += rewrapped
+            if after_id is None:
+                break
+            logger.info(f"Ré-enveloppement : {total} clés mises à jour (id <= {after_id})")
+        # Signal aux workers de l'API (RotationWatcher) : leurs caches de clés sont vidés
+        async with SessionLocal() as session:
+            await record_key_rotation(session, master_keys.active_kid, total)
+            await session.commit()
+    finally:
+        await async_engine.dispose()
+    logger.info(f"Ré-enveloppement terminé : {total} clés sous la clé maître '{master_keys.active_kid}'")
+    return total
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gestion des clés maîtres de chiffrement")
+    parser.add_argument("command", choices=["generate-master", "rewrap"])
+    parser.add_argument("--kid", default=time.strftime("%Y%m%d"), help="identifiant de la nouvelle clé maître")
+    parser.add_argument("--batch-size", type=int, default=REWRAP_BATCH_SIZE)
+    args = parser.parse_args()
+    if args.command == "generate-master":
+        print(f"{args.kid}:{Fernet.generate_key().decode()}")
+    else:
+        print(asyncio.run(rewrap_all(args.batch_size)))
+
+if __name__ == "__main__":
+    main()
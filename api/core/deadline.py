@@ -0,0 +1,153 @@
+"""
+Budget de temps par requête et annulation quand le client est parti.
+
+Chaque requête HTTP reçoit une échéance (DEADLINE_DEFAULT secondes, ou le budget du plus long
+préfixe correspondant dans DEADLINE_ROUTES). Le middleware annule le traitement :
+- à l'échéance : réponse 504 si rien n'a encore été envoyé ;
+- dès que le client se déconnecte : plus personne n'attend la réponse.
+Le reste du budget est transmis à Postgres (`SET LOCAL statement_timeout`, voir api.db.session) :
+une requête SQL lente rend sa connexion au pool au lieu de la garder jusqu'au bout, ce qui évite
+l'épuisement du pool en cascade quand la base ralentit. L'échéance est portée par une contextvar :
+toute session ouverte pendant la requête en hérite (session de la requête, lectures mutualisées,
+idempotence), pas les tâches de fond démarrées avec l'application.
+
+    DEADLINE_ROUTES="/users/login=5,/auth/refresh=3,/admin=15"
+"""
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.logger import logger
+
+DEADLINE_DEFAULT = float(os.getenv("DEADLINE_DEFAULT", "10"))
+DEADLINE_ROUTES = os.getenv("DEADLINE_ROUTES", "/users/login=5,/users/register=5,/auth/refresh=3,/admin=15")
+# Plancher du statement_timeout transmis (ms) : une requête SQL a toujours une chance de s'exécuter
+DEADLINE_MIN_STATEMENT_MS = int(os.getenv("DEADLINE_MIN_STATEMENT_MS", "50"))
+
+def parse_route_budgets(value: str) -> Dict[str, float]:
+    """« /users/login=5,/admin=15 » -> {"/users/login": 5.0, "/admin": 15.0} (0 = pas d'échéance)"""
+    budgets = {}
+    for item in value.split(","):
+        prefix, _, budget = item.strip().partition("=")
+        if prefix and budget:
+            budgets[prefix.strip()] = float(budget)
+    return budgets
+
+class DeadlineExceeded(TimeoutError):
+    """Budget de la requête épuisé (statement_timeout Postgres, pool de connexions saturé)."""
+
+class DeadlineStats:
+    def __init__(self) -> None:
+        self.timeouts = 0
+        self.statement_timeouts = 0
+        self.pool_timeouts = 0
+        self.cancelled = 0
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "timeouts": self.timeouts,
+            "statement_timeouts": self.statement_timeouts,
+            "pool_timeouts": self.pool_timeouts,
+            "cancelled_on_disconnect": self.cancelled,
+        }
+
+deadline_stats = DeadlineStats()
+
+# Échéance (time.monotonic) de la requête en cours, visible de toutes les tâches qu'elle crée
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+def remaining(scope: Scope) -> Optional[float]:
+    """Secondes restantes avant l'échéance de la requête (None hors requête HTTP)."""
+    deadline = scope.get("deadline")
+    return None if deadline is None else deadline - time.monotonic()
+
+def _timeout_ms(deadline: Optional[float]) -> Optional[int]:
+    if deadline is None:
+        return None
+    return max(int((deadline - time.monotonic()) * 1000), DEADLINE_MIN_STATEMENT_MS)
+
+def statement_timeout_ms(scope: Optional[Scope] = None) -> Optional[int]:
+    """Budget restant en ms, pour `scope` ou, à défaut, pour la requête du contexte courant."""
+    return _timeout_ms(current_deadline.get() if scope is None else scope.get("deadline"))
+
+class DeadlineMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        default: float = DEADLINE_DEFAULT,
+        route_budgets: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.app = app
+        self.default = default
+        budgets = parse_route_budgets(DEADLINE_ROUTES) if route_budgets is None else route_budgets
+        self.route_budgets = sorted(budgets.items(), key=lambda kv: len(kv[0]), reverse=True)
+
+    def _budget(self, path: str) -> float:
+        for prefix, budget in self.route_budgets:
+            if path.startswith(prefix):
+                return budget
+        return self.default
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = self._budget(scope["path"])
+        if budget <= 0:
+            await self.app(scope, receive, send)
+            return
+        scope["deadline"] = time.monotonic() + budget
+        # Avant create_task : la tâche de la route copie le contexte, donc l'échéance
+        deadline_token = current_deadline.set(scope["deadline"])
+
+        # Les messages du client passent par une file : on voit la déconnexion même si la route ne lit pas le corps
+        inbox: asyncio.Queue = asyncio.Queue()
+        response_started = False
+        response_complete = False
+
+        async def pump() -> None:
+            while True:
+                message = await receive()
+                inbox.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        app_task = asyncio.create_task(self.app(scope, inbox.get, tracked_send))
+        pump_task = asyncio.create_task(pump())
+        try:
+            done, _ = await asyncio.wait({app_task, pump_task}, timeout=budget, return_when=asyncio.FIRST_COMPLETED)
+            if app_task not in done and pump_task in done and response_complete:
+                # Déconnexion normale après une réponse complète : la route se termine d'elle-même
+                done, _ = await asyncio.wait({app_task}, timeout=max(remaining(scope), 0))
+            if app_task in done:
+                app_task.result()
+                return
+            app_task.cancel()
+            await asyncio.gather(app_task, return_exceptions=True)
+            path = f"{scope['method']} {scope['path']}"
+            if pump_task.done() and not response_complete:
+                deadline_stats.cancelled += 1
+                logger.info(f"Client déconnecté : traitement de {path} annulé")
+                return
+            deadline_stats.timeouts += 1
+            logger.warning(f"Échéance de {budget}s dépassée pour {path} : traitement annulé")
+            if not response_started:
+                await JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)(scope, receive, send)
+        finally:
+            current_deadline.reset(deadline_token)
+            pump_task.cancel()
+            if not app_task.done():
+                app_task.cancel()
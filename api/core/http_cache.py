@@ -0,0 +1,58 @@
+import datetime
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+def make_etag(*parts) -> str:
+    """ETag faible calculé à partir d'éléments de version (id, updated_at, agrégats...)."""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def _as_utc(dt: datetime.datetime) -> datetime.datetime:
+    # Les colonnes DateTime de la base sont naïves et en UTC (datetime.utcnow)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+def http_date(dt: datetime.datetime) -> str:
+    return format_datetime(_as_utc(dt), usegmt=True)
+
+def cache_headers(etag: str, last_modified: Optional[datetime.datetime] = None) -> Dict[str, str]:
+    # no-cache : le client peut garder la réponse mais doit la revalider à chaque fois
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime.datetime] = None
+) -> bool:
+    """
+    Évalue If-None-Match (prioritaire, comparaison faible) puis If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        wanted = _strip_weak(etag)
+        return any(_strip_weak(tag) == wanted for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
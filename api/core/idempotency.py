@@ -0,0 +1,368 @@
+"""
+En-tête Idempotency-Key sur les POST qui ne se rejouent pas sans risque (inscription, connexion,
+rotation des tokens).
+
+Le premier appel avec une clé donnée s'exécute normalement ; sa réponse est gardée
+IDEMPOTENCY_TTL secondes, en mémoire (IDEMPOTENCY_CACHE_SIZE entrées, par worker) et dans la
+table idempotency_keys (partagée entre workers et redémarrages). Un nouvel essai avec la même clé
+et le même corps reçoit la réponse d'origine (en-tête `Idempotent-Replayed: true`) sans refaire
+le hachage, l'émission de tokens ni les écritures ; avec un autre corps : 422. Un doublon
+concurrent attend la fin du premier (IDEMPOTENCY_WAIT_TIMEOUT secondes, bornées par le budget restant
+de la requête, puis 409).
+Les erreurs 5xx, 429 et 503 ne sont pas enregistrées : un nouvel essai relance la requête.
+
+La clé et l'empreinte du corps sont des HMAC-SHA256 : la table ne permet pas de tester des mots de
+passe hors ligne. Le secret vient de IDEMPOTENCY_SECRET ou, à défaut, d'un fichier aléatoire créé au
+premier démarrage à côté des clés JWT (IDEMPOTENCY_SECRET_FILE) ; si ce fichier ne peut être écrit,
+chaque process tire son propre secret et les clés ne sont gardées qu'en mémoire. Les réponses des routes qui
+émettent des tokens (IDEMPOTENCY_SEALED_PATHS) sont chiffrées par la clé maître active avant
+d'être écrites en base ; sans clé maître, elles ne sont gardées qu'en mémoire et la réservation
+en base est libérée.
+"""
+import asyncio
+import fcntl
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.core.crypto import master_keys
+from api.core.deadline import remaining
+from api.core.keys import JWT_KEYS_DIR
+from api.db.services import claim_idempotency_key, complete_idempotency_key, release_idempotency_key
+from api.db.session import SessionLocal
+from api.logger import logger
+
+IDEMPOTENT_PATHS = frozenset(
+    p.strip() for p in os.getenv("IDEMPOTENT_PATHS", "/users/register,/users/login,/auth/refresh").split(",")
+    if p.strip()
+)
+# Réponses des routes qui émettent des tokens : jamais écrites en clair dans idempotency_keys
+IDEMPOTENCY_SEALED_PATHS = frozenset(
+    p.strip() for p in os.getenv("IDEMPOTENCY_SEALED_PATHS", "/users/login,/auth/refresh").split(",")
+    if p.strip()
+)
+# Le temps d'une série de nouveaux essais côté client, pas davantage : la réponse contient des tokens
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+IDEMPOTENCY_SECRET = os.getenv("IDEMPOTENCY_SECRET", "")
+IDEMPOTENCY_SECRET_FILE = os.getenv(
+    "IDEMPOTENCY_SECRET_FILE", os.path.join(os.path.dirname(os.path.normpath(JWT_KEYS_DIR)), "idempotency.secret")
+)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+# Temps laissé au 409 quand l'attente d'un doublon est bornée par l'échéance de la requête
+IDEMPOTENCY_DEADLINE_MARGIN = float(os.getenv("IDEMPOTENCY_DEADLINE_MARGIN", "0.5"))
+# Durée de la réservation d'une clé en cours : au-delà, un worker tombé ne bloque plus la clé
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "30"))
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv("IDEMPOTENCY_POLL_INTERVAL", "0.05"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+NOT_STORED_STATUS = {429, 503}
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status: int
+    headers: List[List[str]]
+    body: bytes
+
+_secret: Optional[Tuple[bytes, bool]] = None
+
+def _read_or_create_secret(path: str) -> bytes:
+    """Secret partagé par les workers : le premier process le crée sous verrou flock, les autres le lisent."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    f.write(secrets.token_hex(32))
+                os.replace(tmp_path, path)
+                logger.info(f"Secret d'idempotence créé dans {path}")
+            with open(path) as f:
+                value = f.read().strip()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    if not value:
+        raise ValueError(f"{path} est vide")
+    return value.encode()
+
+def idempotency_secret() -> Tuple[bytes, bool]:
+    """(secret HMAC, partagé entre process) ; un secret propre au process n'est jamais écrit en base."""
+    global _secret
+    if _secret is None:
+        if IDEMPOTENCY_SECRET:
+            _secret = (IDEMPOTENCY_SECRET.encode(), True)
+        else:
+            try:
+                _secret = (_read_or_create_secret(IDEMPOTENCY_SECRET_FILE), True)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Secret d'idempotence non persistant ({e}) : clés gardées en mémoire seulement")
+                _secret = (secrets.token_bytes(32), False)
+    return _secret
+
+def _digest(*parts: bytes) -> str:
+    h = hmac.new(idempotency_secret()[0], digestmod=hashlib.sha256)
+    for part in parts:
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _is_stored(status: int) -> bool:
+    return status < 500 and status not in NOT_STORED_STATUS
+
+def _seal(body: bytes) -> bytes:
+    return master_keys.wrap(body.decode("latin-1")).encode()
+
+def _unseal(stored: bytes) -> bytes:
+    return master_keys.unwrap(stored.decode()).encode("latin-1")
+
+class IdempotencyStore:
+    """Réponses terminées (LRU borné à expiration) et requêtes en cours de ce worker."""
+
+    def __init__(self, capacity: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self._done: "OrderedDict[str, Tuple[float, StoredResponse]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Event] = {}
+        self.replayed = 0
+        self.stored = 0
+        self.conflicts = 0
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._done.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._done[key]
+            return None
+        self._done.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, response: StoredResponse) -> None:
+        self._done[key] = (time.monotonic() + self.ttl, response)
+        self._done.move_to_end(key)
+        while len(self._done) > self.capacity:
+            self._done.popitem(last=False)
+
+    def begin(self, key: str) -> Optional[asyncio.Event]:
+        """None si l'appelant devient propriétaire de la clé, sinon l'événement à attendre."""
+        waiter = self._pending.get(key)
+        if waiter is None:
+            self._pending[key] = asyncio.Event()
+        return waiter
+
+    def end(self, key: str) -> None:
+        waiter = self._pending.pop(key, None)
+        if waiter is not None:
+            waiter.set()
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "size": len(self._done),
+            "in_progress": len(self._pending),
+            "stored": self.stored,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+        }
+
+idempotency_store = IdempotencyStore()
+
+class IdempotencyMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: FrozenSet[str] = IDEMPOTENT_PATHS,
+        store: IdempotencyStore = idempotency_store,
+    ) -> None:
+        self.app = app
+        self.paths = paths
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        idem_key = headers.get("idempotency-key")
+        if idem_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idem_key.strip() or len(idem_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            await JSONResponse({"detail": "Invalid Idempotency-Key header"}, status_code=400)(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        # Le token porté par Authorization (refresh) fait partie de la clé : pas de rejeu entre clients
+        key = _digest(scope["path"].encode(), idem_key.encode(), headers.get("authorization", "").encode())
+        fingerprint = _digest(scope["path"].encode(), body)
+
+        async def replay_receive() -> Message:
+            nonlocal body
+            if body is None:
+                return await receive()
+            message = {"type": "http.request", "body": body, "more_body": False}
+            body = None
+            return message
+
+        await self._handle(scope, replay_receive, send, key, fingerprint)
+
+    async def _handle(self, scope: Scope, receive: Receive, send: Send, key: str, fingerprint: str) -> None:
+        loop = asyncio.get_running_loop()
+        wait = IDEMPOTENCY_WAIT_TIMEOUT
+        budget = remaining(scope)
+        if budget is not None:
+            # Répondre 409 avant l'échéance de la requête plutôt que de laisser partir un 504
+            wait = min(wait, max(budget - IDEMPOTENCY_DEADLINE_MARGIN, 0.0))
+        deadline = loop.time() + wait
+        while True:
+            stored = self.store.get(key)
+            if stored is not None:
+                await self._replay(stored, fingerprint, scope, receive, send)
+                return
+            waiter = self.store.begin(key)
+            if waiter is None:
+                break
+            try:
+                await asyncio.wait_for(waiter.wait(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                await self._in_progress(scope, receive, send)
+                return
+
+        try:
+            use_db = idempotency_secret()[1]
+            while use_db:
+                try:
+                    claimed, row = await self._claim(key, fingerprint)
+                except Exception as e:
+                    logger.warning(f"Table idempotency_keys indisponible, clé gérée en mémoire seulement : {e}")
+                    use_db = False
+                    break
+                if claimed:
+                    break
+                if row is not None and row.status_code is not None:
+                    body = row.response_body
+                    if scope["path"] in IDEMPOTENCY_SEALED_PATHS:
+                        try:
+                            body = _unseal(body)
+                        except Exception as e:
+                            logger.warning(f"Réponse idempotente illisible (clé maître retirée ?) : {e}")
+                            await self._in_progress(scope, receive, send)
+                            return
+                    stored = StoredResponse(row.fingerprint, row.status_code, row.response_headers, body)
+                    self.store.put(key, stored)
+                    await self._replay(stored, fingerprint, scope, receive, send)
+                    return
+                if loop.time() >= deadline:
+                    await self._in_progress(scope, receive, send)
+                    return
+                await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+            response = await self._run(scope, receive, send, key, fingerprint, use_db)
+            if response is not None:
+                self.store.put(key, response)
+                self.store.stored += 1
+        finally:
+            self.store.end(key)
+
+    async def _claim(self, key: str, fingerprint: str):
+        async with SessionLocal() as session:
+            result = await claim_idempotency_key(session, key, fingerprint, IDEMPOTENCY_LOCK_TIMEOUT)
+            await session.commit()
+        return result
+
+    async def _run(
+        self, scope: Scope, receive: Receive, send: Send, key: str, fingerprint: str, use_db: bool
+    ) -> Optional[StoredResponse]:
+        """Exécute la requête en transmettant la réponse au client, et l'enregistre si elle peut être rejouée."""
+        captured = StoredResponse(fingerprint, 500, [], b"")
+        chunks: List[bytes] = []
+
+        async def capture_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                captured.status = message["status"]
+                captured.headers = [[k.decode("latin-1"), v.decode("latin-1")] for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture_send)
+        except BaseException:
+            if use_db:
+                await self._release(key)
+            raise
+        captured.body = b"".join(chunks)
+        if not _is_stored(captured.status):
+            if use_db:
+                await self._release(key)
+            return None
+        body = captured.body
+        if use_db and scope["path"] in IDEMPOTENCY_SEALED_PATHS:
+            if not master_keys.enabled:
+                # Pas de tokens en clair en base : réponse gardée par ce worker seulement
+                await self._release(key)
+                return captured
+            body = _seal(body)
+        if use_db:
+            try:
+                async with SessionLocal() as session:
+                    await complete_idempotency_key(
+                        session, key, captured.status, captured.headers, body, IDEMPOTENCY_TTL
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"Réponse idempotente non enregistrée en base : {e}")
+        return captured
+
+    async def _release(self, key: str) -> None:
+        try:
+            async with SessionLocal() as session:
+                await release_idempotency_key(session, key)
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Libération de la clé d'idempotence impossible (expirera seule) : {e}")
+
+    async def _replay(self, stored: StoredResponse, fingerprint: str, scope: Scope, receive: Receive, send: Send) -> None:
+        if stored.fingerprint != fingerprint:
+            self.store.conflicts += 1
+            logger.warning(f"Idempotency-Key réutilisée avec une autre requête sur {scope['path']}")
+            await JSONResponse(
+                {"detail": "Idempotency-Key already used with a different request"}, status_code=422
+            )(scope, receive, send)
+            return
+        self.store.replayed += 1
+        logger.info(f"Réponse rejouée pour {scope['path']} (Idempotency-Key, statut {stored.status})")
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored.headers]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": stored.status, "headers": headers})
+        await send({"type": "http.response.body", "body": stored.body})
+
+    async def _in_progress(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await JSONResponse(
+            {"detail": "A request with this Idempotency-Key is still in progress"},
+            status_code=409,
+            headers={"Retry-After": "1"},
+        )(scope, receive, send)
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
@@ -0,0 +1,173 @@
+"""
+Exécution différée de tâches dans le process de l'API.
+
+Chaque file nommée est bornée et servie par un nombre fixe de workers asyncio. Un handler
+soumet une tâche avec `jobs.submit("file", func, *args)` et répond sans l'attendre ; une tâche
+en échec est relancée avec backoff jusqu'à JOB_MAX_ATTEMPTS essais. `ttl=<secondes>` borne la
+durée de vie d'une tâche (attente en file, essais et backoff compris) : au-delà, elle est
+abandonnée (`expired`) ; à utiliser pour toute tâche dont les arguments sont sensibles.
+À l'arrêt, les files sont vidées (dans la limite de JOB_DRAIN_TIMEOUT) avant la fermeture du
+pool de connexions.
+
+    JOB_QUEUES="default=1000:2,passwords=200:1"   # nom=taille:workers
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from api.core.retry import backoff_delay
+from api.logger import logger
+
+JOB_QUEUES = os.getenv("JOB_QUEUES", "default=1000:2,passwords=200:1")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "0.5"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "10"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "15"))
+
+JobFunc = Callable[..., Awaitable[Any]]
+
+def parse_queue_specs(value: str) -> Dict[str, tuple]:
+    """'default=1000:2,passwords=200:1' -> {'default': (1000, 2), 'passwords': (200, 1)}"""
+    specs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, spec = item.partition("=")
+        size, _, workers = spec.partition(":")
+        specs[name.strip()] = (int(size or 1000), int(workers or 1))
+    return specs
+
+class JobQueue:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        workers: int,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        backoff_base: float = JOB_BACKOFF_BASE,
+        backoff_max: float = JOB_BACKOFF_MAX,
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._workers: List[asyncio.Task] = []
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.total_runtime = 0.0
+
+    def submit(self, func: JobFunc, *args, ttl: Optional[float] = None, **kwargs) -> bool:
+        """Ajoute une tâche sans attendre ; renvoie False (tâche refusée) si la file est pleine."""
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        try:
+            self._queue.put_nowait((func, args, kwargs, expires_at))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"File de tâches '{self.name}' pleine ({self.maxsize}) : {func.__name__} refusée")
+            return False
+        self.submitted += 1
+        return True
+
+    async def _execute(self, func: JobFunc, args: tuple, kwargs: dict, expires_at: Optional[float]) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self.expired += 1
+                logger.warning(f"Tâche {func.__name__} ('{self.name}') expirée avant l'essai {attempt} : abandonnée")
+                return
+            start = time.perf_counter()
+            try:
+                await func(*args, **kwargs)
+                self.total_runtime += time.perf_counter() - start
+                self.completed += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.total_runtime += time.perf_counter() - start
+                if attempt == self.max_attempts:
+                    self.failed += 1
+                    logger.error(f"Tâche {func.__name__} ('{self.name}') abandonnée après {attempt} essais : {e}")
+                    return
+                self.retried += 1
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                logger.warning(f"Tâche {func.__name__} ('{self.name}') en échec (essai {attempt}) : {e} ; nouvel essai dans {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _worker(self) -> None:
+        while True:
+            func, args, kwargs, expires_at = await self._queue.get()
+            self.running += 1
+            try:
+                await self._execute(func, args, kwargs, expires_at)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"jobs-{self.name}-{i}")
+                for i in range(self.worker_count)
+            ]
+
+    async def drain(self, timeout: float) -> bool:
+        """Attend que la file soit vide puis arrête les workers ; renvoie False si le délai est dépassé."""
+        drained = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            drained = False
+            logger.warning(f"File '{self.name}' : {self._queue.qsize()} tâche(s) non exécutée(s) à l'arrêt")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        return drained
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "size": self._queue.qsize(),
+            "maxsize": self.maxsize,
+            "workers": self.worker_count,
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "total_runtime_seconds": round(self.total_runtime, 3),
+        }
+
+class JobRunner:
+    def __init__(self, specs: Dict[str, tuple]) -> None:
+        self.queues: Dict[str, JobQueue] = {
+            name: JobQueue(name, size, workers) for name, (size, workers) in specs.items()
+        }
+
+    def submit(self, queue: str, func: JobFunc, *args, ttl: Optional[float] = None, **kwargs) -> bool:
+        target: Optional[JobQueue] = self.queues.get(queue) or self.queues.get("default")
+        if target is None:
+            raise KeyError(f"File de tâches inconnue : {queue}")
+        return target.submit(func, *args, ttl=ttl, **kwargs)
+
+    def start(self) -> None:
+        for queue in self.queues.values():
+            queue.start()
+        logger.info(f"Files de tâches démarrées : {', '.join(f'{q.name}({q.worker_count})' for q in self.queues.values())}")
+
+    async def drain(self, timeout: float = JOB_DRAIN_TIMEOUT) -> bool:
+        results = await asyncio.gather(*(q.drain(timeout) for q in self.queues.values()))
+        return all(results)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: queue.metrics() for name, queue in self.queues.items()}
+
+jobs = JobRunner(parse_queue_specs(JOB_QUEUES))
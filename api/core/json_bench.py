@@ -0,0 +1,62 @@
+"""
+Mesure du coût de construction de la liste des utilisateurs de l'admin, sans base de données.
+
+    python -m api.core.json_bench --rows 50000 --repeat 3
+
+Compare, sur des lignes synthétiques, les deux chemins de GET /admin/users :
+- orm : entités User -> UserOut.model_validate -> response_model (validation FastAPI) -> JSONResponse ;
+- trusted : tuples projetés -> rows_to_dicts -> trusted_json (orjson si installé).
+Chaque chemin passe par une vraie application FastAPI (TestClient) : sérialisation et réponse HTTP
+comprises, lecture SQL exclue. Le temps affiché est le meilleur de `--repeat` essais.
+"""
+import argparse
+import time
+from typing import Callable, List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.core.responses import orjson, rows_to_dicts, trusted_json
+from api.db.models import User
+from api.db.schemas import UserOut
+from api.db.services import USER_OUT_FIELDS
+
+def _rows(count: int) -> List[tuple]:
+    return [(i, f"user{i}", f"user{i}@example.com", f"bio {i}", "user") for i in range(1, count + 1)]
+
+def build_app(rows: List[tuple]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/orm", response_model=List[UserOut])
+    def orm_path():
+        users = [User(**dict(zip(USER_OUT_FIELDS, row))) for row in rows]
+        return [UserOut.model_validate(u) for u in users]
+
+    @app.get("/trusted", response_model=List[UserOut])
+    def trusted_path():
+        return trusted_json(rows_to_dicts(rows, USER_OUT_FIELDS))
+
+    return app
+
+def _best(call: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Coût de la liste des utilisateurs (chemin ORM vs JSON pré-encodé)")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    client = TestClient(build_app(_rows(args.rows)))
+    assert client.get("/orm").json() == client.get("/trusted").json()
+    for path in ("/orm", "/trusted"):
+        seconds = _best(lambda: client.get(path), args.repeat)
+        print(f"{path:<10} {args.rows} lignes : {seconds * 1000:>9.1f} ms")
+    print(f"encodeur : {'orjson' if orjson is not None else 'json (stdlib)'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Clés de signature des JWT.
+
+Chaque clé privée est un fichier `<kid>.pem` du dossier JWT_KEYS_DIR ; le kid commence par sa date
+d'activation (UTC). La clé de signature est la plus récente déjà active ; les clés plus anciennes
+restent acceptées en vérification pendant JWT_KEY_RETENTION_DAYS après leur remplacement, et les
+clés programmées sont publiées dans le JWKS avant de signer quoi que ce soit.
+
+    python -m api.core.keys rotate   # nouvelle clé, active dans JWT_KEY_PUBLISH_AHEAD_MINUTES
+    python -m api.core.keys prune    # supprime les clés retirées depuis plus que la rétention
+    python -m api.core.keys list
+"""
+import argparse
+import datetime
+import fcntl
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from jose import jwk
+
+from api.logger import logger
+
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "ES256")
+SECRET_KEY = os.getenv("SECRET_KEY", "mon_secret_default")
+JWT_KEYS_DIR = os.getenv(
+    "JWT_KEYS_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "keys", "jwt"))
+)
+JWT_KEY_PUBLISH_AHEAD_MINUTES = int(os.getenv("JWT_KEY_PUBLISH_AHEAD_MINUTES", "60"))
+# Doit couvrir la durée de vie des refresh tokens signés avec l'ancienne clé
+JWT_KEY_RETENTION_DAYS = int(os.getenv("JWT_KEY_RETENTION_DAYS", "8"))
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", "60"))
+
+KID_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+_CURVES = {"ES256": ec.SECP256R1, "ES384": ec.SECP384R1, "ES512": ec.SECP521R1}
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+@dataclass
+class SigningKey:
+    kid: str
+    algorithm: str
+    private: object
+    public: object
+    activates_at: datetime.datetime
+    retires_at: Optional[datetime.datetime] = None
+    public_jwk: Dict = field(default_factory=dict)
+
+def _activation_from_kid(kid: str) -> datetime.datetime:
+    stamp = kid.split("-", 1)[0]
+    return datetime.datetime.strptime(stamp, KID_TIME_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+def generate_key_file(
+    directory: str = JWT_KEYS_DIR,
+    algorithm: str = JWT_ALGORITHM,
+    activates_at: Optional[datetime.datetime] = None,
+) -> str:
+    """Crée une clé EC et l'écrit de façon atomique (fichier temporaire + lien). Renvoie le kid."""
+    if algorithm not in _CURVES:
+        raise ValueError(f"Algorithme asymétrique non supporté : {algorithm}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    activates_at = activates_at or _utcnow()
+    kid = f"{activates_at.strftime(KID_TIME_FORMAT)}-{secrets.token_hex(4)}"
+    pem = ec.generate_private_key(_CURVES[algorithm]()).private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    tmp_path = os.path.join(directory, f".{kid}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    os.link(tmp_path, os.path.join(directory, f"{kid}.pem"))
+    os.unlink(tmp_path)
+    logger.info(f"Nouvelle clé JWT {kid} (active le {activates_at.isoformat()})")
+    return kid
+
+class KeyRing:
+    def __init__(self, directory: str = JWT_KEYS_DIR, algorithm: str = JWT_ALGORITHM) -> None:
+        self.directory = directory
+        self.algorithm = algorithm
+        self.symmetric = algorithm.startswith("HS")
+        self._keys: List[SigningKey] = []
+        self._names: frozenset = frozenset()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._jwks: Dict = {"keys": []}
+
+    # --- chargement ---
+
+    def _bootstrap(self) -> None:
+        """
+        Premier démarrage sans clé : un seul process génère la clé initiale. Verrou flock sur
+        `.bootstrap.lock`, libéré par le système si le process meurt : un démarrage interrompu
+        ne bloque pas les suivants.
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        lock_path = os.path.join(self.directory, ".bootstrap.lock")
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Un autre process a pu générer la clé pendant qu'on attendait le verrou
+                if not self._list_key_files():
+                    generate_key_file(self.directory, self.algorithm)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _list_key_files(self) -> List[str]:
+        try:
+            return sorted(n for n in os.listdir(self.directory) if n.endswith(".pem"))
+        except FileNotFoundError:
+            return []
+
+    def load(self) -> None:
+        if self.symmetric:
+            key = jwk.construct(SECRET_KEY, self.algorithm)
+            epoch = datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
+            self._keys = [SigningKey("hs", self.algorithm, key, key, epoch)]
+            self._loaded_at = time.monotonic()
+            return
+        names = self._list_key_files()
+        if not names:
+            self._bootstrap()
+            names = self._list_key_files()
+        if not names:
+            raise RuntimeError(f"Aucune clé JWT disponible dans {self.directory}")
+        if frozenset(names) == self._names:
+            # Mêmes fichiers : seule la publication (rétention écoulée) peut avoir changé
+            self._refresh_jwks()
+            self._loaded_at = time.monotonic()
+            return
+        keys = []
+        for name in names:
+            kid = name[:-4]
+            with open(os.path.join(self.directory, name), "rb") as f:
+                pem = f.read()
+            private = jwk.construct(pem, self.algorithm)
+            public = private.public_key()
+            public_jwk = {**public.to_dict(), "kid": kid, "use": "sig", "alg": self.algorithm}
+            keys.append(SigningKey(kid, self.algorithm, private, public, _activation_from_kid(kid), public_jwk=public_jwk))
+        keys.sort(key=lambda k: k.activates_at)
+        # Une clé est retirée dès que la suivante devient active
+        for current, nxt in zip(keys, keys[1:]):
+            current.retires_at = nxt.activates_at
+        self._keys = keys
+        self._names = frozenset(names)
+        self._loaded_at = time.monotonic()
+        self._refresh_jwks()
+        logger.info(f"Clés JWT chargées : {[k.kid for k in keys]}")
+
+    def _refresh_jwks(self) -> None:
+        self._jwks = {"keys": [k.public_jwk for k in self._keys if self._is_published(k)]}
+
+    def maybe_reload(self) -> None:
+        if time.monotonic() - self._loaded_at < JWT_KEYS_RELOAD_SECONDS and self._keys:
+            return
+        with self._lock:
+            if time.monotonic() - self._loaded_at >= JWT_KEYS_RELOAD_SECONDS or not self._keys:
+                self.load()
+
+    # --- accès ---
+
+    @staticmethod
+    def _is_published(key: SigningKey, now: Optional[datetime.datetime] = None) -> bool:
+        now = now or _utcnow()
+        return key.retires_at is None or now < key.retires_at + datetime.timedelta(days=JWT_KEY_RETENTION_DAYS)
+
+    def signing_key(self) -> SigningKey:
+        self.maybe_reload()
+        now = _utcnow()
+        active = [k for k in self._keys if k.activates_at <= now]
+        # Horloge en retard par rapport à la clé initiale : on prend la plus ancienne
+        return active[-1] if active else self._keys[0]
+
+    def verification_key(self, kid: Optional[str]) -> Optional[SigningKey]:
+        self.maybe_reload()
+        if self.symmetric:
+            return self._keys[0]
+        for key in self._keys:
+            if key.kid == kid:
+                return key if self._is_published(key) else None
+        return None
+
+    def jwks(self) -> Dict:
+        self.maybe_reload()
+        return self._jwks
+
+keyring = KeyRing()
+
+def rotate() -> str:
+    activates_at = _utcnow() + datetime.timedelta(minutes=JWT_KEY_PUBLISH_AHEAD_MINUTES)
+    return generate_key_file(activates_at=activates_at)
+
+def prune() -> List[str]:
+    ring = KeyRing()
+    ring.load()
+    removed = []
+    for key in ring._keys:
+        if not ring._is_published(key):
+            os.unlink(os.path.join(ring.directory, f"{key.kid}.pem"))
+            removed.append(key.kid)
+            logger.info(f"Clé JWT {key.kid} supprimée (retirée le {key.retires_at.isoformat()})")
+    return removed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gestion des clés de signature JWT")
+    parser.add_argument("command", choices=["rotate", "prune", "list"])
+    args = parser.parse_args()
+    if args.command == "rotate":
+        print(rotate())
+    elif args.command == "prune":
+        print("\n".join(prune()) or "Aucune clé à supprimer")
+    else:
+        ring = KeyRing()
+        ring.load()
+        for key in ring._keys:
+            print(f"{key.kid}  active={key.activates_at.isoformat()}  retirée={key.retires_at.isoformat() if key.retires_at else '-'}")
+
+if __name__ == "__main__":
+    main()
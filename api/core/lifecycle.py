@@ -0,0 +1,90 @@
+import asyncio
+import signal
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.logger import logger
+
+class InFlightTracker:
+    """Compte les requêtes HTTP en cours pour pouvoir les laisser se terminer à l'arrêt."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self) -> None:
+        self.count += 1
+        self._idle.clear()
+
+    def leave(self) -> None:
+        self.count -= 1
+        if self.count == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Attend la fin des requêtes en cours ; renvoie False si le délai est dépassé."""
+        if self.count == 0:
+            return True
+        logger.info(f"Attente de {self.count} requête(s) en cours (max {timeout}s)")
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.count} requête(s) toujours en cours après {timeout}s")
+            return False
+        logger.info(f"Requêtes en cours terminées en {time.monotonic() - start:.2f}s")
+        return True
+
+in_flight = InFlightTracker()
+
+def install_sigterm_drain(state, delay: float) -> None:
+    """
+    Au SIGTERM, /ready passe en 503 tout de suite (`state.ready = False`) et le gestionnaire
+    d'uvicorn n'est appelé que `delay` secondes plus tard : pendant ce délai le listener reste
+    ouvert, le load balancer voit l'instance sortir et cesse d'y envoyer du trafic.
+    Un second SIGTERM déclenche l'arrêt immédiatement. À appeler depuis la boucle, dans le
+    thread principal, après l'installation des gestionnaires d'uvicorn.
+    """
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+    pending = False
+
+    def forward(signum, frame) -> None:
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            signal.signal(signal.SIGTERM, previous)
+            signal.raise_signal(signal.SIGTERM)
+
+    def on_sigterm(signum, frame) -> None:
+        nonlocal pending
+        if pending or delay <= 0:
+            forward(signum, frame)
+            return
+        pending = True
+        state.ready = False
+        logger.info(f"SIGTERM reçu : /ready en 503, arrêt du serveur dans {delay}s")
+        loop.call_soon_threadsafe(loop.call_later, delay, forward, signum, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, on_sigterm)
+    except ValueError:
+        # Hors du thread principal (serveur de test embarqué) : arrêt direct, sans délai
+        logger.warning("Gestionnaire SIGTERM non installé (hors du thread principal)")
+
+class InFlightMiddleware:
+    def __init__(self, app: ASGIApp, tracker: InFlightTracker = in_flight) -> None:
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.tracker.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.leave()
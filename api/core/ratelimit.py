@@ -0,0 +1,179 @@
+import asyncio
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, TypeVar
+
+from fastapi import Request
+
+from api.logger import logger
+
+T = TypeVar("T")
+
+def _per_minute(value: str) -> float:
+    return float(value) / 60.0
+
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "60"))
+LOGIN_IP_PER_MINUTE = os.getenv("LOGIN_IP_PER_MINUTE", "60")
+LOGIN_USER_BURST = int(os.getenv("LOGIN_USER_BURST", "10"))
+LOGIN_USER_PER_MINUTE = os.getenv("LOGIN_USER_PER_MINUTE", "10")
+REGISTER_IP_BURST = int(os.getenv("REGISTER_IP_BURST", "30"))
+REGISTER_IP_PER_MINUTE = os.getenv("REGISTER_IP_PER_MINUTE", "30")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Proxys (adresses ou réseaux CIDR, séparés par des virgules) dont on accepte l'en-tête X-Forwarded-For,
+# typiquement le frontend Streamlit ; vide = l'adresse du pair TCP fait foi
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+
+# Travail bcrypt : nombre de calculs simultanés, file d'attente et attente maximale avant rejet
+PASSWORD_WORK_CONCURRENCY = int(os.getenv("PASSWORD_WORK_CONCURRENCY", "0")) or (os.cpu_count() or 1)
+PASSWORD_WORK_QUEUE = int(os.getenv("PASSWORD_WORK_QUEUE", "64"))
+PASSWORD_WORK_MAX_WAIT = float(os.getenv("PASSWORD_WORK_MAX_WAIT", "2"))
+
+class RateLimitExceeded(Exception):
+    """Trop de tentatives pour une clé (IP, username) : réponse 429."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class ServiceOverloaded(Exception):
+    """Capacité de calcul des mots de passe saturée : réponse 503."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("Password work capacity exhausted")
+        self.retry_after = retry_after
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+class TokenBucketLimiter:
+    """
+    Seau à jetons par clé, en mémoire. Le nombre de clés suivies est borné (LRU) :
+    les clés les moins récemment vues sont oubliées au-delà de `max_keys`.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.rate = rate_per_second
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def hit(self, key: str, now: Optional[float] = None) -> float:
+        """Consomme un jeton ; renvoie 0 si autorisé, sinon le délai avant le prochain jeton."""
+        now = time.monotonic() if now is None else now
+        tokens, last = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate if self.rate > 0 else 60.0
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+login_ip_limiter = TokenBucketLimiter(_per_minute(LOGIN_IP_PER_MINUTE), LOGIN_IP_BURST)
+login_user_limiter = TokenBucketLimiter(_per_minute(LOGIN_USER_PER_MINUTE), LOGIN_USER_BURST)
+register_ip_limiter = TokenBucketLimiter(_per_minute(REGISTER_IP_PER_MINUTE), REGISTER_IP_BURST)
+
+def parse_trusted_proxies(value: str) -> list:
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+trusted_proxies = parse_trusted_proxies(TRUSTED_PROXIES)
+
+def _is_trusted(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+def client_ip(request: Request) -> str:
+    """
+    Adresse du client. Derrière un proxy de confiance, X-Forwarded-For est lu de droite à gauche
+    et la première adresse qui n'est pas un proxy de confiance est retenue : les entrées plus à gauche
+    sont fournies par le client et ne font pas foi.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if not _is_trusted(peer):
+        return peer
+    forwarded = ",".join(request.headers.getlist("x-forwarded-for"))
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop):
+            return hop
+    return hops[0] if hops else peer
+
+def limit_login(request: Request, username: str) -> None:
+    ip = client_ip(request)
+    wait = max(login_ip_limiter.hit(ip), login_user_limiter.hit(username.lower()))
+    if wait:
+        logger.warning(f"Limite de tentatives de login atteinte (ip={ip}, username={username})")
+        raise RateLimitExceeded(wait)
+
+def limit_register(request: Request) -> None:
+    ip = client_ip(request)
+    wait = register_ip_limiter.hit(ip)
+    if wait:
+        logger.warning(f"Limite d'inscriptions atteinte (ip={ip})")
+        raise RateLimitExceeded(wait)
+
+class PasswordWorkGate:
+    """
+    Plafonne le nombre de calculs bcrypt simultanés (exécutés hors de la boucle asyncio).
+    Au-delà de `max_queue` demandes en attente, ou après `max_wait` secondes d'attente,
+    la demande est rejetée pour que le reste de l'API (/health compris) reste réactif.
+    Un thread ne s'interrompt pas : si l'appelant est annulé (échéance, client parti), la place
+    n'est rendue qu'à la fin du calcul, sans quoi le plafond serait dépassé.
+    """
+
+    def __init__(self, concurrency: int, max_queue: int, max_wait: float) -> None:
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.rejected = 0
+        self.running = 0
+        self.abandoned = 0
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ServiceOverloaded(self.max_wait)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ServiceOverloaded(self.max_wait)
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        work = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        work.add_done_callback(self._done)
+        try:
+            # shield : annuler l'appelant n'annule pas la tâche qui suit le thread
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            self.abandoned += 1
+            raise
+
+    def _done(self, work: asyncio.Future) -> None:
+        self.running -= 1
+        self._semaphore.release()
+        # Résultat ou erreur d'un calcul dont l'appelant est parti : consommé ici
+        if not work.cancelled():
+            work.exception()
+
+password_gate = PasswordWorkGate(PASSWORD_WORK_CONCURRENCY, PASSWORD_WORK_QUEUE, PASSWORD_WORK_MAX_WAIT)
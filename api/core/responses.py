@@ -0,0 +1,47 @@
+import datetime
+import json
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # repli sur json de la stdlib, plus lent mais fonctionnel
+    orjson = None
+
+def _json_default(value: Any) -> Any:
+    """Types gérés nativement par orjson, pour que le repli stdlib produise le même JSON."""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable en JSON : {type(value).__name__}")
+
+def json_dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """Réponse JSON encodée avec orjson lorsqu'il est disponible."""
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+class PreEncodedJSONResponse(Response):
+    """Corps JSON déjà encodé en bytes : ni validation par response_model ni ré-encodage."""
+    media_type = "application/json"
+
+def trusted_json(
+    payload: Any,
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None,
+) -> PreEncodedJSONResponse:
+    """
+    Encode directement des données dont la forme est déjà garantie (lignes SQL projetées).
+    Renvoyer une Response depuis l'endpoint court-circuite la validation du response_model,
+    qui reste déclaré pour la documentation OpenAPI.
+    """
+    return PreEncodedJSONResponse(content=json_dumps(payload), status_code=status_code, headers=headers)
+
+def rows_to_dicts(rows: Iterable[Sequence[Any]], keys: Sequence[str]) -> list:
+    """Transforme des tuples (ordre de `keys`) en dictionnaires prêts à encoder."""
+    return [dict(zip(keys, row)) for row in rows]
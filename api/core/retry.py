@@ -0,0 +1,42 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+def backoff_delay(attempt: int, base_delay: float = 0.25, max_delay: float = 10.0) -> float:
+    """
+    Délai avant la tentative suivante : backoff exponentiel plafonné avec « full jitter ».
+    Le tirage aléatoire évite que plusieurs réplicas relancent leurs connexions au même instant.
+    """
+    ceiling = min(max_delay, base_delay * (2 ** max(attempt - 1, 0)))
+    return random.uniform(0, ceiling)
+
+async def retry_async(
+    func: Callable[[], Awaitable[T]],
+    max_attempts: int,
+    base_delay: float = 0.25,
+    max_delay: float = 10.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    give_up_on: Tuple[Type[BaseException], ...] = (),
+    on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+) -> T:
+    """
+    Exécute `func` jusqu'à `max_attempts` fois, en attendant `backoff_delay` entre deux essais.
+    Les exceptions de `give_up_on` sont relevées immédiatement, sans nouvel essai.
+    La dernière exception est relevée si toutes les tentatives échouent.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return await func()
+        except give_up_on:
+            raise
+        except retry_on as e:
+            if attempt >= max_attempts:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if on_retry:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay)
@@ -1,12 +1,9 @@
-import os
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
-from jose import jwt, JWTError
+from jose import JWTError
+from api.core.tokens import decode_token
 from api.logger import logger
 
-SECRET_KEY = os.getenv("SECRET_KEY", "mon_secret_default")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="login",
     scopes={
@@ -16,13 +13,11 @@ oauth2_scheme = OAuth2PasswordBearer(
     }
 )
 
-def get_current_user_with_scopes(
-    security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)
-):
+def verify_token_claims(token: str, required_scopes=()) -> dict:
     """
-    Décode et valide le token JWT pour s'assurer que l'utilisateur possède
-    les scopes requis pour accéder à l'endpoint protégé.
-    Renvoie un dictionnaire contenant le nom d'utilisateur et les scopes.
+    Vérifie signature, expiration, présence du sujet et scopes requis d'un JWT.
+    Renvoie le payload complet ; lève HTTPException (401/403) sinon.
+    Chemin commun à get_current_user_with_scopes et à l'introspection par lot.
     """
     if not token:
         logger.warning("Aucun token JWT fourni")
@@ -32,26 +27,7 @@ def get_current_user_with_scopes(
             headers={"WWW-Authenticate": "Bearer"}
         )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        token_scopes = payload.get("scopes", [])
-        if username is None:
-            logger.warning("Token JWT sans username")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        # Vérification que tous les scopes requis sont présents
-        for scope in security_scopes.scopes:
-            if scope not in token_scopes:
-                logger.warning(f"Permission insuffisante : scope manquant {scope}")
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Insufficient permissions. Missing scope: {scope}",
-                    headers={"WWW-Authenticate": f'Bearer scope="{scope}"'}
-                )
-        return {"username": username, "scopes": token_scopes}
+        payload = decode_token(token)
     except JWTError:
         logger.warning("Échec de validation du token JWT")
         raise HTTPException(
@@ -59,3 +35,33 @@ def get_current_user_with_scopes(
             detail="Could not validate token",
             headers={"WWW-Authenticate": "Bearer"}
         )
+    username = payload.get("sub")
+    token_scopes = payload.get("scopes", [])
+    if username is None:
+        logger.warning("Token JWT sans username")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    # Vérification que tous les scopes requis sont présents
+    for scope in required_scopes:
+        if scope not in token_scopes:
+            logger.warning(f"Permission insuffisante : scope manquant {scope}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Insufficient permissions. Missing scope: {scope}",
+                headers={"WWW-Authenticate": f'Bearer scope="{scope}"'}
+            )
+    return payload
+
+def get_current_user_with_scopes(
+    security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)
+):
+    """
+    Décode et valide le token JWT pour s'assurer que l'utilisateur possède
+    les scopes requis pour accéder à l'endpoint protégé.
+    Renvoie un dictionnaire contenant le nom d'utilisateur et les scopes.
+    """
+    payload = verify_token_claims(token, security_scopes.scopes)
+    return {"username": payload["sub"], "scopes": payload.get("scopes", [])}
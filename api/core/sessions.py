@@ -0,0 +1,100 @@
+"""
+Purge périodique des lignes expirées : sessions (user_sessions), clés d'idempotence (idempotency_keys)
+et tombes du flux de modifications (user_tombstones).
+
+Toutes les SESSION_SWEEP_INTERVAL secondes, les lignes expirées sont supprimées par lots de
+SESSION_SWEEP_BATCH lignes, chaque lot dans sa propre transaction courte, avec une pause entre
+deux lots : pas de long verrou ni de gros DELETE qui gonflerait la table et ses index.
+"""
+import asyncio
+import os
+from typing import Optional
+
+from api.db.services import delete_expired_idempotency_keys, delete_expired_sessions, delete_expired_tombstones
+from api.db.session import SessionLocal
+from api.logger import logger
+
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+SESSION_SWEEP_BATCH = int(os.getenv("SESSION_SWEEP_BATCH", "500"))
+SESSION_SWEEP_PAUSE = float(os.getenv("SESSION_SWEEP_PAUSE", "0.05"))
+# Plafond par passage : le reste attend le passage suivant
+SESSION_SWEEP_MAX_BATCHES = int(os.getenv("SESSION_SWEEP_MAX_BATCHES", "200"))
+
+PURGES = (
+    ("session(s) expirée(s)", delete_expired_sessions),
+    ("clé(s) d'idempotence expirée(s)", delete_expired_idempotency_keys),
+    ("tombe(s) d'utilisateurs expirée(s)", delete_expired_tombstones),
+)
+
+class SessionSweeper:
+    def __init__(
+        self,
+        interval: float = SESSION_SWEEP_INTERVAL,
+        batch_size: int = SESSION_SWEEP_BATCH,
+        pause: float = SESSION_SWEEP_PAUSE,
+        max_batches: int = SESSION_SWEEP_MAX_BATCHES,
+    ) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batches = max_batches
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        self.deleted = 0
+
+    @property
+    def stopping(self) -> bool:
+        # sweep() peut être appelé sans start() (tests, tâche ponctuelle) : pas d'événement d'arrêt
+        return self._stop is not None and self._stop.is_set()
+
+    async def _purge(self, label: str, purge) -> int:
+        total = 0
+        for _ in range(self.max_batches):
+            async with SessionLocal() as session:
+                deleted = await purge(session, self.batch_size)
+                await session.commit()
+            total += deleted
+            if deleted < self.batch_size or self.stopping:
+                break
+            await asyncio.sleep(self.pause)
+        if total:
+            logger.info(f"{total} {label} supprimée(s)")
+        return total
+
+    async def sweep(self) -> int:
+        """Un passage complet ; renvoie le nombre de lignes supprimées."""
+        total = 0
+        for label, purge in PURGES:
+            total += await self._purge(label, purge)
+        self.deleted += total
+        return total
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Échec de la purge des sessions expirées : {e}")
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="session-sweeper")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+session_sweeper = SessionSweeper()
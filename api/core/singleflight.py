@@ -0,0 +1,91 @@
+"""
+Mutualisation des lectures identiques en cours (« single-flight »).
+
+Le premier appelant d'une clé lance la lecture dans une tâche à part ; les appelants suivants,
+tant qu'elle n'est pas terminée, attendent le même résultat au lieu de relancer la requête.
+Le résultat (ou l'exception) est partagé : il doit donc être immuable (lignes, tuples), jamais
+des objets ORM attachés à une session. La lecture est bornée par `timeout` secondes (fixé par
+l'appelant qui la lance), pour ne pas garder une clé bloquée si la base ne répond plus ; chaque
+appelant n'attend qu'au plus `wait` secondes (son propre budget, `timeout` par défaut).
+
+Un appelant qui rejoint une lecture en cours reçoit un résultat lu *avant* son arrivée.
+`max_age` borne cet écart : une lecture lancée depuis plus de `max_age` secondes n'est plus
+rejointe, une nouvelle part à côté.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from api.logger import logger
+
+class SingleFlight:
+    def __init__(self, name: str, timeout: float) -> None:
+        self.name = name
+        self.timeout = timeout
+        self._calls: Dict[Hashable, Tuple[float, asyncio.Future]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.calls = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.too_old = 0
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]], future: asyncio.Future, timeout: float) -> None:
+        try:
+            result = await asyncio.wait_for(fn(), timeout)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            self.errors += 1
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            # Une lecture plus récente a pu prendre la clé entre-temps (max_age)
+            if self._calls.get(key, (0, None))[1] is future:
+                del self._calls[key]
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        max_age: Optional[float] = None,
+        wait: Optional[float] = None,
+    ) -> Any:
+        """Résultat de `fn()` pour `key`, partagé avec les appels concurrents de même clé."""
+        timeout = self.timeout if timeout is None else timeout
+        wait = timeout if wait is None else wait
+        loop = asyncio.get_running_loop()
+        started, future = self._calls.get(key, (0.0, None))
+        if future is not None and max_age is not None and loop.time() - started > max_age:
+            self.too_old += 1
+            future = None
+        if future is None:
+            self.calls += 1
+            future = loop.create_future()
+            # Exception consommée même si tous les appelants sont partis entre-temps
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._calls[key] = (loop.time(), future)
+            task = asyncio.create_task(self._run(key, fn, future, timeout), name=f"singleflight-{self.name}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self.shared += 1
+        try:
+            # shield : l'annulation d'un appelant n'interrompt pas la lecture des autres
+            return await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Lecture mutualisée '{self.name}' trop longue (> {wait:.2f}s) pour {key!r}")
+            raise
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "too_old": self.too_old,
+        }
@@ -1,11 +1,11 @@
+import hashlib
 import os
 from datetime import datetime, timedelta, timezone
-from jose import jwt
+from jose import jwt, JWTError
 import uuid
+from api.core.keys import keyring
 from api.logger import logger
 
-SECRET_KEY = os.getenv("SECRET_KEY", "mon_secret_default")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
 def create_access_token(data: dict, expires_delta: timedelta):
@@ -14,6 +14,25 @@ def create_access_token(data: dict, expires_delta: timedelta):
     to_encode.update({"exp": expire})
     to_encode.update({"iat": datetime.now(timezone.utc)}) # Ajoute l'instant de création
     to_encode.update({"jti": str(uuid.uuid4())}) # Ajoute un identifiant unique
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    logger.debug(f"Access token généré pour {data.get('sub')}")
+    key = keyring.signing_key()
+    encoded_jwt = jwt.encode(to_encode, key.private, algorithm=key.algorithm, headers={"kid": key.kid})
+    logger.debug(f"Access token généré pour {data.get('sub')} (kid={key.kid})")
     return encoded_jwt
+
+def decode_token(token: str) -> dict:
+    """
+    Vérifie la signature et l'expiration d'un JWT avec la clé désignée par son en-tête `kid`.
+    Lève JWTError si le token est invalide, expiré ou signé par une clé inconnue/retirée.
+    """
+    header = jwt.get_unverified_header(token)
+    key = keyring.verification_key(header.get("kid"))
+    if key is None or header.get("alg") != key.algorithm:
+        raise JWTError("Clé de signature inconnue ou retirée")
+    return jwt.decode(token, key.public, algorithms=[key.algorithm])
+
+def hash_token(token: str) -> str:
+    """Empreinte SHA-256 d'un refresh token : seule forme conservée en base."""
+    return hashlib.sha256(token.strip().encode("utf-8")).hexdigest()
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import bcrypt
+from cryptography.fernet import Fernet
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.core.crypto import decrypt_sensitive_data, encrypt_sensitive_data, generate_user_key
+from api.core.idempotency import idempotency_secret
+from api.core.keys import keyring
+from api.core.tokens import create_access_token, decode_token
+from api.db.services import (
+    find_user_conflict, get_token_states, get_user_auth, get_user_profile, get_user_role, get_user_version
+)
+from api.db.session import DB_POOL_MIN_SIZE, async_engine
+from api.logger import logger
+
+# Valeur qui ne correspond à aucun compte : on exécute les requêtes chaudes sans toucher de données
+WARMUP_LOOKUP = "__warmup__"
+
+async def _prime_hot_queries(session: AsyncSession) -> None:
+    """
+    Exécute une fois les requêtes des endpoints les plus sollicités sur la connexion :
+    le cache de compilation SQLAlchemy et le cache de requêtes préparées asyncpg sont remplis.
+    """
+    await get_user_auth(session, WARMUP_LOOKUP)
+    await get_user_role(session, WARMUP_LOOKUP)
+    await get_token_states(session, [WARMUP_LOOKUP], [WARMUP_LOOKUP])
+    await get_user_profile(session, WARMUP_LOOKUP)
+    await get_user_version(session, WARMUP_LOOKUP)
+    await find_user_conflict(session, WARMUP_LOOKUP, WARMUP_LOOKUP)
+
+async def _warm_connection() -> None:
+    async with async_engine.connect() as conn:
+        async with AsyncSession(bind=conn) as session:
+            await _prime_hot_queries(session)
+        await conn.rollback()
+
+async def warm_db_pool(size: int = DB_POOL_MIN_SIZE) -> None:
+    """
+    Ouvre `size` connexions en parallèle (TLS, authentification, introspection des types asyncpg)
+    puis les rend au pool, qui les conserve pour les premières requêtes.
+    """
+    if size <= 0:
+        return
+    await asyncio.gather(*(_warm_connection() for _ in range(size)))
+    logger.info(f"Pool de connexions préchauffé ({size} connexions)")
+
+def _prime_crypto() -> None:
+    """Premier usage de Fernet, JWT et bcrypt (chargement des backends OpenSSL, tables internes)."""
+    keyring.load()
+    # Lecture (ou création) du secret d'idempotence hors de la boucle asyncio
+    idempotency_secret()
+    key = generate_user_key()
+    decrypt_sensitive_data(encrypt_sensitive_data("warmup", key), key)
+    Fernet(Fernet.generate_key())
+    token = create_access_token(data={"sub": WARMUP_LOOKUP}, expires_delta=timedelta(seconds=30))
+    decode_token(token)
+    bcrypt.checkpw(b"warmup", bcrypt.hashpw(b"warmup", bcrypt.gensalt(rounds=4)))
+
+async def warm_up() -> None:
+    start = time.perf_counter()
+    await asyncio.gather(warm_db_pool(), asyncio.to_thread(_prime_crypto))
+    logger.info(f"Préchauffage terminé en {(time.perf_counter() - start) * 1000:.0f} ms")
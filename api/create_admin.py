@@ -1,18 +1,37 @@
+"""
+Création interactive d'un compte administrateur.
+
+    python -m api.create_admin
+
+Le secret ADMIN_CREATION_SECRET est demandé avant toute saisie. Pour des jeux de données de
+test (utilisateurs synthétiques en masse), voir `python -m api.db.seed`.
+"""
+import asyncio
 import os
 from getpass import getpass
-from api.db.session import SessionLocal
+from api.db.session import SessionLocal, async_engine
 from api.db.services import create_user
-from api.core.crypto import generate_user_key
 from api.logger import logger
 from dotenv import load_dotenv
 
 load_dotenv()
 
 ADMIN_CREATION_SECRET = os.getenv("ADMIN_CREATION_SECRET")
-DATABASE_URL = os.getenv("DATABASE_URL")
+
+async def create_admin(username: str, email: str, password: str) -> None:
+    try:
+        async with SessionLocal() as db:
+            admin_user = await create_user(db, username, email, password, role="admin")
+        logger.info(f"Compte administrateur créé avec succès : username='{admin_user.username}', id={admin_user.id}")
+        print(f"Compte administrateur créé avec succès : {admin_user.username}")
+    except Exception as e:
+        logger.exception("Erreur lors de la création du compte administrateur")
+        print("Erreur lors de la création du compte administrateur :", e)
+    finally:
+        await async_engine.dispose()
 
 def main():
-    admin_secret = os.getenv("ADMIN_CREATION_SECRET")
+    admin_secret = ADMIN_CREATION_SECRET
     if not admin_secret:
         logger.error("La variable d'environnement ADMIN_CREATION_SECRET n'est pas définie.")
         return
@@ -31,17 +50,7 @@ def main():
         logger.warning("Les mots de passe ne correspondent pas.")
         return
 
-    db = SessionLocal()
-    encryption_key = generate_user_key()
-    try:
-        admin_user = create_user(db, username, email, password, role="admin", encryption_key=encryption_key)
-        logger.info(f"Compte administrateur créé avec succès : username='{admin_user.username}', id={admin_user.id}")
-        print(f"Compte administrateur créé avec succès : {admin_user.username}")
-    except Exception as e:
-        logger.exception("Erreur lors de la création du compte administrateur")
-        print("Erreur lors de la création du compte administrateur :", e)
-    finally:
-        db.close()
+    asyncio.run(create_admin(username, email, password))
 
 if __name__ == "__main__":
     main()
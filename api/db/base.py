@@ -1,27 +1,58 @@
-import asyncio
-from sqlalchemy.ext.asyncio import AsyncEngine
+import os
 from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
 from .models import Base
 from .session import async_engine
+from .migrate import get_head_revision
+from api.core.retry import retry_async
 from api.logger import logger
 
-async def init_db(max_retries: int = 30, delay: float = 2.0) -> None:
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "10"))
+DB_CONNECT_BACKOFF_BASE = float(os.getenv("DB_CONNECT_BACKOFF_BASE", "0.25"))
+DB_CONNECT_BACKOFF_MAX = float(os.getenv("DB_CONNECT_BACKOFF_MAX", "10"))
+
+class SchemaVersionError(RuntimeError):
+    """Le schéma en base ne correspond pas à la dernière migration connue du code."""
+
+async def get_schema_version() -> str | None:
+    """Lit la révision appliquée en base (une seule ligne dans alembic_version)."""
+    async with async_engine.connect() as conn:
+        result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+        return result.scalar_one_or_none()
+
+async def init_db(
+    max_retries: int = DB_CONNECT_RETRIES,
+    base_delay: float = DB_CONNECT_BACKOFF_BASE,
+    max_delay: float = DB_CONNECT_BACKOFF_MAX,
+) -> None:
     """
-    Crée toutes les tables en début d'application, via engine async.
-    Tente plusieurs fois si la base n'est pas encore prête.
+    Vérifie au démarrage que le schéma est à jour, sans exécuter de DDL :
+    les migrations sont appliquées une fois par `python -m api.db.migrate upgrade`.
+    Les échecs de connexion sont retentés avec un backoff exponentiel et jitter.
     """
-    last_exception = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            async with async_engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
-                logger.info("Base de données initialisée (tables créées)")
-                return
-        except Exception as e:
-            last_exception = e
-            logger.warning(
-                f"[init_db] Tentative {attempt}/{max_retries} échouée : {e}. Nouvelle tentative dans {delay} secondes..."
-            )
-            await asyncio.sleep(delay)
-    logger.error(f"[init_db] Impossible d'initialiser la base après {max_retries} tentatives. Dernière erreur : {last_exception}")
-    raise last_exception
+    def _log_retry(attempt: int, error: BaseException, delay: float) -> None:
+        logger.warning(
+            f"[init_db] Tentative {attempt}/{max_retries} échouée : {error}. Nouvelle tentative dans {delay:.2f} secondes..."
+        )
+
+    expected = get_head_revision()
+    try:
+        current = await retry_async(
+            get_schema_version,
+            max_attempts=max_retries,
+            base_delay=base_delay,
+            max_delay=max_delay,
+            give_up_on=(ProgrammingError,),
+            on_retry=_log_retry,
+        )
+    except ProgrammingError as e:
+        logger.error("[init_db] Table alembic_version absente : lancer `python -m api.db.migrate upgrade`")
+        raise SchemaVersionError("Schéma non initialisé") from e
+    except Exception as e:
+        logger.error(f"[init_db] Impossible de joindre la base après {max_retries} tentatives. Dernière erreur : {e}")
+        raise
+
+    if current != expected:
+        logger.error(f"[init_db] Schéma en base '{current}' différent de la révision attendue '{expected}'")
+        raise SchemaVersionError(f"Schéma en version {current}, {expected} attendue")
+    logger.info(f"Base de données prête (schéma en version {current})")
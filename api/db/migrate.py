@@ -0,0 +1,115 @@
+"""
+Migrations versionnées du schéma (Alembic).
+
+Les migrations sont appliquées une seule fois par une commande dédiée, jamais au démarrage de l'API :
+
+    python -m api.db.migrate upgrade            # applique toutes les migrations
+    python -m api.db.migrate current            # affiche la révision en base
+    python -m api.db.migrate stamp head         # base existante créée avant les migrations
+    python -m api.db.migrate revision -m "..." --autogenerate
+
+Elles se connectent à DIRECT_DATABASE_URL (par défaut DATABASE_URL) : derrière un pooler en mode
+transaction, le verrou consultatif de session ne tiendrait pas.
+"""
+import argparse
+import asyncio
+import os
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+
+from api.db.session import async_engine, direct_engine
+from api.logger import logger
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# Verrou consultatif : deux commandes de migration lancées en parallèle ne s'exécutent pas en même temps
+MIGRATION_LOCK_ID = 7_231_004
+
+def get_alembic_config() -> Config:
+    cfg = Config()
+    cfg.set_main_option("script_location", MIGRATIONS_DIR)
+    return cfg
+
+def get_head_revision() -> Optional[str]:
+    """Révision la plus récente connue du code (lecture des fichiers, sans accès à la base)."""
+    return ScriptDirectory.from_config(get_alembic_config()).get_current_head()
+
+def _run_command(connection, cfg: Config, fn, *args, **kwargs) -> None:
+    # Verrou de session (et non de transaction) : il reste tenu pendant les blocs autocommit
+    # (CREATE INDEX CONCURRENTLY) ; Alembic gère ensuite ses propres transactions, une par migration.
+    connection.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+    connection.commit()
+    try:
+        cfg.attributes["connection"] = connection
+        fn(cfg, *args, **kwargs)
+    finally:
+        if connection.in_transaction():
+            connection.rollback()
+        connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+        connection.commit()
+
+async def run_alembic(fn, *args, **kwargs) -> None:
+    cfg = get_alembic_config()
+    async with direct_engine.connect() as conn:
+        await conn.run_sync(_run_command, cfg, fn, *args, **kwargs)
+
+async def upgrade(revision: str = "head") -> None:
+    logger.info(f"[migrate] Application des migrations jusqu'à '{revision}'")
+    await run_alembic(command.upgrade, revision)
+    logger.info("[migrate] Schéma à jour")
+
+async def downgrade(revision: str) -> None:
+    logger.info(f"[migrate] Retour du schéma à la révision '{revision}'")
+    await run_alembic(command.downgrade, revision)
+
+async def stamp(revision: str = "head") -> None:
+    logger.info(f"[migrate] Marquage de la base à la révision '{revision}'")
+    await run_alembic(command.stamp, revision)
+
+async def current() -> None:
+    await run_alembic(command.current, verbose=True)
+
+async def revision(message: str, autogenerate: bool = False) -> None:
+    await run_alembic(command.revision, message=message, autogenerate=autogenerate)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migrations du schéma FastAPI Xtrem")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_up = sub.add_parser("upgrade", help="Applique les migrations")
+    p_up.add_argument("revision", nargs="?", default="head")
+    p_down = sub.add_parser("downgrade", help="Revient à une révision antérieure")
+    p_down.add_argument("revision")
+    p_stamp = sub.add_parser("stamp", help="Marque la base sans exécuter de migration")
+    p_stamp.add_argument("revision", nargs="?", default="head")
+    sub.add_parser("current", help="Affiche la révision appliquée en base")
+    p_rev = sub.add_parser("revision", help="Crée un nouveau fichier de migration")
+    p_rev.add_argument("-m", "--message", required=True)
+    p_rev.add_argument("--autogenerate", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "upgrade":
+        coro = upgrade(args.revision)
+    elif args.cmd == "downgrade":
+        coro = downgrade(args.revision)
+    elif args.cmd == "stamp":
+        coro = stamp(args.revision)
+    elif args.cmd == "current":
+        coro = current()
+    else:
+        coro = revision(args.message, args.autogenerate)
+
+    async def _run():
+        try:
+            await coro
+        finally:
+            await direct_engine.dispose()
+            await async_engine.dispose()
+
+    asyncio.run(_run())
+
+if __name__ == "__main__":
+    main()
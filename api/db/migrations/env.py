@@ -0,0 +1,28 @@
+from alembic import context
+
+from api.db.models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+def run_migrations_online() -> None:
+    """
+    La connexion est fournie par `api.db.migrate` (moteur async, via run_sync) :
+    on ne crée pas de second moteur ici.
+    """
+    connection = config.attributes.get("connection")
+    if connection is None:
+        raise RuntimeError("Les migrations se lancent via : python -m api.db.migrate")
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        compare_type=True,
+        # Une transaction par fichier : les migrations avec bloc autocommit restent isolées
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    raise RuntimeError("Le mode hors ligne (--sql) n'est pas pris en charge")
+run_migrations_online()
@@ -0,0 +1,44 @@
+"""Index de recherche admin sur lower(username) / lower(email) : préfixe et trigrammes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# nom -> (expression indexée, méthode)
+SEARCH_INDEXES = {
+    "ix_users_username_lower_prefix": ("lower(username) text_pattern_ops", "btree"),
+    "ix_users_email_lower_prefix": ("lower(email) text_pattern_ops", "btree"),
+    "ix_users_username_lower_trgm": ("lower(username) gin_trgm_ops", "gin"),
+    "ix_users_email_lower_trgm": ("lower(email) gin_trgm_ops", "gin"),
+}
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY : pas de verrou bloquant les écritures sur users pendant la construction,
+    # mais interdit dans une transaction
+    with op.get_context().autocommit_block():
+        for name, (expression, using) in SEARCH_INDEXES.items():
+            op.create_index(
+                name, "users", [sa.text(expression)],
+                postgresql_using=using, postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in SEARCH_INDEXES:
+            op.drop_index(name, table_name="users", postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,42 @@
+"""Table audit_events
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "audit_events",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("event_type", sa.String(length=64), nullable=False),
+        sa.Column("actor", sa.String(), nullable=True),
+        sa.Column("target", sa.String(), nullable=True),
+        sa.Column("ip", sa.String(length=64), nullable=True),
+        sa.Column("success", sa.Boolean(), nullable=False),
+        sa.Column("details", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_audit_events_actor_id", "audit_events", ["actor", "id"], unique=False)
+    op.create_index("ix_audit_events_event_type_id", "audit_events", ["event_type", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_audit_events_event_type_id", table_name="audit_events")
+    op.drop_index("ix_audit_events_actor_id", table_name="audit_events")
+    op.drop_table("audit_events")
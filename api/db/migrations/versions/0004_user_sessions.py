@@ -0,0 +1,44 @@
+"""Table user_sessions : une session (refresh token) par appareil
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_sessions",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("refresh_token_hash", sa.String(length=64), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_used_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("user_agent", sa.String(length=256), nullable=True),
+        sa.Column("ip", sa.String(length=64), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_user_sessions_user_id_created_at", "user_sessions", ["user_id", "created_at"], unique=False)
+    op.create_index("ix_user_sessions_expires_at", "user_sessions", ["expires_at"], unique=False)
+    # Les refresh tokens stockés (chiffrés) avant les sessions ne sont plus acceptés : on ne les garde pas
+    op.execute("UPDATE user_sensitive_data SET encrypted_refresh_token = NULL WHERE encrypted_refresh_token IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_sessions_expires_at", table_name="user_sessions")
+    op.drop_index("ix_user_sessions_user_id_created_at", table_name="user_sessions")
+    op.drop_table("user_sessions")
@@ -0,0 +1,45 @@
+"""Flux de modifications des utilisateurs : index (updated_at, id) et table user_tombstones
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_tombstones",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_user_tombstones_deleted_at_user_id", "user_tombstones", ["deleted_at", "user_id"], unique=False
+    )
+    # CONCURRENTLY : users reste accessible en écriture pendant la construction de l'index
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_users_updated_at_id", "users", ["updated_at", "id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_users_updated_at_id", table_name="users", postgresql_concurrently=True, if_exists=True)
+    op.drop_index("ix_user_tombstones_deleted_at_user_id", table_name="user_tombstones")
+    op.drop_table("user_tombstones")
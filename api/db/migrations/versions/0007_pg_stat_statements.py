@@ -0,0 +1,37 @@
+"""Extension pg_stat_statements (rapport des requêtes lentes, api.db.stats)
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-21 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nécessite un rôle superutilisateur (cas de l'image postgres-custom) ; sinon la migration
+    # passe quand même et le rapport signale l'extension comme indisponible.
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_stat_statements;
+        EXCEPTION WHEN insufficient_privilege OR undefined_file THEN
+            RAISE NOTICE 'pg_stat_statements non installée : %', SQLERRM;
+        END
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP EXTENSION IF EXISTS pg_stat_statements")
@@ -0,0 +1,28 @@
+"""Sessions : token précédent et date de rotation (fenêtre de grâce du refresh)
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-22 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("user_sessions", sa.Column("previous_token_hash", sa.String(length=64), nullable=True))
+    op.add_column("user_sessions", sa.Column("rotated_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("user_sessions", "rotated_at")
+    op.drop_column("user_sessions", "previous_token_hash")
@@ -0,0 +1,33 @@
+"""Table key_rotations : fin de ré-enveloppement, signalée aux workers de l'API
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-22 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "key_rotations",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("kid", sa.String(length=64), nullable=False),
+        sa.Column("rewrapped", sa.Integer(), nullable=False),
+        sa.Column("completed_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("key_rotations")
@@ -1,5 +1,6 @@
 import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Boolean, Column, Integer, LargeBinary, String, DateTime, ForeignKey, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -19,10 +20,99 @@ class User(Base):
     encryption_key = Column(String, unique=True, index=True)
     sensitive_data = relationship("UserSensitiveData", back_populates="user", uselist=False)
 
+    __table_args__ = (
+        # Recherche admin : préfixe insensible à la casse (B-tree) et sous-chaîne / similarité (trigrammes)
+        Index("ix_users_username_lower_prefix", func.lower(username).label("username_lower"),
+              postgresql_ops={"username_lower": "text_pattern_ops"}),
+        Index("ix_users_email_lower_prefix", func.lower(email).label("email_lower"),
+              postgresql_ops={"email_lower": "text_pattern_ops"}),
+        Index("ix_users_username_lower_trgm", func.lower(username).label("username_lower"),
+              postgresql_using="gin", postgresql_ops={"username_lower": "gin_trgm_ops"}),
+        Index("ix_users_email_lower_trgm", func.lower(email).label("email_lower"),
+              postgresql_using="gin", postgresql_ops={"email_lower": "gin_trgm_ops"}),
+        # Flux de modifications : parcours par curseur (updated_at, id)
+        Index("ix_users_updated_at_id", "updated_at", "id"),
+    )
+
 class UserSensitiveData(Base):
     __tablename__ = "user_sensitive_data"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
     encrypted_bio = Column(String)
+    # Plus écrit depuis l'introduction de user_sessions (un refresh token par appareil)
     encrypted_refresh_token = Column(String, nullable=True)
     user = relationship("User", back_populates="sensitive_data")
+
+class UserSession(Base):
+    """Session d'un appareil : identifiée par le claim `sid` des tokens, refresh token courant haché."""
+    __tablename__ = "user_sessions"
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    refresh_token_hash = Column(String(64), nullable=False)
+    # Token remplacé par la dernière rotation, encore accepté pendant REFRESH_REUSE_GRACE secondes
+    previous_token_hash = Column(String(64), nullable=True)
+    rotated_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    user_agent = Column(String(256), nullable=True)
+    ip = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        # Sessions d'un utilisateur (plafond, plus anciennes d'abord) et purge par date d'expiration
+        Index("ix_user_sessions_user_id_created_at", "user_id", "created_at"),
+        Index("ix_user_sessions_expires_at", "expires_at"),
+    )
+
+class AuditEvent(Base):
+    """Événement d'audit (auth, admin), écrit par lots depuis api.core.audit."""
+    __tablename__ = "audit_events"
+    id = Column(BigInteger, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    event_type = Column(String(64), nullable=False)
+    actor = Column(String, nullable=True)
+    target = Column(String, nullable=True)
+    ip = Column(String(64), nullable=True)
+    success = Column(Boolean, nullable=False, default=True)
+    details = Column(JSONB, nullable=True)
+
+    __table_args__ = (
+        # Pagination par curseur (id décroissant), globale ou filtrée par acteur / type
+        Index("ix_audit_events_actor_id", "actor", "id"),
+        Index("ix_audit_events_event_type_id", "event_type", "id"),
+    )
+
+class IdempotencyKey(Base):
+    """Réponse enregistrée pour un Idempotency-Key (status_code NULL : requête en cours)."""
+    __tablename__ = "idempotency_keys"
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response_headers = Column(JSONB, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+class UserTombstone(Base):
+    """Trace d'un utilisateur supprimé, pour le flux de modifications (/admin/users/changes)."""
+    __tablename__ = "user_tombstones"
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    username = Column(String, nullable=True)
+    deleted_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_user_tombstones_deleted_at_user_id", "deleted_at", "user_id"),
+    )
+
+class KeyRotation(Base):
+    """Fin d'un ré-enveloppement des clés utilisateur : les workers de l'API vident alors leur cache de clés."""
+    __tablename__ = "key_rotations"
+    id = Column(BigInteger, primary_key=True)
+    kid = Column(String(64), nullable=False)
+    rewrapped = Column(Integer, nullable=False)
+    completed_at = Column(DateTime, nullable=False)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional
+import datetime
+from typing import Any, Dict, List, Optional
 
 class UserBase(BaseModel):
     username: str = Field(..., min_length=3)
@@ -14,6 +15,63 @@ class UserOut(UserBase):
     role: str
     model_config = ConfigDict(from_attributes=True)
 
+class UserUpdate(BaseModel):
+    email: Optional[EmailStr] = None
+    password: Optional[str] = Field(None, min_length=6)
+    bio: Optional[str] = None
+
 class UserLogin(BaseModel):
     username: str
     password: str
+
+class IntrospectionRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1)
+    scopes: List[str] = []
+
+class TokenIntrospection(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    role: Optional[str] = None
+    scopes: List[str] = []
+    token_type: Optional[str] = None
+    exp: Optional[int] = None
+    iat: Optional[int] = None
+    jti: Optional[str] = None
+    cache_ttl: int = 0
+    error: Optional[str] = None
+
+class IntrospectionResponse(BaseModel):
+    results: List[TokenIntrospection]
+    ttl: int
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class BulkDeleteResponse(BaseModel):
+    deleted: List[int]
+
+class AuditEventOut(BaseModel):
+    id: int
+    created_at: datetime.datetime
+    event_type: str
+    actor: Optional[str] = None
+    target: Optional[str] = None
+    ip: Optional[str] = None
+    success: bool
+    details: Optional[Dict[str, Any]] = None
+
+class AuditPage(BaseModel):
+    events: List[AuditEventOut]
+    next_before_id: Optional[int] = None
+
+class UserChange(BaseModel):
+    op: str  # "upsert" ou "delete"
+    id: int
+    changed_at: datetime.datetime
+    username: Optional[str] = None
+    user: Optional[UserOut] = None
+
+class UserChangePage(BaseModel):
+    changes: List[UserChange]
+    next_cursor: Optional[str] = None
+    has_more: bool
@@ -0,0 +1,141 @@
+"""
+Jeux de données synthétiques pour les tests de charge.
+
+    python -m api.db.seed --count 1000000                 # 1M utilisateurs « seed0000000 », bio chiffrée
+    python -m api.db.seed --count 50000 --admins 5 --prefix bench_ --no-bio
+    python -m api.db.seed --count 5000 --bench             # coût par utilisateur, sans base
+
+Chemin rapide : un seul hash bcrypt calculé pour tout le lot (mot de passe SEED_PASSWORD pour
+tous les comptes), clés utilisateur générées, enveloppées et bios chiffrées dans un pool de
+processus, lignes insérées par COPY (users puis user_sensitive_data) avec des ids réservés
+d'avance sur la séquence. Chaque lot est validé dans sa propre transaction : un lot en échec
+n'annule pas les précédents. Ne pas lancer sur une base de production.
+"""
+import argparse
+import asyncio
+import datetime
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from cryptography.fernet import Fernet
+
+from api.core.crypto import encrypt_sensitive_data, generate_user_key, master_keys
+from api.db.services import get_password_hash
+from api.db.session import async_engine
+from api.logger import logger
+
+SEED_PASSWORD = os.getenv("SEED_PASSWORD", "SeedPass!23")
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "10000"))
+
+USER_COLUMNS = ["id", "username", "email", "hashed_password", "role", "created_at", "updated_at", "encryption_key"]
+SENSITIVE_COLUMNS = ["user_id", "encrypted_bio"]
+
+def build_batch(
+    ids: List[int], start: int, prefix: str, hashed_password: str, admins: int, with_bio: bool
+) -> Tuple[list, list]:
+    """
+    Lignes (users, user_sensitive_data) d'un lot, dans un processus du pool : génération et
+    enveloppement des clés, chiffrement des bios. Les `admins` premiers numéros sont admins.
+    """
+    now = datetime.datetime.utcnow()
+    users, sensitive = [], []
+    for offset, user_id in enumerate(ids):
+        n = start + offset
+        username = f"{prefix}{n:07d}"
+        # Mêmes opérations que generate_user_key / encrypt_sensitive_data, sans leurs logs par appel
+        data_key = Fernet.generate_key()
+        users.append((
+            user_id, username, f"{username}@example.test", hashed_password,
+            "admin" if n < admins else "user", now, now, master_keys.wrap(data_key.decode()),
+        ))
+        if with_bio:
+            bio = Fernet(data_key).encrypt(f"Bio synthétique de {username}".encode()).decode()
+            sensitive.append((user_id, bio))
+    return users, sensitive
+
+async def _reserve_ids(conn, count: int) -> List[int]:
+    """Réserve `count` ids sur la séquence de users.id (pour lier les bios sans relire les lignes)."""
+    return await conn.fetch(
+        "SELECT nextval(pg_get_serial_sequence('users', 'id')) FROM generate_series(1, $1)", count
+    )
+
+async def seed(count: int, batch_size: int, workers: int, prefix: str, admins: int, with_bio: bool) -> int:
+    start_time = time.perf_counter()
+    hashed_password = get_password_hash(SEED_PASSWORD)
+    loop = asyncio.get_running_loop()
+    inserted = 0
+    try:
+        async with async_engine.connect() as sa_conn:
+            raw = await sa_conn.get_raw_connection()
+            conn = raw.driver_connection
+            # spawn : pas de fork d'un process qui a déjà une boucle asyncio et des connexions ouvertes
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pending: deque = deque()
+                # Le pool prépare jusqu'à 2 lots par processus d'avance pendant que COPY écrit
+                for start in range(0, count, batch_size):
+                    size = min(batch_size, count - start)
+                    ids = [row[0] for row in await _reserve_ids(conn, size)]
+                    pending.append(loop.run_in_executor(
+                        pool, build_batch, ids, start, prefix, hashed_password, admins, with_bio
+                    ))
+                    if len(pending) >= workers * 2:
+                        inserted += await _copy_batch(conn, await pending.popleft())
+                        _log_progress(inserted, count, start_time)
+                while pending:
+                    inserted += await _copy_batch(conn, await pending.popleft())
+                    _log_progress(inserted, count, start_time)
+            await conn.execute("ANALYZE users")
+            await conn.execute("ANALYZE user_sensitive_data")
+    finally:
+        await async_engine.dispose()
+    logger.info(f"{inserted} utilisateurs créés en {time.perf_counter() - start_time:.1f}s")
+    return inserted
+
+async def _copy_batch(conn, batch: Tuple[list, list]) -> int:
+    users, sensitive = batch
+    async with conn.transaction():
+        await conn.copy_records_to_table("users", records=users, columns=USER_COLUMNS)
+        if sensitive:
+            await conn.copy_records_to_table("user_sensitive_data", records=sensitive, columns=SENSITIVE_COLUMNS)
+    return len(users)
+
+def bench_build(count: int) -> Tuple[float, float]:
+    """
+    Coût par utilisateur (µs, un cœur) de build_batch et du chemin des helpers crypto
+    (generate_user_key + encrypt_sensitive_data, un log par appel), sans base.
+    """
+    start = time.perf_counter()
+    build_batch(list(range(count)), 0, "bench", "", 0, True)
+    batch_us = (time.perf_counter() - start) / count * 1e6
+    start = time.perf_counter()
+    for n in range(count):
+        encrypt_sensitive_data(f"Bio synthétique de bench{n:07d}", generate_user_key())
+    helpers_us = (time.perf_counter() - start) / count * 1e6
+    return batch_us, helpers_us
+
+def _log_progress(inserted: int, count: int, start_time: float) -> None:
+    elapsed = time.perf_counter() - start_time
+    logger.info(f"Seed : {inserted}/{count} utilisateurs ({inserted / max(elapsed, 1e-6):.0f}/s)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Création d'utilisateurs synthétiques (tests de charge)")
+    parser.add_argument("--count", type=int, required=True, help="nombre d'utilisateurs à créer")
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processus de génération des clés")
+    parser.add_argument("--prefix", default="seed", help="préfixe des usernames (doit être libre)")
+    parser.add_argument("--admins", type=int, default=0, help="nombre de comptes admin parmi les premiers créés")
+    parser.add_argument("--no-bio", action="store_true", help="ne crée pas de bio chiffrée")
+    parser.add_argument("--bench", action="store_true", help="mesure la préparation des lignes, sans écrire en base")
+    args = parser.parse_args()
+    if args.bench:
+        batch_us, helpers_us = bench_build(args.count)
+        print(f"build_batch : {batch_us:.0f} µs/utilisateur, helpers crypto : {helpers_us:.0f} µs/utilisateur")
+        return
+    asyncio.run(seed(args.count, args.batch_size, args.workers, args.prefix, args.admins, not args.no_bio))
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,26 @@
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
+import datetime
+import os
+import time
+from sqlalchemy import and_, bindparam, case, delete, event, func, insert, literal, null, or_, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from api.db.models import User
-from api.core.crypto import generate_user_key
+from sqlalchemy.orm import Session, joinedload
+from api.db.models import AuditEvent, IdempotencyKey, KeyRotation, User, UserSensitiveData, UserSession, UserTombstone
+from api.core.crypto import generate_user_key, master_keys
+from api.core.deadline import DEADLINE_DEFAULT, DEADLINE_ROUTES, current_deadline, parse_route_budgets
+from api.core.ratelimit import password_gate
+from api.core.singleflight import SingleFlight
+from api.db.session import SessionLocal
 import bcrypt
 from api.logger import logger
 
+# Coût bcrypt des nouveaux hash ; les hash d'un autre coût sont refaits après un login réussi
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 def get_password_hash(password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     logger.debug("Mot de passe hashé")
     return hashed.decode('utf-8')
@@ -18,10 +30,119 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     logger.debug(f"Vérification du mot de passe : {'succès' if result else 'échec'}")
     return result
 
+async def hash_password(password: str) -> str:
+    """Hash bcrypt exécuté hors de la boucle asyncio, sous le plafond de concurrence."""
+    return await password_gate.run(get_password_hash, password)
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_gate.run(verify_password, plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Vrai si le hash a été calculé avec un coût différent de BCRYPT_ROUNDS ($2b$<coût>$...)."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+async def replace_password_hash(db: AsyncSession, user_id: int, new_hash: str, old_hash: str) -> bool:
+    """
+    Remplace le hash par `new_hash` (calculé au coût courant), sauf si le mot de passe a changé
+    entre-temps (condition sur l'ancien hash). Renvoie True si la ligne a été mise à jour.
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.hashed_password == old_hash)
+        # Re-hachage transparent : pas une modification du profil, updated_at (ETag, flux) inchangé
+        .values(hashed_password=new_hash, updated_at=User.updated_at)
+    )
+    return result.rowcount == 1
+
+# Profils de chargement : chaque endpoint lit uniquement ses colonnes, en une seule requête.
+# ROLE : contrôle d'accès ; AUTH : login ; PROFILE : affichage du profil (bio chiffrée jointe) ; FULL : entité ORM complète.
+USER_ROLE_COLUMNS = (User.id, User.username, User.role)
+USER_AUTH_COLUMNS = USER_ROLE_COLUMNS + (User.hashed_password, User.encryption_key)
+USER_PROFILE_COLUMNS = USER_ROLE_COLUMNS + (User.email, User.encryption_key, UserSensitiveData.encrypted_bio)
+
+# Lectures chaudes mutualisées : des requêtes concurrentes identiques (rafale de logins, rechargement
+# du tableau de bord admin) partagent un seul aller-retour, exécuté dans sa propre session hors de la
+# transaction de la requête. Seules des lignes (immuables) sont partagées, jamais des entités ORM.
+# Cohérence : une requête dont la session a déjà une transaction ouverte lit sur sa propre connexion
+# (elle doit voir ses écritures). Sinon, le résultat partagé peut précéder l'arrivée de l'appelant :
+# - jamais un commit de ce worker (la génération d'écriture fait partie de la clé) ;
+# - au plus USER_READ_JOIN_WINDOW secondes pour un commit d'un autre worker ou d'une autre réplique.
+USER_READ_COALESCING = os.getenv("USER_READ_COALESCING", "true").lower() == "true"
+# Durée maximale d'une lecture mutualisée, portée au budget restant de l'appelant qui la lance ;
+# chaque appelant n'attend que son propre budget restant (USER_READ_TIMEOUT hors requête HTTP)
+USER_READ_TIMEOUT = float(os.getenv("USER_READ_TIMEOUT", "5"))
+USER_READ_JOIN_WINDOW = float(os.getenv("USER_READ_JOIN_WINDOW", "0.1"))
+user_reads = SingleFlight("user_reads", USER_READ_TIMEOUT)
+
+# Incrémentée à chaque commit d'une session de ce worker qui a écrit
+_write_generation = 0
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement_writes(state) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+@event.listens_for(Session, "after_flush")
+def _track_flush_writes(session, flush_context) -> None:
+    session.info["wrote"] = True
+
+@event.listens_for(Session, "after_commit")
+def _bump_write_generation(session) -> None:
+    global _write_generation
+    if session.info.pop("wrote", False):
+        _write_generation += 1
+
+@event.listens_for(Session, "after_rollback")
+def _forget_writes(session) -> None:
+    session.info.pop("wrote", None)
+
+async def _shared_read(db: AsyncSession, key: tuple, stmt, fetch: str):
+    """Résultat de `stmt` (`fetch` : "first", "one", "all", "scalar_one"), mutualisé par `key`."""
+    if not USER_READ_COALESCING or db.in_transaction():
+        return getattr(await db.execute(stmt), fetch)()
+
+    async def read():
+        # La tâche hérite du contexte du premier appelant : son échéance (statement_timeout) ne doit
+        # pas s'imposer aux autres ; la lecture est bornée par `timeout`, chaque appelant par son budget
+        current_deadline.set(None)
+        async with SessionLocal() as session:
+            return getattr(await session.execute(stmt), fetch)()
+
+    deadline = current_deadline.get()
+    wait = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+    timeout = USER_READ_TIMEOUT if wait is None else max(USER_READ_TIMEOUT, wait)
+    return await user_reads.do(
+        (_write_generation, *key), read, timeout=timeout, max_age=USER_READ_JOIN_WINDOW, wait=wait
+    )
+
+async def _load_user_row(db: AsyncSession, profile: str, columns: tuple, username: str):
+    stmt = select(*columns).where(User.username == username)
+    if any(getattr(c, "class_", None) is UserSensitiveData for c in columns):
+        stmt = stmt.outerjoin(UserSensitiveData, User.id == UserSensitiveData.user_id)
+    row = await _shared_read(db, (profile, username), stmt, "first")
+    logger.debug(f"Chargement de '{username}' (profil {profile}) : {'trouvé' if row else 'non trouvé'}")
+    return row
+
+async def get_user_role(db: AsyncSession, username: str):
+    """(id, username, role) ou None."""
+    return await _load_user_row(db, "role", USER_ROLE_COLUMNS, username)
+
+async def get_user_auth(db: AsyncSession, username: str):
+    """(id, username, role, hashed_password, encryption_key) ou None."""
+    return await _load_user_row(db, "auth", USER_AUTH_COLUMNS, username)
+
+async def get_user_profile(db: AsyncSession, username: str):
+    """(id, username, role, email, encryption_key, encrypted_bio) ou None."""
+    return await _load_user_row(db, "profile", USER_PROFILE_COLUMNS, username)
+
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    """Profil FULL : entité User et ses données sensibles (jointure, une seule requête)."""
     result = await db.execute(
         select(User)
-        .options(selectinload(User.sensitive_data))
+        .options(joinedload(User.sensitive_data))
         .where(User.username == username)
     )
     user = result.scalars().first()
@@ -31,13 +152,459 @@ async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User
 async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     result = await db.execute(
         select(User)
-        .options(selectinload(User.sensitive_data))
+        .options(joinedload(User.sensitive_data))
         .where(User.email == email)
     )
     user = result.scalars().first()
     logger.debug(f"Recherche utilisateur par email '{email}' : {'trouvé' if user else 'non trouvé'}")
     return user
 
+async def find_user_conflict(db: AsyncSession, username: str, email: str):
+    """(username, email) d'un compte existant utilisant ce username ou cet email, sinon None."""
+    result = await db.execute(
+        select(User.username, User.email)
+        .where(or_(User.username == username, User.email == email))
+        .limit(1)
+    )
+    return result.first()
+
+# Sessions par appareil : au-delà de ce nombre, les plus anciennes sont fermées à la connexion
+MAX_SESSIONS_PER_USER = int(os.getenv("MAX_SESSIONS_PER_USER", "10"))
+
+async def create_session(
+    db: AsyncSession,
+    user_id: int,
+    sid: str,
+    refresh_token_hash: str,
+    expires_at: datetime.datetime,
+    user_agent: Optional[str] = None,
+    ip: Optional[str] = None,
+) -> int:
+    """Ouvre une session puis ferme les plus anciennes au-delà du plafond ; renvoie le nombre de sessions fermées."""
+    now = datetime.datetime.utcnow()
+    await db.execute(insert(UserSession).values(
+        id=sid, user_id=user_id, refresh_token_hash=refresh_token_hash,
+        created_at=now, last_used_at=now, expires_at=expires_at,
+        user_agent=(user_agent or "")[:256] or None, ip=ip,
+    ))
+    beyond_limit = (
+        select(UserSession.id)
+        .where(UserSession.user_id == user_id)
+        .order_by(UserSession.created_at.desc(), UserSession.id.desc())
+        .offset(MAX_SESSIONS_PER_USER)
+    )
+    result = await db.execute(delete(UserSession).where(UserSession.id.in_(beyond_limit)))
+    if result.rowcount:
+        logger.info(f"{result.rowcount} session(s) la/les plus ancienne(s) fermée(s) pour user_id={user_id}")
+    return result.rowcount
+
+async def rotate_session(
+    db: AsyncSession,
+    sid: str,
+    username: str,
+    old_hash: str,
+    new_hash: str,
+    expires_at: datetime.datetime,
+    grace_seconds: float = 0,
+) -> bool:
+    """
+    Remplace le refresh token d'une session, à condition qu'elle appartienne à `username`, ne soit pas
+    expirée et que `old_hash` soit bien le token courant (mise à jour conditionnelle, sans lecture préalable).
+    Le token remplacé par la rotation précédente est encore accepté pendant `grace_seconds` : deux
+    onglets qui rafraîchissent en même temps, ou un client qui n'a pas reçu la réponse, ne ferment pas
+    la session. Le token courant devient à son tour le token précédent.
+    """
+    now = datetime.datetime.utcnow()
+    presented = UserSession.refresh_token_hash == old_hash
+    if grace_seconds > 0:
+        presented = or_(
+            presented,
+            and_(
+                UserSession.previous_token_hash == old_hash,
+                UserSession.rotated_at > now - datetime.timedelta(seconds=grace_seconds),
+            ),
+        )
+    result = await db.execute(
+        update(UserSession)
+        .where(
+            UserSession.id == sid,
+            presented,
+            UserSession.expires_at > now,
+            UserSession.user_id == select(User.id).where(User.username == username).scalar_subquery(),
+        )
+        .values(
+            # Dans SET, refresh_token_hash désigne encore la valeur d'avant la mise à jour
+            previous_token_hash=UserSession.refresh_token_hash,
+            refresh_token_hash=new_hash,
+            rotated_at=now,
+            last_used_at=now,
+            expires_at=expires_at,
+        )
+        .returning(UserSession.id)
+    )
+    return result.first() is not None
+
+async def revoke_session(db: AsyncSession, sid: str) -> bool:
+    result = await db.execute(delete(UserSession).where(UserSession.id == sid))
+    return result.rowcount == 1
+
+async def delete_expired_sessions(db: AsyncSession, batch_size: int) -> int:
+    """
+    Supprime au plus `batch_size` sessions expirées. SKIP LOCKED : plusieurs workers peuvent purger
+    en parallèle sans s'attendre, et chaque lot ne verrouille que peu de lignes.
+    """
+    expired = (
+        select(UserSession.id)
+        .where(UserSession.expires_at < datetime.datetime.utcnow())
+        .order_by(UserSession.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(delete(UserSession).where(UserSession.id.in_(expired)))
+    return result.rowcount
+
+async def claim_idempotency_key(db: AsyncSession, key: str, fingerprint: str, lock_seconds: float):
+    """
+    Réserve `key` pour la requête courante (ligne "en cours", status_code NULL) ; une ligne expirée
+    est reprise. Renvoie (True, None) si la clé est réservée, sinon (False, ligne existante ou None
+    si elle vient de disparaître).
+    """
+    now = datetime.datetime.utcnow()
+    stmt = pg_insert(IdempotencyKey).values(
+        key=key, fingerprint=fingerprint, created_at=now,
+        expires_at=now + datetime.timedelta(seconds=lock_seconds)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key],
+        set_={
+            "fingerprint": stmt.excluded.fingerprint,
+            "status_code": None,
+            "response_headers": None,
+            "response_body": None,
+            "created_at": stmt.excluded.created_at,
+            "expires_at": stmt.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at < now
+    ).returning(IdempotencyKey.key)
+    result = await db.execute(stmt)
+    if result.scalar_one_or_none() is not None:
+        return True, None
+    result = await db.execute(
+        select(
+            IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+            IdempotencyKey.response_headers, IdempotencyKey.response_body
+        ).where(IdempotencyKey.key == key)
+    )
+    return False, result.first()
+
+async def complete_idempotency_key(
+    db: AsyncSession, key: str, status_code: int, headers: list, body: bytes, ttl: float
+) -> None:
+    await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key)
+        .values(
+            status_code=status_code, response_headers=headers, response_body=body,
+            expires_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        )
+    )
+
+async def release_idempotency_key(db: AsyncSession, key: str) -> None:
+    """Libère une réservation sans réponse enregistrée (erreur serveur) : un nouvel essai rejouera la requête."""
+    await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None))
+    )
+
+async def delete_expired_idempotency_keys(db: AsyncSession, batch_size: int) -> int:
+    expired = (
+        select(IdempotencyKey.key)
+        .where(IdempotencyKey.expires_at < datetime.datetime.utcnow())
+        .order_by(IdempotencyKey.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired)))
+    return result.rowcount
+
+# Champs de UserOut lus directement en colonnes (sans entité ORM) pour les listes
+USER_OUT_FIELDS = ("id", "username", "email", "bio", "role")
+USER_OUT_COLUMNS = (User.id, User.username, User.email, User.bio, User.role)
+
+# En dessous de cette longueur, la recherche se limite au préfixe (pas de trigramme exploitable)
+SEARCH_MIN_SUBSTRING = 3
+
+def _like_escape(value: str) -> str:
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+def _prefix_match(q: str):
+    """lower(col) LIKE 'q%' : motif constant, servi par les index B-tree text_pattern_ops."""
+    pattern = _like_escape(q.lower()) + "%"
+    return or_(
+        func.lower(User.username).like(pattern, escape="/"),
+        func.lower(User.email).like(pattern, escape="/"),
+    )
+
+def _user_filter(q: Optional[str]):
+    """Préfixe insensible à la casse sur username ou email (None si pas de recherche)."""
+    return _prefix_match(q) if q else None
+
+async def list_user_page(db: AsyncSession, limit: int, after_id: Optional[int] = None, q: Optional[str] = None) -> list:
+    """
+    Une page d'utilisateurs (tuples dans l'ordre de USER_OUT_FIELDS), triée par id, après `after_id`
+    (pagination par clé : coût constant quelle que soit la profondeur, contrairement à OFFSET).
+    """
+    stmt = select(*USER_OUT_COLUMNS).order_by(User.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(User.id > after_id)
+    criteria = _user_filter(q)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    return await _shared_read(db, ("user_page", limit, after_id, q), stmt, "all")
+
+async def count_users(db: AsyncSession, q: Optional[str] = None) -> int:
+    stmt = select(func.count(User.id))
+    criteria = _user_filter(q)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+    return await _shared_read(db, ("user_count", q), stmt, "scalar_one")
+
+def _search_criteria(q: str):
+    """
+    Critère et rang de pertinence d'une recherche admin (q déjà en minuscules) :
+    0 = égalité exacte, 1 = préfixe, 2 = sous-chaîne, 3 = similarité trigramme (fautes de frappe).
+    """
+    username, email = func.lower(User.username), func.lower(User.email)
+    prefix = _prefix_match(q)
+    exact = or_(username == q, email == q)
+    if len(q) < SEARCH_MIN_SUBSTRING:
+        return prefix, case((exact, 0), else_=1)
+    pattern = "%" + _like_escape(q) + "%"
+    substring = or_(username.like(pattern, escape="/"), email.like(pattern, escape="/"))
+    # Opérateur % de pg_trgm : seuil pg_trgm.similarity_threshold (0.3 par défaut)
+    similar = or_(username.op("%")(q), email.op("%")(q))
+    rank = case((exact, 0), (prefix, 1), (substring, 2), else_=3)
+    return or_(substring, similar), rank
+
+async def search_users(db: AsyncSession, q: str, limit: int, offset: int = 0):
+    """Page de résultats (tuples dans l'ordre de USER_OUT_FIELDS) triés par pertinence, et total."""
+    q = q.strip().lower()
+    criteria, rank = _search_criteria(q)
+    order = [rank]
+    if len(q) >= SEARCH_MIN_SUBSTRING:
+        order.append(func.greatest(
+            func.similarity(func.lower(User.username), q), func.similarity(func.lower(User.email), q)
+        ).desc())
+    order += [User.username, User.id]
+    result = await db.execute(
+        select(*USER_OUT_COLUMNS).where(criteria).order_by(*order).limit(limit).offset(offset)
+    )
+    rows = result.all()
+    total = (await db.execute(select(func.count(User.id)).where(criteria))).scalar_one()
+    logger.debug(f"Recherche '{q}' : {len(rows)}/{total} résultats (offset={offset})")
+    return rows, total
+
+async def delete_users(db: AsyncSession, user_ids: Iterable[int]) -> List[int]:
+    """
+    Supprime un lot d'utilisateurs (données sensibles d'abord) ; renvoie les ids effectivement supprimés.
+    Une tombe par utilisateur supprimé est écrite dans la même transaction, pour le flux de modifications.
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return []
+    await db.execute(delete(UserSensitiveData).where(UserSensitiveData.user_id.in_(user_ids)))
+    result = await db.execute(delete(User).where(User.id.in_(user_ids)).returning(User.id, User.username))
+    rows = result.all()
+    if rows:
+        now = datetime.datetime.utcnow()
+        await db.execute(
+            insert(UserTombstone),
+            [{"user_id": user_id, "username": username, "deleted_at": now} for user_id, username in rows]
+        )
+    deleted = sorted(user_id for user_id, _ in rows)
+    logger.debug(f"Suppression par lot : {len(deleted)}/{len(user_ids)} utilisateurs supprimés")
+    return deleted
+
+# Flux de modifications : les modifications (users.updated_at) et suppressions (user_tombstones)
+# forment un seul flux trié par (horodatage, id). Le flux s'arrête FEED_SAFETY_LAG secondes avant
+# maintenant : une transaction qui a horodaté une ligne mais n'est pas encore validée ne peut pas
+# être dépassée par le curseur d'un consommateur. Le délai doit donc couvrir la plus longue
+# transaction d'écriture, bornée par l'échéance des requêtes : par défaut, le plus long budget de
+# DEADLINE_DEFAULT / DEADLINE_ROUTES plus une seconde (une route sans échéance ne doit pas écrire users).
+_LONGEST_REQUEST_BUDGET = max([DEADLINE_DEFAULT, *parse_route_budgets(DEADLINE_ROUTES).values()])
+FEED_SAFETY_LAG = float(os.getenv("FEED_SAFETY_LAG", "0")) or _LONGEST_REQUEST_BUDGET + 1
+if FEED_SAFETY_LAG < _LONGEST_REQUEST_BUDGET:
+    logger.warning(
+        f"FEED_SAFETY_LAG ({FEED_SAFETY_LAG}s) inférieur au plus long budget de requête "
+        f"({_LONGEST_REQUEST_BUDGET}s) : le flux de modifications peut sauter des écritures lentes"
+    )
+FEED_TOMBSTONE_RETENTION_DAYS = int(os.getenv("FEED_TOMBSTONE_RETENTION_DAYS", "30"))
+USER_CHANGE_FIELDS = ("changed_at", "id", "op") + USER_OUT_FIELDS[1:]
+
+def feed_horizon() -> datetime.datetime:
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=FEED_SAFETY_LAG)
+
+def tombstone_horizon() -> datetime.datetime:
+    """Les tombes plus anciennes sont purgées : un curseur antérieur impose une resynchronisation complète."""
+    return datetime.datetime.utcnow() - datetime.timedelta(days=FEED_TOMBSTONE_RETENTION_DAYS)
+
+async def list_user_changes(db: AsyncSession, since: Optional[tuple], limit: int, until: datetime.datetime) -> list:
+    """
+    Jusqu'à `limit` modifications strictement après le curseur `since` (horodatage, id) et avant
+    `until`, en tuples dans l'ordre de USER_CHANGE_FIELDS. Chaque branche parcourt son index
+    (updated_at, id) / (deleted_at, user_id) et s'arrête à `limit` lignes.
+    """
+    changed = (
+        select(
+            User.updated_at.label("changed_at"), User.id.label("id"), literal("upsert").label("op"),
+            User.username, User.email, User.bio, User.role
+        )
+        .where(User.updated_at < until)
+        .order_by(User.updated_at, User.id)
+        .limit(limit)
+    )
+    deleted = (
+        select(
+            UserTombstone.deleted_at.label("changed_at"), UserTombstone.user_id.label("id"),
+            literal("delete").label("op"), UserTombstone.username, null(), null(), null()
+        )
+        .where(UserTombstone.deleted_at < until)
+        .order_by(UserTombstone.deleted_at, UserTombstone.user_id)
+        .limit(limit)
+    )
+    if since is not None:
+        changed = changed.where(tuple_(User.updated_at, User.id) > tuple_(*since))
+        deleted = deleted.where(tuple_(UserTombstone.deleted_at, UserTombstone.user_id) > tuple_(*since))
+    feed = union_all(changed, deleted).subquery()
+    result = await db.execute(select(feed).order_by(feed.c.changed_at, feed.c.id).limit(limit))
+    return result.all()
+
+async def delete_expired_tombstones(db: AsyncSession, batch_size: int) -> int:
+    expired = (
+        select(UserTombstone.id)
+        .where(UserTombstone.deleted_at < tombstone_horizon())
+        .order_by(UserTombstone.deleted_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(delete(UserTombstone).where(UserTombstone.id.in_(expired)))
+    return result.rowcount
+
+async def get_user_version(db: AsyncSession, username: str):
+    """(id, updated_at) d'un utilisateur : suffisant pour calculer son ETag sans charger la ligne."""
+    stmt = select(User.id, User.updated_at).where(User.username == username)
+    return await _shared_read(db, ("user_version", username), stmt, "first")
+
+async def get_users_version(db: AsyncSession):
+    """Agrégat (count, max(updated_at)) : change dès qu'un utilisateur est ajouté, modifié ou supprimé."""
+    stmt = select(func.count(User.id), func.max(User.updated_at))
+    return await _shared_read(db, ("users_version",), stmt, "one")
+
+async def get_token_states(db: AsyncSession, usernames: Iterable[str], sids: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """
+    En une requête : username -> {sid: refresh_token_hash} des sessions actives demandées,
+    pour les utilisateurs existants. Sert à vérifier la révocation d'un lot de tokens.
+    """
+    usernames, sids = list(set(usernames)), list(set(sids))
+    if not usernames:
+        return {}
+    result = await db.execute(
+        select(User.username, UserSession.id, UserSession.refresh_token_hash)
+        .outerjoin(UserSession, and_(
+            UserSession.user_id == User.id,
+            UserSession.id.in_(sids),
+            UserSession.expires_at > datetime.datetime.utcnow(),
+        ))
+        .where(User.username.in_(usernames))
+    )
+    states: Dict[str, Dict[str, str]] = {}
+    for username, sid, token_hash in result:
+        sessions = states.setdefault(username, {})
+        if sid is not None:
+            sessions[sid] = token_hash
+    return states
+
+async def get_user_encryption_key(db: AsyncSession, username: str) -> Optional[str]:
+    result = await db.execute(select(User.encryption_key).where(User.username == username))
+    return result.scalar_one_or_none()
+
+async def rewrap_user_keys(db: AsyncSession, after_id: int, batch_size: int):
+    """
+    Ré-enveloppe avec la clé maître active les clés des `batch_size` utilisateurs suivant `after_id`.
+    Seule la colonne encryption_key change (updated_at conservé) ; la mise à jour est conditionnée
+    à l'ancienne valeur. Renvoie (clés modifiées, dernier id du lot ou None en fin de table).
+    """
+    result = await db.execute(
+        select(User.id, User.encryption_key)
+        .where(User.id > after_id, User.encryption_key.is_not(None))
+        .order_by(User.id)
+        .limit(batch_size)
+    )
+    rows = result.all()
+    if not rows:
+        return 0, None
+    users = User.__table__
+    params = [
+        {"b_id": user_id, "b_old": stored, "b_new": master_keys.wrap(master_keys.unwrap(stored))}
+        for user_id, stored in rows
+        if master_keys.needs_rewrap(stored)
+    ]
+    if params:
+        await db.execute(
+            update(users)
+            .where(users.c.id == bindparam("b_id"), users.c.encryption_key == bindparam("b_old"))
+            .values(encryption_key=bindparam("b_new"), updated_at=users.c.updated_at),
+            params
+        )
+    return len(params), rows[-1].id
+
+async def update_user_profile(
+    db: AsyncSession,
+    username: str,
+    email: Optional[str] = None,
+    hashed_password: Optional[str] = None,
+    encrypted_bio: Optional[str] = None,
+):
+    """
+    Mise à jour partielle en une seule instruction (CTE UPDATE ... RETURNING) :
+    users est modifié (updated_at toujours avancé, pour les ETags) et, si une bio est fournie,
+    user_sensitive_data est inséré ou mis à jour dans la même requête.
+    Renvoie (id, username, email, role, encryption_key, encrypted_bio) ou None si l'utilisateur n'existe pas.
+    encrypted_bio vaut la valeur précédente quand la bio n'est pas modifiée.
+    """
+    users = User.__table__
+    sensitive = UserSensitiveData.__table__
+    values = {"updated_at": datetime.datetime.utcnow()}
+    if email is not None:
+        values["email"] = email
+    if hashed_password is not None:
+        values["hashed_password"] = hashed_password
+    updated = (
+        update(users)
+        .where(users.c.username == username)
+        .values(**values)
+        .returning(users.c.id, users.c.username, users.c.email, users.c.role, users.c.encryption_key)
+        .cte("updated_user")
+    )
+    if encrypted_bio is None:
+        stmt = (
+            select(updated, sensitive.c.encrypted_bio)
+            .outerjoin(sensitive, sensitive.c.user_id == updated.c.id)
+        )
+    else:
+        upsert = pg_insert(sensitive).from_select(
+            ["user_id", "encrypted_bio"],
+            select(updated.c.id, literal(encrypted_bio))
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[sensitive.c.user_id],
+            set_={"encrypted_bio": upsert.excluded.encrypted_bio}
+        ).returning(sensitive.c.user_id)
+        stmt = select(updated, literal(encrypted_bio).label("encrypted_bio")).add_cte(upsert.cte("updated_bio"))
+    result = await db.execute(stmt)
+    row = result.first()
+    logger.debug(f"Mise à jour du profil '{username}' : {'effectuée' if row else 'utilisateur introuvable'}")
+    return row
+
 async def create_user(
     db: AsyncSession,
     username: str,
@@ -46,13 +613,14 @@ async def create_user(
     role: str = "user",
     encryption_key: Optional[str] = None,
 ) -> User:
-    if await get_user_by_username(db, username):
+    conflict = await find_user_conflict(db, username, email)
+    if conflict and conflict.username == username:
         logger.warning(f"Échec création utilisateur : username '{username}' déjà utilisé")
         raise ValueError(f"Le nom d'utilisateur '{username}' existe déjà.")
-    if await get_user_by_email(db, email):
+    if conflict:
         logger.warning(f"Échec création utilisateur : email '{email}' déjà utilisé")
         raise ValueError(f"L'email '{email}' existe déjà.")
-    hashed_password = get_password_hash(password)
+    hashed_password = await hash_password(password)
     key = encryption_key or generate_user_key()
     user = User(
         username=username,
@@ -67,12 +635,45 @@ async def create_user(
     logger.info(f"Nouvel utilisateur créé : {username} ({email})")
     return user
 
-async def authenticate_user(
-    db: AsyncSession, username: str, password: str
-) -> Optional[User]:
-    user = await get_user_by_username(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    """Profil AUTH : renvoie la ligne (id, username, role, hashed_password, encryption_key) si le mot de passe est bon."""
+    user = await get_user_auth(db, username)
+    if not user or not await check_password(password, user.hashed_password):
         logger.warning(f"Échec d'authentification pour '{username}'")
         return None
     logger.info(f"Authentification réussie pour '{username}'")
     return user
+
+AUDIT_EVENT_FIELDS = ("id", "created_at", "event_type", "actor", "target", "ip", "success", "details")
+
+async def list_audit_events(
+    db: AsyncSession,
+    limit: int,
+    before_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    actor: Optional[str] = None,
+) -> list:
+    """Événements d'audit du plus récent au plus ancien, paginés par curseur sur l'id (sans OFFSET)."""
+    stmt = select(*(getattr(AuditEvent, f) for f in AUDIT_EVENT_FIELDS)).order_by(AuditEvent.id.desc()).limit(limit)
+    if before_id is not None:
+        stmt = stmt.where(AuditEvent.id < before_id)
+    if event_type:
+        stmt = stmt.where(AuditEvent.event_type == event_type)
+    if actor:
+        stmt = stmt.where(AuditEvent.actor == actor)
+    result = await db.execute(stmt)
+    return result.all()
+
+async def record_key_rotation(db: AsyncSession, kid: str, rewrapped: int) -> int:
+    """Marque la fin d'un ré-enveloppement ; renvoie l'identifiant de la rotation."""
+    result = await db.execute(
+        insert(KeyRotation)
+        .values(kid=kid, rewrapped=rewrapped, completed_at=datetime.datetime.utcnow())
+        .returning(KeyRotation.id)
+    )
+    return result.scalar_one()
+
+async def latest_key_rotation(db: AsyncSession) -> int:
+    """Identifiant de la dernière rotation terminée (0 si aucune)."""
+    result = await db.execute(select(func.coalesce(func.max(KeyRotation.id), 0)))
+    return result.scalar_one()
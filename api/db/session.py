@@ -1,9 +1,15 @@
 import os
 import ssl
+from typing import Any, AsyncGenerator, Dict
+from uuid import uuid4
+from fastapi import Request
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeout
 from dotenv import load_dotenv
+from api.core.deadline import DeadlineExceeded, deadline_stats, statement_timeout_ms
 from api.logger import logger
 
 load_dotenv()
@@ -20,17 +26,80 @@ if not DATABASE_URL.startswith("postgresql://"):
 
 ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
+# Mode de pool : "internal" (pool SQLAlchemy par worker, connexions directes à Postgres) ou
+# "external" (derrière un pooler en mode transaction type PgBouncer : plusieurs répliques partagent
+# quelques connexions serveur). En mode external, aucun état ne doit survivre à une transaction
+# (d'où `SET LOCAL` plus bas) et les requêtes préparées ne sont ni mises en cache ni nommées par
+# numéro : d'un appel à l'autre, la connexion serveur n'est plus la même.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "internal").strip().lower()
+if DB_POOL_MODE not in ("internal", "external"):
+    logger.error("DB_POOL_MODE doit valoir internal ou external")
+    raise RuntimeError("DB_POOL_MODE doit valoir internal ou external")
+
+# Taille du pool : connexions conservées, débordement autorisé, et connexions ouvertes dès le démarrage
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Mode external : 0 = NullPool (une connexion au pooler par session), sinon petit pool sans débordement
+DB_EXTERNAL_POOL_SIZE = int(os.getenv("DB_EXTERNAL_POOL_SIZE", "0"))
+DB_POOL_MIN_SIZE = min(
+    int(os.getenv("DB_POOL_MIN_SIZE", "5")),
+    DB_POOL_SIZE if DB_POOL_MODE == "internal" else DB_EXTERNAL_POOL_SIZE,
+)
+# Attente maximale d'une connexion libre : quand la base ralentit, on répond 504 vite au lieu
+# d'empiler les requêtes derrière un pool épuisé
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+# Migrations (verrou consultatif de session, CREATE INDEX CONCURRENTLY) : connexion directe à
+# Postgres, jamais à travers un pooler en mode transaction
+DIRECT_DATABASE_URL = os.getenv("DIRECT_DATABASE_URL", DATABASE_URL)
+if not DIRECT_DATABASE_URL.startswith("postgresql://"):
+    logger.error("DIRECT_DATABASE_URL doit commencer par postgresql://")
+    raise RuntimeError("DIRECT_DATABASE_URL doit commencer par postgresql://")
+
 # Création du contexte SSL pour asyncpg
 ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
+def _prepared_statement_name() -> str:
+    return f"__asyncpg_{uuid4().hex}__"
+
+def engine_options(mode: str = DB_POOL_MODE, pool_size: int = DB_POOL_SIZE) -> Dict[str, Any]:
+    """Options de create_async_engine pour un mode de pool (partagées avec api.db.pool_bench)."""
+    options: Dict[str, Any] = {"pool_pre_ping": True, "pool_timeout": DB_POOL_TIMEOUT}
+    connect_args: Dict[str, Any] = {"ssl": ssl_context}
+    if mode == "internal":
+        options.update(pool_size=pool_size, max_overflow=DB_MAX_OVERFLOW)
+    else:
+        if pool_size > 0:
+            options.update(pool_size=pool_size, max_overflow=0)
+        else:
+            options = {"poolclass": NullPool}
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=_prepared_statement_name,
+        )
+    options["connect_args"] = connect_args
+    return options
+
 async_engine = create_async_engine(
     ASYNC_DATABASE_URL,
     echo=True,
-    pool_pre_ping=True,
-    connect_args={"ssl": ssl_context}
+    **engine_options(DB_POOL_MODE, DB_POOL_SIZE if DB_POOL_MODE == "internal" else DB_EXTERNAL_POOL_SIZE),
 )
+logger.info(f"Moteur SQLAlchemy en mode de pool '{DB_POOL_MODE}'")
+
+if DIRECT_DATABASE_URL == DATABASE_URL:
+    if DB_POOL_MODE == "external":
+        logger.warning("DB_POOL_MODE=external sans DIRECT_DATABASE_URL : les migrations passeront par le pooler")
+    direct_engine = async_engine
+else:
+    direct_engine = create_async_engine(
+        DIRECT_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+        poolclass=NullPool,
+        connect_args={"ssl": ssl_context},
+    )
 
 SessionLocal = sessionmaker(
     bind=async_engine,
@@ -38,6 +107,54 @@ SessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+# SQLSTATE query_canceled : statement_timeout atteint (ou requête annulée côté serveur)
+QUERY_CANCELED = "57014"
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection) -> None:
+    """
+    Toute transaction ouverte pendant une requête HTTP est bornée par le budget restant de la
+    requête (contextvar posée par DeadlineMiddleware) : session de la requête, mais aussi lectures
+    mutualisées et sessions de l'idempotence. SET LOCAL, jamais SET : le réglage disparaît au
+    COMMIT, y compris derrière un pooler.
+    """
+    timeout_ms = statement_timeout_ms()
+    if timeout_ms is not None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session de la requête, validée à la fin du handler et annulée en cas d'erreur.
+    Sous DeadlineMiddleware, chaque transaction reçoit `SET LOCAL statement_timeout` égal au budget
+    restant ; une requête SQL interrompue par ce délai (dans cette session ou dans une lecture
+    mutualisée attendue par la route), ou une attente de connexion au-delà de DB_POOL_TIMEOUT,
+    devient DeadlineExceeded (réponse 504).
+    """
+    async with SessionLocal() as session:
+        request.state.db = session
+        try:
+            yield session
+            await session.commit()
+        except DBAPIError as e:
+            await session.rollback()
+            if getattr(e.orig, "sqlstate", None) == QUERY_CANCELED:
+                deadline_stats.statement_timeouts += 1
+                logger.warning(f"Requête SQL interrompue par statement_timeout sur {request.url.path}")
+                raise DeadlineExceeded() from e
+            logger.exception("Erreur lors de la gestion de la session DB")
+            raise
+        except PoolTimeout as e:
+            await session.rollback()
+            deadline_stats.pool_timeouts += 1
+            logger.warning(f"Pool de connexions épuisé (> {DB_POOL_TIMEOUT}s) sur {request.url.path}")
+            raise DeadlineExceeded() from e
+        except Exception:
+            await session.rollback()
+            logger.exception("Erreur lors de la gestion de la session DB")
+            raise
+        finally:
+            await session.close()
+
 async def connect_to_db() -> None:
     """
     Utilisé par test_co_db.py pour vérifier qu'on peut pinger la base.
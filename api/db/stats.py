@@ -0,0 +1,196 @@
+"""
+Rapport des requêtes lentes, d'après pg_stat_statements et pg_stat_user_tables.
+
+    python -m api.db.stats                 # top 10 par temps total et par temps moyen
+    python -m api.db.stats --limit 20 --json
+    python -m api.db.stats --reset         # remet les statistiques par requête à zéro
+
+Les mêmes données sont servies par GET /admin/db/slow-queries. Une requête touchant une table
+surveillée (STATS_WATCHED_TABLES) est signalée quand chaque appel lit au moins
+STATS_SEQ_SCAN_PAGE_RATIO des pages de la table : c'est la signature d'un parcours complet là où
+un index était attendu (ex. une recherche de session qui ne passe plus par son index).
+Nécessite pg_stat_statements dans shared_preload_libraries (image postgres-custom) et
+l'extension créée (migration 0007) ; sinon seules les statistiques des tables sont rapportées.
+Sans le rôle pg_read_all_stats (ou superutilisateur), le texte des requêtes des autres rôles
+vaut "<insufficient privilege>" : elles sont comptées dans `hidden_queries` et ignorées par la
+détection des parcours complets.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.db.session import SessionLocal, async_engine
+from api.logger import logger
+
+STATS_TOP_LIMIT = int(os.getenv("STATS_TOP_LIMIT", "10"))
+STATS_WATCHED_TABLES = tuple(
+    t.strip() for t in os.getenv("STATS_WATCHED_TABLES", "users,user_sensitive_data").split(",") if t.strip()
+)
+# Fraction des pages d'une table lues par appel au-delà de laquelle on suspecte un parcours complet
+STATS_SEQ_SCAN_PAGE_RATIO = float(os.getenv("STATS_SEQ_SCAN_PAGE_RATIO", "0.5"))
+# En dessous de cette taille, un parcours séquentiel est le bon choix du planificateur
+STATS_SEQ_SCAN_MIN_ROWS = int(os.getenv("STATS_SEQ_SCAN_MIN_ROWS", "1000"))
+STATS_QUERY_MAX_LENGTH = 500
+HIDDEN_QUERY = "<insufficient privilege>"
+
+ORDERINGS = {"total": "total_exec_time", "mean": "mean_exec_time"}
+
+STATEMENT_COLUMNS = """
+    queryid::text AS queryid, left(query, :max_length) AS query, calls,
+    round(total_exec_time::numeric, 2)::float AS total_ms,
+    round(mean_exec_time::numeric, 3)::float AS mean_ms,
+    round(max_exec_time::numeric, 3)::float AS max_ms,
+    rows, (shared_blks_hit + shared_blks_read)::float / greatest(calls, 1) AS blocks_per_call,
+    shared_blks_read
+"""
+
+async def statements_available(db: AsyncSession) -> bool:
+    """
+    Extension créée et bibliothèque préchargée. shared_preload_libraries n'est lisible que par un
+    superutilisateur : on interroge directement la vue, dans un savepoint pour que son échec
+    (bibliothèque non chargée, droits) n'annule pas la transaction de la requête.
+    """
+    result = await db.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements')"))
+    if not result.scalar_one():
+        return False
+    try:
+        async with db.begin_nested():
+            await db.execute(text("SELECT 1 FROM pg_stat_statements LIMIT 1"))
+    except DBAPIError as e:
+        logger.warning(f"pg_stat_statements illisible : {e.orig}")
+        return False
+    return True
+
+async def top_statements(db: AsyncSession, order: str = "total", limit: int = STATS_TOP_LIMIT) -> List[Dict[str, Any]]:
+    """Requêtes normalisées de la base courante, triées par temps total ou moyen décroissant."""
+    result = await db.execute(
+        text(
+            f"SELECT {STATEMENT_COLUMNS} FROM pg_stat_statements"
+            " WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())"
+            f" ORDER BY {ORDERINGS[order]} DESC LIMIT :limit"
+        ),
+        {"max_length": STATS_QUERY_MAX_LENGTH, "limit": limit},
+    )
+    return [dict(row) for row in result.mappings()]
+
+async def table_scans(db: AsyncSession) -> List[Dict[str, Any]]:
+    """Parcours séquentiels / par index cumulés des tables surveillées."""
+    result = await db.execute(
+        text(
+            "SELECT s.relname AS table, s.seq_scan, s.seq_tup_read, coalesce(s.idx_scan, 0) AS idx_scan,"
+            " s.n_live_tup AS live_rows, c.relpages AS pages"
+            " FROM pg_stat_user_tables s JOIN pg_class c ON c.oid = s.relid"
+            " WHERE s.relname = ANY(:tables) ORDER BY s.relname"
+        ),
+        {"tables": list(STATS_WATCHED_TABLES)},
+    )
+    tables = [dict(row) for row in result.mappings()]
+    for table in tables:
+        table["seq_scan_flag"] = table["seq_scan"] > 0 and table["live_rows"] >= STATS_SEQ_SCAN_MIN_ROWS
+    return tables
+
+async def seq_scan_suspects(db: AsyncSession, tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Requêtes sur une table surveillée qui en lisent, par appel, une bonne part des pages."""
+    large = {
+        t["table"]: t for t in tables
+        if t["live_rows"] >= STATS_SEQ_SCAN_MIN_ROWS and t["pages"] > 0
+    }
+    if not large:
+        return []
+    result = await db.execute(
+        text(
+            f"SELECT {STATEMENT_COLUMNS} FROM pg_stat_statements"
+            " WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())"
+            " AND query ~* :pattern ORDER BY total_exec_time DESC LIMIT 200"
+        ),
+        {"max_length": STATS_QUERY_MAX_LENGTH, "pattern": r"\m(" + "|".join(large) + r")\M"},
+    )
+    suspects = []
+    for row in result.mappings():
+        statement = dict(row)
+        if statement["query"] == HIDDEN_QUERY:
+            continue
+        for name, table in large.items():
+            if not re.search(rf"\b{re.escape(name)}\b", statement["query"], re.IGNORECASE):
+                continue
+            if statement["blocks_per_call"] >= STATS_SEQ_SCAN_PAGE_RATIO * table["pages"]:
+                suspects.append({**statement, "table": name, "table_pages": table["pages"]})
+                break
+    return suspects
+
+async def slow_query_report(db: AsyncSession, limit: int = STATS_TOP_LIMIT) -> Dict[str, Any]:
+    tables = await table_scans(db)
+    report: Dict[str, Any] = {"available": await statements_available(db), "tables": tables}
+    if report["available"]:
+        report["top_by_total_time"] = await top_statements(db, "total", limit)
+        report["top_by_mean_time"] = await top_statements(db, "mean", limit)
+        report["seq_scan_suspects"] = await seq_scan_suspects(db, tables)
+        report["hidden_queries"] = len({
+            s["queryid"] for key in ("top_by_total_time", "top_by_mean_time") for s in report[key]
+            if s["query"] == HIDDEN_QUERY
+        })
+        if report["hidden_queries"]:
+            logger.warning(
+                f"{report['hidden_queries']} requête(s) d'autres rôles sans texte : accorder pg_read_all_stats au rôle de l'API"
+            )
+    else:
+        logger.warning("pg_stat_statements indisponible : rapport limité aux statistiques des tables")
+    return report
+
+async def reset_statements(db: AsyncSession) -> None:
+    await db.execute(text("SELECT pg_stat_statements_reset()"))
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print("Tables surveillées :")
+    for t in report["tables"]:
+        flag = "  <- parcours séquentiels" if t["seq_scan_flag"] else ""
+        print(f"  {t['table']:<22} {t['live_rows']:>10} lignes  seq_scan={t['seq_scan']:<8} idx_scan={t['idx_scan']}{flag}")
+    if not report["available"]:
+        print("\npg_stat_statements indisponible (shared_preload_libraries / migration 0007).")
+        return
+    for key, title in (("top_by_total_time", "temps total"), ("top_by_mean_time", "temps moyen")):
+        print(f"\nRequêtes les plus coûteuses ({title}) :")
+        for s in report[key]:
+            query = " ".join(s["query"].split())[:120]
+            print(f"  {s['total_ms']:>12.1f} ms  {s['mean_ms']:>9.3f} ms/appel  {s['calls']:>9} appels  {query}")
+    if report["hidden_queries"]:
+        print(f"\n{report['hidden_queries']} requête(s) d'autres rôles sans texte ({HIDDEN_QUERY}) : GRANT pg_read_all_stats.")
+    if report["seq_scan_suspects"]:
+        print("\nParcours complets suspects :")
+        for s in report["seq_scan_suspects"]:
+            query = " ".join(s["query"].split())[:120]
+            print(f"  {s['table']} : {s['blocks_per_call']:.0f}/{s['table_pages']} pages par appel  {query}")
+
+async def run(limit: int, as_json: bool, reset: bool) -> None:
+    try:
+        async with SessionLocal() as db:
+            if reset:
+                await reset_statements(db)
+                await db.commit()
+                logger.info("Statistiques pg_stat_statements remises à zéro")
+                return
+            report = await slow_query_report(db, limit)
+    finally:
+        await async_engine.dispose()
+    if as_json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rapport des requêtes lentes (pg_stat_statements)")
+    parser.add_argument("--limit", type=int, default=STATS_TOP_LIMIT, help="nombre de requêtes par classement")
+    parser.add_argument("--json", action="store_true", help="sortie JSON (même format que l'endpoint admin)")
+    parser.add_argument("--reset", action="store_true", help="remet les statistiques par requête à zéro")
+    args = parser.parse_args()
+    asyncio.run(run(args.limit, args.json, args.reset))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,62 @@
+import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from loguru import logger
 from api.db.base import init_db
+from api.db.session import async_engine
+from api.core.audit import audit_log
+from api.core.crypto import rotation_watcher
+from api.core.jobs import JOB_DRAIN_TIMEOUT, jobs
+from api.core.lifecycle import in_flight, install_sigterm_drain
+from api.core.sessions import session_sweeper
+from api.core.warmup import warm_up
 
-def register_startup_events(app: FastAPI):
-    @app.on_event("startup")
-    async def on_startup():
-        logger.info("🔄 Initialisation DB...")
-        await init_db()
+# Budget total du lifespan à l'arrêt (requêtes en cours, tâches différées, journal d'audit) :
+# stop_grace_period >= SHUTDOWN_READY_DELAY + GRACEFUL_SHUTDOWN_TIMEOUT + SHUTDOWN_DRAIN_TIMEOUT
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+# Part du budget gardée pour le dernier vidage du journal d'audit
+SHUTDOWN_AUDIT_RESERVE = float(os.getenv("SHUTDOWN_AUDIT_RESERVE", "4"))
+# Délai entre le SIGTERM (/ready en 503) et la fermeture du listener par uvicorn
+SHUTDOWN_READY_DELAY = float(os.getenv("SHUTDOWN_READY_DELAY", "5"))
 
-    @app.on_event("shutdown")
-    async def on_shutdown():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Démarrage : vérification du schéma, préchauffage (pool, requêtes chaudes, crypto/JWT),
+    journal d'audit, files de tâches différées, purge des sessions expirées et suivi des
+    rotations de clés maîtres.
+    L'application n'est déclarée prête (/ready) qu'une fois le préchauffage terminé.
+    Arrêt : dès le SIGTERM, /ready passe en 503 pendant SHUTDOWN_READY_DELAY secondes, listener
+    encore ouvert, pour que le load balancer retire l'instance ; uvicorn ferme ensuite le listener
+    et attend les connexions ouvertes. Ici, on attend les requêtes encore en cours (filet de
+    sécurité), puis les tâches différées, on écrit les derniers événements d'audit et on ferme le pool,
+    le tout dans SHUTDOWN_DRAIN_TIMEOUT secondes.
+    """
+    app.state.ready = False
+    logger.info("🔄 Initialisation DB...")
+    await init_db()
+    await warm_up()
+    audit_log.start()
+    jobs.start()
+    session_sweeper.start()
+    rotation_watcher.start()
+    app.state.ready = True
+    install_sigterm_drain(app.state, SHUTDOWN_READY_DELAY)
+    logger.info("✅ Application prête")
+    try:
+        yield
+    finally:
+        app.state.ready = False
         logger.info("👋 Application shutting down")
+        deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+
+        def left(reserve: float = 0.0) -> float:
+            return max(deadline - time.monotonic() - reserve, 0.0)
+
+        await in_flight.drain(left(SHUTDOWN_AUDIT_RESERVE))
+        await session_sweeper.stop(min(10.0, left(SHUTDOWN_AUDIT_RESERVE)))
+        await rotation_watcher.stop(min(5.0, left(SHUTDOWN_AUDIT_RESERVE)))
+        await jobs.drain(min(JOB_DRAIN_TIMEOUT, left(SHUTDOWN_AUDIT_RESERVE)))
+        await audit_log.stop(left())
+        await async_engine.dispose()
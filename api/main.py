@@ -1,18 +1,62 @@
-from fastapi import FastAPI
-import uvicorn
-from api.events import register_startup_events
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from api.events import lifespan
+from api.core.lifecycle import InFlightMiddleware
+from api.core.idempotency import IdempotencyMiddleware
+from api.core.deadline import DeadlineExceeded, DeadlineMiddleware, deadline_stats
+from api.core.compression import CompressionMiddleware, parse_route_levels
+from api.core.ratelimit import RateLimitExceeded, ServiceOverloaded, retry_after_header
 from api.users.routes import router as users_router
 from api.admin.routes import router as admin_router
-from api.auth.routes import router as auth_router
+from api.auth.routes import router as auth_router, wellknown_router
 import os
 
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "5"))
+# Niveau par préfixe de route, ex. "/admin=6,/users=3" (0 = pas de compression)
+COMPRESSION_ROUTE_LEVELS = parse_route_levels(os.getenv("COMPRESSION_ROUTE_LEVELS", "/admin=6"))
+
 app = FastAPI(
     title="FastAPI Xtrem (100% async)",
     description="API utilisateurs/sécurité, toute en async.",
-    version="0.2.0-async"
+    version="0.2.0-async",
+    lifespan=lifespan
+)
+
+# Au plus près des routes : les réponses enregistrées sont non compressées, puis encodées à chaque rejeu
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    level=COMPRESSION_LEVEL,
+    route_levels=COMPRESSION_ROUTE_LEVELS
 )
+# Dans InFlightMiddleware : une requête annulée (échéance, client parti) sort aussitôt du décompte
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(InFlightMiddleware)
 
-register_startup_events(app)
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests"},
+        headers=retry_after_header(exc.retry_after)
+    )
+
+@app.exception_handler(ServiceOverloaded)
+async def overloaded_handler(request: Request, exc: ServiceOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service overloaded, retry later"},
+        headers=retry_after_header(exc.retry_after)
+    )
+
+@app.exception_handler(TimeoutError)
+async def timeout_handler(request: Request, exc: TimeoutError):
+    # statement_timeout (DeadlineExceeded) ou lecture mutualisée trop longue
+    if not isinstance(exc, DeadlineExceeded):
+        deadline_stats.timeouts += 1
+    return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
 
 @app.get("/", tags=["Root"])
 async def read_root() -> dict:
@@ -22,9 +66,17 @@ async def read_root() -> dict:
 async def health() -> dict:
     return {"status": "ok"}
 
+@app.get("/ready", tags=["Monitoring"])
+async def ready(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
 app.include_router(users_router, prefix="/users", tags=["Users"])
 app.include_router(admin_router, prefix="/admin", tags=["Admin"])
 app.include_router(auth_router, prefix="/auth", tags=["Auth"])
+app.include_router(wellknown_router)
 
 if __name__ == "__main__":
-    uvicorn.run("api.main:app", host="0.0.0.0", port=8000, reload=True)
+    from api.server import main
+    main()
@@ -0,0 +1,80 @@
+"""
+Point d'entrée du serveur HTTP.
+
+    python -m api.server                      # production : N workers, sans rechargement
+    API_ENV=development python -m api.server  # développement : 1 process avec --reload
+"""
+import importlib.util
+import inspect
+import os
+
+import uvicorn
+
+from api.logger import logger
+
+API_ENV = os.getenv("API_ENV", "production").lower()
+HOST = os.getenv("API_HOST", "0.0.0.0")
+PORT = int(os.getenv("API_PORT", "8000"))
+
+# 0 = un worker par cœur disponible
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+# Recyclage d'un worker après N requêtes (0 = jamais) pour borner la mémoire ; le jitter évite
+# que tous les workers redémarrent en même temps
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000"))
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+KEEP_ALIVE_TIMEOUT = int(os.getenv("KEEP_ALIVE_TIMEOUT", "5"))
+
+def cpu_count() -> int:
+    """Nombre de cœurs réellement utilisables (affinité CPU du conteneur si disponible)."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(len(os.sched_getaffinity(0)), 1)
+    return os.cpu_count() or 1
+
+def worker_count() -> int:
+    return WEB_CONCURRENCY if WEB_CONCURRENCY > 0 else cpu_count()
+
+def _event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def _http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+def run_development() -> None:
+    logger.info("Démarrage en mode développement (1 process, rechargement automatique)")
+    uvicorn.run(
+        "api.main:app",
+        host=HOST,
+        port=PORT,
+        reload=True,
+        reload_dirs=[os.path.dirname(os.path.abspath(__file__))],
+    )
+
+def run_production() -> None:
+    workers = worker_count()
+    options = dict(
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=_event_loop(),
+        http=_http_protocol(),
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+        limit_max_requests=WORKER_MAX_REQUESTS or None,
+    )
+    if WORKER_MAX_REQUESTS and "limit_max_requests_jitter" in inspect.signature(uvicorn.Config).parameters:
+        options["limit_max_requests_jitter"] = WORKER_MAX_REQUESTS_JITTER
+    logger.info(
+        f"Démarrage en production : {workers} worker(s), loop={options['loop']}, http={options['http']}, "
+        f"recyclage après {WORKER_MAX_REQUESTS or '∞'} requêtes"
+    )
+    uvicorn.run("api.main:app", **options)
+
+def main() -> None:
+    if API_ENV in ("development", "dev"):
+        run_development()
+    else:
+        run_production()
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,56 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Header, Request, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import or_
-from sqlalchemy.future import select
-from typing import AsyncGenerator
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
 
-from api.db.session import SessionLocal
-from api.db.schemas import UserCreate, UserOut, UserLogin
-from api.db.services import create_user, authenticate_user, get_user_by_username
-from api.db.models import User, UserSensitiveData
+from api.db.session import SessionLocal, get_db
+from api.db.schemas import UserCreate, UserOut, UserLogin, UserUpdate
+from api.db.services import (
+    create_user, authenticate_user, find_user_conflict, get_user_profile, get_user_role, get_user_version,
+    get_user_encryption_key, create_session, revoke_session, update_user_profile, hash_password,
+    needs_rehash, replace_password_hash
+)
+from api.db.models import UserSensitiveData
 from api.core.crypto import encrypt_sensitive_data, decrypt_sensitive_data
-from api.core.tokens import create_access_token
+from api.core.tokens import create_access_token, decode_token, hash_token, new_session_id
+from api.core.audit import audit_log
+from api.core.jobs import jobs
+from api.core.ratelimit import client_ip, limit_login, limit_register
+from api.core.http_cache import cache_headers, is_not_modified, make_etag, not_modified
 from api.logger import logger
 import os
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 router = APIRouter()
+optional_bearer = HTTPBearer(auto_error=False)
 
-async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
-    async with SessionLocal() as session:
-        request.state.db = session
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            logger.exception("Erreur lors de la gestion de la session DB")
-            raise
-        finally:
-            await session.close()
+# Durée de vie maximale de la tâche de re-hash, qui porte le mot de passe en clair
+PASSWORD_JOB_TTL = float(os.getenv("PASSWORD_JOB_TTL", "30"))
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db),
-    x_user: str = Header(...)
-) -> User:
-    user = await get_user_by_username(db, x_user)
-    if not user:
-        logger.warning(f"Échec d'authentification de l'utilisateur via header : {x_user}")
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                            detail="User not authenticated")
-    return user
+async def _rehash_password_job(user_id: int, username: str, password: str, old_hash: str) -> None:
+    """
+    Tâche différée : nouveau hash au coût BCRYPT_ROUNDS. Seul ce calcul voit le mot de passe ;
+    l'écriture (et ses nouveaux essais) part dans une tâche séparée qui ne porte que le hash.
+    """
+    new_hash = await hash_password(password)
+    jobs.submit("default", _store_password_hash_job, user_id, username, new_hash, old_hash)
+
+async def _store_password_hash_job(user_id: int, username: str, new_hash: str, old_hash: str) -> None:
+    async with SessionLocal() as session:
+        updated = await replace_password_hash(session, user_id, new_hash, old_hash)
+        await session.commit()
+    logger.info(f"Hash du mot de passe de {username} {'mis à jour' if updated else 'inchangé (modifié entre-temps)'}")
 
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 async def register_user(
     user: UserCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
-    exists = await db.execute(
-        select(User).where(
-            or_(User.username == user.username, User.email == user.email)
-        )
-    )
-    if exists.scalars().first():
+    limit_register(request)
+    if await find_user_conflict(db, user.username, user.email):
         logger.warning(f"Tentative de création d'utilisateur avec username/email déjà utilisé : {user.username}/{user.email}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Username or email already registered")
@@ -60,6 +60,7 @@ async def register_user(
     db.add(sd)
     await db.commit()
     await db.refresh(new_user)
+    await audit_log.record("user.register", actor=new_user.username, target=new_user.id, ip=client_ip(request))
     logger.info(f"Nouvel utilisateur enregistré : {new_user.username} ({new_user.email})")
     return UserOut(
         id=new_user.id,
@@ -72,40 +73,45 @@ async def register_user(
 @router.post("/login")
 async def login(
     user: UserLogin,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
+    limit_login(request, user.username)
     db_user = await authenticate_user(db, user.username, user.password)
     if not db_user:
         logger.warning(f"Échec de login pour {user.username}")
+        await audit_log.record("auth.login", actor=user.username, ip=client_ip(request), success=False)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Invalid credentials")
     scopes = ["admin", "read:profile", "write:profile"] if db_user.role == "admin" else ["read:profile"]
     access_delta = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)))
+    sid = new_session_id()
     access_token = create_access_token(
-        data={"sub": db_user.username, "role": db_user.role, "scopes": scopes},
+        data={"sub": db_user.username, "role": db_user.role, "scopes": scopes, "sid": sid},
         expires_delta=access_delta
     )
     refresh_delta = timedelta(days=int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7)))
     refresh_token = create_access_token(
         data={"sub": db_user.username, "role": db_user.role,
-              "scopes": scopes, "type": "refresh"},
+              "scopes": scopes, "type": "refresh", "sid": sid},
         expires_delta=refresh_delta
     )
-    encrypted_rt = encrypt_sensitive_data(refresh_token, db_user.encryption_key)
-    if db_user.sensitive_data:
-        db_user.sensitive_data.encrypted_refresh_token = encrypted_rt
-    else:
-        sd = UserSensitiveData(
-            user_id=db_user.id,
-            encrypted_bio="",
-            encrypted_refresh_token=encrypted_rt
-        )
-        db.add(sd)
-    logger.debug(f"LOGIN: refresh_token = {repr(refresh_token)}")
-    logger.debug(f"LOGIN: encrypted_rt = {repr(encrypted_rt)}")
-    logger.debug(f"LOGIN: db_user.encryption_key = {repr(db_user.encryption_key)}")
+    # Une session par appareil : les autres sessions de l'utilisateur restent valides
+    await create_session(
+        db, db_user.id, sid, hash_token(refresh_token),
+        expires_at=datetime.utcnow() + refresh_delta,
+        user_agent=request.headers.get("user-agent"),
+        ip=client_ip(request),
+    )
     await db.commit()
-    await db.refresh(db_user)
+    await audit_log.record("auth.login", actor=db_user.username, target=db_user.id, ip=client_ip(request),
+                           details={"sid": sid})
+    if needs_rehash(db_user.hashed_password):
+        # Hors du chemin critique : la réponse part sans attendre le nouveau calcul bcrypt
+        jobs.submit(
+            "passwords", _rehash_password_job, db_user.id, db_user.username, user.password, db_user.hashed_password,
+            ttl=PASSWORD_JOB_TTL,
+        )
     logger.info(f"Utilisateur connecté : {db_user.username}")
     return {
         "access_token": access_token,
@@ -116,20 +122,51 @@ async def login(
     }
 
 @router.post("/logout")
-async def logout():
+async def logout(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    db: AsyncSession = Depends(get_db)
+):
+    """Ferme la session (claim `sid`) du token fourni, access ou refresh ; sans token, ne fait rien."""
+    if credentials:
+        try:
+            payload = decode_token(credentials.credentials)
+        except JWTError:
+            payload = {}
+        sid = payload.get("sid")
+        if sid and await revoke_session(db, sid):
+            await db.commit()
+            await audit_log.record("auth.logout", actor=payload.get("sub"), ip=client_ip(request), details={"sid": sid})
+            logger.info(f"Session {sid} fermée pour {payload.get('sub')}")
     logger.info("Déconnexion utilisateur (endpoint appelé)")
     return {"message": "Logout successful"}
 
 @router.get("/profile", response_model=UserOut)
 async def get_profile(
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    x_user: str = Header(...)
 ):
+    # Version (id, updated_at) lue seule d'abord : un 304 ne charge ni l'utilisateur ni sa bio
+    version = await get_user_version(db, x_user)
+    if not version:
+        logger.warning(f"Échec d'authentification de l'utilisateur via header : {x_user}")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="User not authenticated")
+    etag = make_etag("profile", version.id, version.updated_at)
+    headers = cache_headers(etag, version.updated_at)
+    if is_not_modified(request, etag, version.updated_at):
+        logger.debug(f"Profil inchangé pour {x_user} (304)")
+        return not_modified(headers)
+    current_user = await get_user_profile(db, x_user)
+    if not current_user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="User not authenticated")
+    response.headers.update(headers)
     bio = None
-    if current_user.sensitive_data:
-        bio = decrypt_sensitive_data(
-            current_user.sensitive_data.encrypted_bio,
-            current_user.encryption_key
-        )
+    if current_user.encrypted_bio is not None:
+        bio = decrypt_sensitive_data(current_user.encrypted_bio, current_user.encryption_key)
     logger.info(f"Consultation du profil utilisateur : {current_user.username}")
     return UserOut(
         id=current_user.id,
@@ -138,3 +175,63 @@ async def get_profile(
         bio=bio,
         role=current_user.role
     )
+
+@router.patch("/profile", response_model=UserOut)
+async def update_profile(
+    changes: UserUpdate,
+    db: AsyncSession = Depends(get_db),
+    x_user: str = Header(...)
+):
+    """
+    Mise à jour partielle du profil en une instruction : la bio n'est re-chiffrée que si elle est
+    fournie (seule la clé de l'utilisateur est alors lue) ; le mot de passe n'est re-hashé (hors
+    boucle asyncio) que s'il est fourni, après vérification que l'utilisateur existe.
+    """
+    if changes.email is None and changes.password is None and changes.bio is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="No changes provided")
+    # L'existence de l'utilisateur est vérifiée avant tout bcrypt : un username inconnu
+    # ne consomme pas de place dans la file des calculs de mot de passe
+    encrypted_bio = None
+    if changes.bio is not None:
+        key = await get_user_encryption_key(db, x_user)
+        if key is None:
+            logger.warning(f"Échec d'authentification de l'utilisateur via header : {x_user}")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="User not authenticated")
+        encrypted_bio = encrypt_sensitive_data(changes.bio, key)
+    hashed_password = None
+    if changes.password is not None:
+        if encrypted_bio is None and await get_user_role(db, x_user) is None:
+            logger.warning(f"Échec d'authentification de l'utilisateur via header : {x_user}")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="User not authenticated")
+        hashed_password = await hash_password(changes.password)
+    try:
+        row = await update_user_profile(
+            db, x_user,
+            email=changes.email,
+            hashed_password=hashed_password,
+            encrypted_bio=encrypted_bio
+        )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        logger.warning(f"Mise à jour du profil de {x_user} refusée : email déjà utilisé ({changes.email})")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Email already registered")
+    if not row:
+        logger.warning(f"Échec d'authentification de l'utilisateur via header : {x_user}")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="User not authenticated")
+    bio = changes.bio
+    if bio is None and row.encrypted_bio:
+        bio = decrypt_sensitive_data(row.encrypted_bio, row.encryption_key)
+    logger.info(f"Profil mis à jour : {row.username} (champs : {sorted(changes.model_dump(exclude_none=True))})")
+    return UserOut(
+        id=row.id,
+        username=row.username,
+        email=row.email,
+        bio=bio,
+        role=row.role
+    )
@@ -7,6 +7,8 @@ import ssl
 
 from dotenv import load_dotenv
 
+from api.core.retry import backoff_delay
+
 try:
     import asyncpg
 except ImportError:
@@ -15,9 +17,14 @@ except ImportError:
 
 load_dotenv()
 
+BACKOFF_BASE = float(os.environ.get("DB_CONNECT_BACKOFF_BASE", "0.25"))
+BACKOFF_MAX = float(os.environ.get("DB_CONNECT_BACKOFF_MAX", "10"))
+
 def wait_for_port(host: str, port: int, timeout: int = 60):
     start = time.monotonic()
+    attempt = 0
     while True:
+        attempt += 1
         try:
             with socket.create_connection((host, port), timeout=2):
                 print(f"[wait_for_db] Database TCP port is open at {host}:{port}")
@@ -26,8 +33,9 @@ def wait_for_port(host: str, port: int, timeout: int = 60):
             if time.monotonic() - start > timeout:
                 print(f"[wait_for_db] Timeout: Database TCP port not available after {timeout} seconds.", file=sys.stderr)
                 sys.exit(1)
-            print(f"[wait_for_db] Waiting for database TCP port at {host}:{port}... ({e})")
-            time.sleep(2)
+            delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX)
+            print(f"[wait_for_db] Waiting for database TCP port at {host}:{port}... ({e}) retry in {delay:.2f}s")
+            time.sleep(delay)
 
 async def wait_for_pgsql(dsn: str, ssl_ctx, user: str, timeout: int = 60):
     start = time.monotonic()
@@ -47,8 +55,9 @@ async def wait_for_pgsql(dsn: str, ssl_ctx, user: str, timeout: int = 60):
             if time.monotonic() - start > timeout:
                 print(f"[wait_for_db] Timeout: Database not ready for SQL after {timeout} seconds.\nLast error: {e}", file=sys.stderr)
                 sys.exit(1)
-            print(f"[wait_for_db] Waiting for database SQL connection... ({e})")
-            await asyncio.sleep(2)
+            delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX)
+            print(f"[wait_for_db] Waiting for database SQL connection... ({e}) retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
 
 if __name__ == "__main__":
     db_host = os.environ.get("DB_HOST", "db")
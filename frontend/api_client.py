@@ -0,0 +1,158 @@
+import importlib.util
+import os
+import random
+import time
+import uuid
+
+import httpx
+import streamlit as st
+from frontend.logger import logger
+
+API_URL = os.getenv("API_URL", "http://api:8000")
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+# HTTP/2 seulement si demandé et si le paquet h2 est installé (utile derrière un reverse proxy)
+API_HTTP2 = os.getenv("API_HTTP2", "false").lower() == "true"
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "0.2"))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "2"))
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+SESSION_KEYS = ["user", "role", "access_token", "refresh_token"]
+
+@st.cache_resource
+def get_client() -> httpx.Client:
+    """Client HTTP partagé par toutes les sessions Streamlit : pool de connexions keep-alive vers l'API."""
+    http2 = API_HTTP2 and importlib.util.find_spec("h2") is not None
+    logger.info(f"Création du client HTTP vers {API_URL} (http2={http2})")
+    return httpx.Client(
+        base_url=API_URL,
+        timeout=API_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=API_MAX_CONNECTIONS,
+            max_keepalive_connections=API_MAX_CONNECTIONS,
+            keepalive_expiry=30,
+        ),
+    )
+
+def auth_headers() -> dict:
+    headers = {}
+    if "user" in st.session_state:
+        headers["X-User"] = st.session_state["user"]
+    if st.session_state.get("access_token"):
+        headers["Authorization"] = f"Bearer {st.session_state['access_token']}"
+    return headers
+
+def forwarded_headers() -> dict:
+    """
+    X-Forwarded-For avec l'adresse du navigateur : sans lui, l'API voit tous les utilisateurs
+    sous l'adresse du conteneur frontend (limites de débit et journal d'audit communs).
+    L'API ne l'honore que si le frontend figure dans TRUSTED_PROXIES.
+    """
+    try:
+        context = st.context
+        chain = context.headers.get("X-Forwarded-For")
+        ip = getattr(context, "ip_address", None)
+    except Exception:
+        # Hors exécution d'un script Streamlit (pas de contexte de session)
+        return {}
+    hops = [h for h in (chain, ip) if h]
+    return {"X-Forwarded-For": ", ".join(hops)} if hops else {}
+
+def clear_session(*extra_keys: str) -> None:
+    for k in SESSION_KEYS + list(extra_keys):
+        st.session_state.pop(k, None)
+
+def logout(*extra_keys: str) -> None:
+    """Ferme la session côté API (au mieux, sans bloquer la déconnexion locale) puis vide la session Streamlit."""
+    token = st.session_state.get("refresh_token") or st.session_state.get("access_token")
+    if token:
+        try:
+            get_client().post("/users/logout", headers={**forwarded_headers(), "Authorization": f"Bearer {token}"})
+        except httpx.RequestError as e:
+            logger.warning(f"Fermeture de la session côté API impossible : {e}")
+    clear_session(*extra_keys)
+
+def refresh_tokens() -> bool:
+    """Rotation du couple access/refresh via /auth/refresh ; False si la session n'est plus valide."""
+    refresh_token = st.session_state.get("refresh_token")
+    if not refresh_token:
+        return False
+    resp = request(
+        "POST", "/auth/refresh", auth=False, idempotent=True,
+        headers={"Authorization": f"Bearer {refresh_token}"},
+    )
+    if resp.status_code != 200:
+        logger.warning(f"Échec du rafraîchissement des tokens pour {st.session_state.get('user')} : {resp.status_code}")
+        return False
+    data = resp.json()
+    st.session_state["access_token"] = data["access_token"]
+    st.session_state["refresh_token"] = data["refresh_token"]
+    logger.info(f"Tokens rafraîchis pour {st.session_state.get('user')}")
+    return True
+
+def _retry_delay(attempt: int, resp=None) -> float:
+    if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+        return min(float(resp.headers["Retry-After"]), API_BACKOFF_MAX)
+    return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * (2 ** attempt)))
+
+def request(
+    method: str, path: str, auth: bool = True, retry: bool = None, idempotent: bool = False, **kwargs
+) -> httpx.Response:
+    """
+    Appel à l'API via le client partagé.
+    - erreurs réseau et 429/502/503/504 : nouvelles tentatives avec backoff (méthodes idempotentes par défaut) ;
+    - idempotent=True : un Idempotency-Key commun à tous les essais rend le POST rejouable sans effet double ;
+    - 401 sur un appel authentifié : rafraîchissement transparent des tokens puis un nouvel essai.
+    Lève httpx.RequestError si l'API reste injoignable.
+    """
+    method = method.upper()
+    extra_headers = kwargs.pop("headers", {})
+    if idempotent:
+        extra_headers = {"Idempotency-Key": uuid.uuid4().hex, **extra_headers}
+    retry = (method in IDEMPOTENT_METHODS or idempotent) if retry is None else retry
+    client = get_client()
+    refreshed = False
+    attempt = 0
+    while True:
+        headers = {**forwarded_headers(), **(auth_headers() if auth else {}), **extra_headers}
+        try:
+            resp = client.request(method, path, headers=headers, **kwargs)
+        except httpx.TransportError as e:
+            if not retry or attempt >= API_MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning(f"Erreur réseau sur {method} {path} ({e}), nouvel essai dans {delay:.2f}s")
+            attempt += 1
+            time.sleep(delay)
+            continue
+        if resp.status_code == 401 and auth and not refreshed and refresh_tokens():
+            refreshed = True
+            continue
+        if resp.status_code in RETRYABLE_STATUS and retry and attempt < API_MAX_RETRIES:
+            delay = _retry_delay(attempt, resp)
+            logger.warning(f"{method} {path} -> {resp.status_code}, nouvel essai dans {delay:.2f}s")
+            attempt += 1
+            time.sleep(delay)
+            continue
+        return resp
+
+def get(path: str, **kwargs) -> httpx.Response:
+    return request("GET", path, **kwargs)
+
+def post(path: str, **kwargs) -> httpx.Response:
+    return request("POST", path, **kwargs)
+
+def patch(path: str, **kwargs) -> httpx.Response:
+    return request("PATCH", path, **kwargs)
+
+def delete(path: str, **kwargs) -> httpx.Response:
+    return request("DELETE", path, **kwargs)
+
+def error_detail(resp: httpx.Response) -> str:
+    try:
+        return resp.json().get("detail", resp.text)
+    except ValueError:
+        return resp.text
@@ -1,15 +1,12 @@
-import os
 import httpx
 import streamlit as st
+from frontend import api_client
 from frontend.logger import logger
 
-API_URL = os.getenv("API_URL", "http://api:8000")
-
 # Bouton déconnexion si déjà connecté
 if "user" in st.session_state:
     if st.sidebar.button("Déconnexion"):
-        for k in ["user", "role", "access_token", "refresh_token"]:
-            st.session_state.pop(k, None)
+        api_client.logout()
         logger.info("Utilisateur déconnecté via l'interface login.")
 
 st.title("FastAPI Xtrem – Connexion / Inscription")
@@ -23,10 +20,11 @@ if page == "Connexion":
         submitted = st.form_submit_button("Se connecter")
     if submitted:
         try:
-            resp = httpx.post(
-                f"{API_URL}/users/login",
+            resp = api_client.post(
+                "/users/login",
                 json={"username": username, "password": password},
-                timeout=10,
+                auth=False,
+                idempotent=True,
             )
             if resp.status_code == 200:
                 data = resp.json()
@@ -37,7 +35,7 @@ if page == "Connexion":
                 st.session_state["refresh_token"] = data.get("refresh_token")
                 logger.info(f"Connexion réussie pour l'utilisateur {username}")
             else:
-                err = resp.json().get("detail", resp.text)
+                err = api_client.error_detail(resp)
                 st.error(f"Échec de la connexion : {err}")
                 logger.warning(f"Échec de la connexion pour {username} : {err}")
         except httpx.RequestError as e:
@@ -58,14 +56,15 @@ elif page == "Inscription":
             logger.warning(f"Échec inscription : mots de passe non concordants pour {new_username}")
         else:
             try:
-                resp = httpx.post(
-                    f"{API_URL}/users/register",
+                resp = api_client.post(
+                    "/users/register",
                     json={
                         "username": new_username,
                         "email": new_email,
                         "password": new_password,
                     },
-                    timeout=10,
+                    auth=False,
+                    idempotent=True,
                 )
                 if resp.status_code == 201:
                     st.success(f"Inscription réussie ! Bienvenue {new_username} 🎉")
@@ -73,7 +72,7 @@ elif page == "Inscription":
                     st.session_state["role"] = ""
                     logger.info(f"Inscription réussie pour {new_username}")
                 else:
-                    err = resp.json().get("detail", resp.text)
+                    err = api_client.error_detail(resp)
                     st.error(f"Échec de l'inscription : {err}")
                     logger.warning(f"Échec inscription pour {new_username} : {err}")
             except httpx.RequestError as e:
@@ -1,14 +1,11 @@
-import os
 import httpx
 import streamlit as st
+from frontend import api_client
 from frontend.logger import logger
 
-API_URL = os.getenv("API_URL", "http://api:8000")
-
 # ——— Bouton de déconnexion unique ———
 if "user" in st.session_state and st.sidebar.button("Se déconnecter", key="logout"):
-    for k in ["user", "role", "access_token", "refresh_token"]:
-        st.session_state.pop(k, None)
+    api_client.logout()
     logger.info("Utilisateur déconnecté depuis la page profil.")
     st.stop()
 
@@ -41,24 +38,12 @@ if submitted:
             logger.info(f"Aucune modification envoyée pour le profil de {st.session_state['user']}")
         else:
             try:
-                headers = {
-                    "X-User": st.session_state["user"],
-                    "Authorization": f"Bearer {st.session_state['access_token']}"
-                }
-                resp = httpx.patch(
-                    f"{API_URL}/users/profile",
-                    json=update_data,
-                    headers=headers,
-                    timeout=10,
-                )
+                resp = api_client.patch("/users/profile", json=update_data)
                 if resp.status_code == 200:
                     st.success("Profil mis à jour avec succès.")
                     logger.info(f"Profil mis à jour pour {st.session_state['user']}")
                 else:
-                    try:
-                        detail = resp.json().get("detail", resp.text)
-                    except ValueError:
-                        detail = resp.text
+                    detail = api_client.error_detail(resp)
                     st.error(f"Échec de la mise à jour : {detail}")
                     logger.warning(f"Échec mise à jour profil pour {st.session_state['user']} : {detail}")
             except httpx.RequestError as e:
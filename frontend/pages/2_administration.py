@@ -1,14 +1,71 @@
+import math
 import os
+
 import httpx
+import pandas as pd
 import streamlit as st
+from frontend import api_client
 from frontend.logger import logger
 
-API_URL = os.getenv("API_URL", "http://api:8000")
+ADMIN_PAGE_SIZES = [25, 50, 100, 250]
+# Durée de vie des pages en cache : au-delà, la page est redemandée à l'API
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "30"))
+
+class AdminApiError(Exception):
+    pass
+
+class AdminSessionExpired(Exception):
+    pass
+
+@st.cache_data(ttl=ADMIN_CACHE_TTL, show_spinner=False, max_entries=200)
+def fetch_users_page(admin: str, token: int, page_size: int, query: str, _headers: dict):
+    """
+    Une page d'utilisateurs, le total côté serveur et le jeton de la page suivante (None en fin de
+    liste) ; `admin` fait partie de la clé de cache. Liste : jeton = after_id (pagination par clé) ;
+    recherche : jeton = offset (résultats classés par pertinence).
+    Fonction pure de ses arguments : les en-têtes d'authentification sont fournis par l'appelant
+    (hors clé de cache) et rien n'est écrit dans st.session_state ; un 401 est remonté sans rafraîchir.
+    """
+    path = "/admin/users"
+    params = {"limit": page_size}
+    if query:
+        # Recherche classée par pertinence (préfixe, sous-chaîne, similarité)
+        path = "/admin/users/search"
+        params.update(q=query, offset=token)
+    elif token:
+        params["after_id"] = token
+    resp = api_client.get(path, params=params, auth=False, headers=_headers)
+    if resp.status_code == 401:
+        raise AdminSessionExpired()
+    if resp.status_code != 200:
+        raise AdminApiError(api_client.error_detail(resp))
+    users = resp.json()
+    total = int(resp.headers.get("X-Total-Count", len(users)))
+    if query:
+        next_token = token + page_size if token + page_size < total else None
+    else:
+        next_after_id = resp.headers.get("X-Next-After-Id")
+        next_token = int(next_after_id) if next_after_id else None
+    logger.debug(f"Page des utilisateurs récupérée ({len(users)}/{total}, jeton={token}, q={query!r})")
+    return users, total, next_token
+
+def load_users_page(token: int, page_size: int, query: str):
+    """Page via le cache ; le rafraîchissement des tokens (qui modifie la session) se fait ici, hors cache."""
+    admin = st.session_state["user"]
+    try:
+        return fetch_users_page(admin, token, page_size, query, api_client.auth_headers())
+    except AdminSessionExpired:
+        if not api_client.refresh_tokens():
+            raise AdminApiError("Session expirée, veuillez vous reconnecter.")
+    try:
+        return fetch_users_page(admin, token, page_size, query, api_client.auth_headers())
+    except AdminSessionExpired:
+        raise AdminApiError("Session expirée, veuillez vous reconnecter.")
 
 # ——— Bouton de déconnexion unique ———
 if "user" in st.session_state and st.sidebar.button("Se déconnecter", key="logout"):
-    for k in ["user", "role", "access_token", "refresh_token"]:
-        st.session_state.pop(k, None)
+    api_client.logout("to_delete")
+    fetch_users_page.clear()
     logger.info("Utilisateur déconnecté depuis la page admin.")
     st.stop()
 
@@ -24,56 +81,100 @@ if st.session_state.get("role") != "admin":
     st.stop()
 
 st.title("Administration - Liste des Utilisateurs")
-headers = {
-    "X-User": st.session_state["user"],
-    "Authorization": f"Bearer {st.session_state['access_token']}"
-}
+if "admin_flash" in st.session_state:
+    st.success(st.session_state.pop("admin_flash"))
 
-# ——— Récupération de la liste des utilisateurs ———
+# ——— Recherche et pagination côté serveur ———
+c_search, c_size = st.columns([3, 1])
+query = c_search.text_input("Rechercher (username ou email)", key="admin_query").strip()
+page_size = c_size.selectbox("Par page", ADMIN_PAGE_SIZES, index=1, key="admin_page_size")
+# Jetons des pages visitées (after_id ou offset) : précédent = dépiler, suivant = empiler.
+# Nouvelle recherche ou nouvelle taille de page : retour à la première page
+if st.session_state.get("admin_page_key") != (query, page_size):
+    st.session_state["admin_page_key"] = (query, page_size)
+    st.session_state["admin_tokens"] = [0]
+
+tokens = st.session_state["admin_tokens"]
+page = len(tokens)
 try:
-    resp = httpx.get(f"{API_URL}/admin/users", headers=headers, timeout=10)
-    if resp.status_code != 200:
-        err = resp.json().get("detail", resp.text)
-        st.error(f"Erreur lors de la récupération : {err}")
-        logger.warning(f"Erreur lors de la récupération des utilisateurs : {err}")
-        st.stop()
-    users = resp.json()
-    if not users:
-        st.info("Aucun utilisateur trouvé.")
-        logger.info("Aucun utilisateur trouvé dans l'administration.")
-        st.stop()
+    users, total, next_token = load_users_page(tokens[-1], page_size, query)
+except AdminApiError as e:
+    st.error(f"Erreur lors de la récupération : {e}")
+    logger.warning(f"Erreur lors de la récupération des utilisateurs : {e}")
+    st.stop()
 except httpx.RequestError as e:
     st.error(f"Erreur réseau : {e}")
     logger.error(f"Erreur réseau lors de la récupération des utilisateurs : {e}")
     st.stop()
 
-# ——— Affichage + boutons de suppression ———
-st.write("**Cliquer sur ❌ pour supprimer un utilisateur**")
-for u in users:
-    col1, col2 = st.columns([4,1])
-    col1.write(f"{u['username']} — {u['email']} — rôle : {u['role']}")
-    if col2.button("❌", key=f"del_{u['id']}"):
-        st.session_state["to_delete"] = u["id"]
-    # Confirmation en bas de la ligne
-    if st.session_state.get("to_delete") == u["id"]:
-        st.warning(f"Êtes-vous sûr de vouloir supprimer **{u['username']}** ? Cette action est irréversible.")
-        c1, c2 = st.columns(2)
-        if c1.button("Oui", key=f"yes_{u['id']}"):
-            dresp = httpx.delete(f"{API_URL}/admin/users/{u['id']}", headers=headers, timeout=10)
-            if dresp.status_code == 204:
-                st.success(f"Utilisateur {u['username']} supprimé.")
-                logger.info(f"Utilisateur {u['username']} (id={u['id']}) supprimé par admin {st.session_state['user']}")
-                st.session_state.pop("to_delete", None)
-                st.stop() # stop + reload auto
-            else:
-                try:
-                    derr = dresp.json().get("detail", dresp.text)
-                except ValueError:
-                    derr = dresp.text
-                st.error(f"Échec de la suppression : {derr}")
-                logger.warning(f"Échec suppression utilisateur {u['username']} (id={u['id']}) : {derr}")
-        if c2.button("Annuler", key=f"no_{u['id']}"):
-            st.session_state.pop("to_delete", None)
-            st.info("Suppression annulée.")
-            logger.info(f"Suppression annulée pour l'utilisateur {u['username']}")
+if not users and page > 1:
+    # La page courante est vide (suppressions) : retour à la page précédente
+    tokens.pop()
+    st.rerun()
 
+page_count = max(1, math.ceil(total / page_size))
+c_prev, c_info, c_next = st.columns([1, 3, 1])
+if c_prev.button("◀ Précédente", disabled=page == 1, key="admin_prev"):
+    tokens.pop()
+    st.rerun()
+if c_next.button("Suivante ▶", disabled=next_token is None, key="admin_next"):
+    tokens.append(next_token)
+    st.rerun()
+c_info.caption(f"{total} utilisateur(s) — page {page}/{page_count}")
+
+if not users:
+    st.info("Aucun utilisateur trouvé.")
+    logger.info("Aucun utilisateur trouvé dans l'administration.")
+    st.stop()
+
+# ——— Tableau avec sélection multiple ———
+df = pd.DataFrame(users, columns=["id", "username", "email", "role", "bio"])
+df.insert(0, "sélection", False)
+edited = st.data_editor(
+    df,
+    hide_index=True,
+    use_container_width=True,
+    disabled=["id", "username", "email", "role", "bio"],
+    column_config={"sélection": st.column_config.CheckboxColumn("Sélection", default=False)},
+    key=f"admin_table_{page}_{page_size}_{query}",
+)
+selected = edited.loc[edited["sélection"], ["id", "username"]]
+selected_ids = [int(i) for i in selected["id"]]
+own_id = next((u["id"] for u in users if u["username"] == st.session_state["user"]), None)
+
+# ——— Suppression par lot avec confirmation ———
+if st.button(f"Supprimer la sélection ({len(selected_ids)})", disabled=not selected_ids):
+    st.session_state["to_delete"] = selected_ids
+
+to_delete = st.session_state.get("to_delete")
+if to_delete and own_id in to_delete:
+    st.error("Votre propre compte fait partie de la sélection : l'API refusera la suppression.")
+    st.session_state.pop("to_delete", None)
+    to_delete = None
+if to_delete:
+    names = ", ".join(selected.loc[selected["id"].isin(to_delete), "username"]) or f"{len(to_delete)} utilisateur(s)"
+    st.warning(f"Êtes-vous sûr de vouloir supprimer **{names}** ? Cette action est irréversible.")
+    c1, c2 = st.columns(2)
+    if c1.button("Oui", key="confirm_delete"):
+        try:
+            dresp = api_client.post("/admin/users/bulk-delete", json={"ids": to_delete})
+        except httpx.RequestError as e:
+            st.error(f"Erreur réseau : {e}")
+            logger.error(f"Erreur réseau lors de la suppression par lot : {e}")
+            st.stop()
+        if dresp.status_code == 200:
+            deleted = dresp.json()["deleted"]
+            logger.info(f"Utilisateurs {deleted} supprimés par admin {st.session_state['user']}")
+            st.session_state.pop("to_delete", None)
+            # Les pages en cache ne reflètent plus la base
+            fetch_users_page.clear()
+            st.session_state["admin_flash"] = f"{len(deleted)} utilisateur(s) supprimé(s)."
+            st.rerun()
+        else:
+            derr = api_client.error_detail(dresp)
+            st.error(f"Échec de la suppression : {derr}")
+            logger.warning(f"Échec de la suppression par lot {to_delete} : {derr}")
+    if c2.button("Annuler", key="cancel_delete"):
+        st.session_state.pop("to_delete", None)
+        st.info("Suppression annulée.")
+        logger.info(f"Suppression annulée pour les utilisateurs {to_delete}")
@@ -7,3 +7,4 @@ cp /tmp/server.crt "$PGDATA/server.crt"
 cp /tmp/server.key "$PGDATA/server.key"
 chmod 600 "$PGDATA/server.key"
 chown postgres:postgres "$PGDATA/server.key" "$PGDATA/server.crt" "$PGDATA/pg_hba.conf" "$PGDATA/postgresql.conf"
+/usr/local/bin/tune-resources.sh
@@ -0,0 +1,14 @@
+#!/bin/bash
+# Point d'entrée de l'image : sur une base déjà initialisée, réapplique la configuration livrée
+# dans l'image et recalcule memory.conf avant de passer la main au point d'entrée officiel.
+# (Premier démarrage : c'est init-custom.sh qui s'en charge, après initdb.)
+set -e
+
+PGDATA="${PGDATA:-/var/lib/postgresql/data}"
+if [ -s "$PGDATA/PG_VERSION" ]; then
+    cp /tmp/postgresql.conf "$PGDATA/postgresql.conf"
+    chown postgres:postgres "$PGDATA/postgresql.conf"
+    /usr/local/bin/tune-resources.sh
+fi
+
+exec docker-entrypoint.sh "$@"
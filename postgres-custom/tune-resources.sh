@@ -0,0 +1,66 @@
+#!/bin/bash
+# Calcule les paramètres mémoire / parallélisme de Postgres d'après les ressources du conteneur
+# et les écrit dans $PGDATA/memory.conf (inclus par postgresql.conf).
+#   PG_MEMORY_MB       mémoire à considérer (défaut : limite cgroup, sinon mémoire de l'hôte)
+#   PG_MAX_CONNECTIONS connexions maximales (défaut : 100)
+set -e
+
+PGDATA="${PGDATA:-/var/lib/postgresql/data}"
+host_bytes=$(awk '/MemTotal/ {printf "%d", $2 * 1024}' /proc/meminfo)
+limit_bytes=""
+if [ -r /sys/fs/cgroup/memory.max ]; then
+    limit_bytes=$(cat /sys/fs/cgroup/memory.max)                    # cgroup v2
+elif [ -r /sys/fs/cgroup/memory/memory.limit_in_bytes ]; then
+    limit_bytes=$(cat /sys/fs/cgroup/memory/memory.limit_in_bytes)  # cgroup v1
+fi
+# Pas de limite (« max » ou valeur supérieure à la mémoire de l'hôte) : mémoire de l'hôte
+if [ -z "$limit_bytes" ] || [ "$limit_bytes" = "max" ] || [ "$limit_bytes" -gt "$host_bytes" ]; then
+    limit_bytes=$host_bytes
+fi
+
+mem_mb=${PG_MEMORY_MB:-$((limit_bytes / 1024 / 1024))}
+max_connections=${PG_MAX_CONNECTIONS:-100}
+cpus=$(nproc)
+
+shared_buffers=$((mem_mb / 4))
+effective_cache_size=$((mem_mb * 3 / 4))
+maintenance_work_mem=$((mem_mb / 16))
+[ "$maintenance_work_mem" -gt 2048 ] && maintenance_work_mem=2048
+[ "$maintenance_work_mem" -lt 64 ] && maintenance_work_mem=64
+# Un tri / hachage peut utiliser work_mem plusieurs fois par requête : marge de 3 par connexion
+work_mem=$(((mem_mb - shared_buffers) / (max_connections * 3)))
+[ "$work_mem" -lt 4 ] && work_mem=4
+parallel_per_gather=$((cpus / 2))
+[ "$parallel_per_gather" -lt 1 ] && parallel_per_gather=1
+[ "$parallel_per_gather" -gt 4 ] && parallel_per_gather=4
+worker_processes=$((cpus < 8 ? 8 : cpus))
+
+# Les hachages parallèles vivent dans /dev/shm (mémoire partagée dynamique) : jusqu'à
+# work_mem x hash_mem_multiplier (2) par processus participant. Docker ne donne que 64 Mo par
+# défaut (shm_size) : on borne work_mem pour que tous les workers parallèles et leurs leaders
+# tiennent dans la moitié de /dev/shm, et on coupe le parallélisme si même 4 Mo n'y tiennent pas.
+shm_mb=$(df -Pm /dev/shm 2>/dev/null | awk 'NR == 2 {print $2}')
+if [ -n "$shm_mb" ]; then
+    participants=$((cpus + cpus / parallel_per_gather))
+    shm_work_mem=$((shm_mb / 2 / (2 * participants)))
+    if [ "$shm_work_mem" -lt 4 ]; then
+        parallel_per_gather=0
+    elif [ "$work_mem" -gt "$shm_work_mem" ]; then
+        work_mem=$shm_work_mem
+    fi
+fi
+
+cat > "$PGDATA/memory.conf" <<CONF
+# Généré par tune-resources.sh au démarrage : ${mem_mb} Mo, ${cpus} CPU, /dev/shm ${shm_mb:-?} Mo. Ne pas modifier à la main.
+max_connections = ${max_connections}
+shared_buffers = ${shared_buffers}MB
+effective_cache_size = ${effective_cache_size}MB
+maintenance_work_mem = ${maintenance_work_mem}MB
+work_mem = ${work_mem}MB
+max_worker_processes = ${worker_processes}
+max_parallel_workers = ${cpus}
+max_parallel_workers_per_gather = ${parallel_per_gather}
+max_parallel_maintenance_workers = ${parallel_per_gather}
+CONF
+chown postgres:postgres "$PGDATA/memory.conf" 2>/dev/null || true
+echo "tune-resources : ${mem_mb} Mo / ${cpus} CPU / shm ${shm_mb:-?} Mo -> shared_buffers=${shared_buffers}MB work_mem=${work_mem}MB parallel_per_gather=${parallel_per_gather}"
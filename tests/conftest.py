@@ -5,7 +5,9 @@ import asyncio
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 import api.db.base as db_base
+import api.db.migrate as db_migrate
 import api.db.session as db_sess
 from tests.logger import logger  # <-- Ajout du logger
 
@@ -31,11 +33,12 @@ db_sess.SessionLocal = TestingSessionLocal
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def setup_database():
     logger.info("Initialisation de la base de test")
-    await db_base.init_db()
+    await db_migrate.upgrade()
     yield
     logger.info("Nettoyage de la base de test")
     async with engine.begin() as conn:
         await conn.run_sync(db_base.Base.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
 
 @pytest_asyncio.fixture
 async def async_client():
@@ -1,8 +1,12 @@
 import pytest
+import asyncio
 import pytest_asyncio
+from datetime import datetime, timedelta
 from uuid import uuid4
+from sqlalchemy import update
 from api.core.crypto import generate_user_key
-from api.db.services import create_user
+from api.db.models import User, UserTombstone
+from api.db.services import FEED_SAFETY_LAG, create_user
 from tests.logger import logger
 
 @pytest_asyncio.fixture
@@ -48,3 +52,187 @@ async def test_delete_user(async_client, admin_user, normal_user):
     resp2 = await async_client.get("/admin/users", headers=headers)
     assert normal_user.username not in [u["username"] for u in resp2.json()]
     logger.info(f"Suppression de l'utilisateur {normal_user.username} vérifiée par l'admin {admin_user.username}")
+
+@pytest.mark.asyncio
+async def test_list_users_conditional_get(async_client, admin_user, normal_user):
+    headers = {"X-User": admin_user.username}
+    resp = await async_client.get("/admin/users", headers=headers)
+    assert resp.status_code == 200, resp.text
+    etag = resp.headers["ETag"]
+    resp2 = await async_client.get("/admin/users", headers={**headers, "If-None-Match": etag})
+    assert resp2.status_code == 304
+    assert resp2.content == b""
+    await async_client.delete(f"/admin/users/{normal_user.id}", headers=headers)
+    resp3 = await async_client.get("/admin/users", headers={**headers, "If-None-Match": etag})
+    assert resp3.status_code == 200
+    assert resp3.headers["ETag"] != etag
+    logger.info("Revalidation ETag de la liste des utilisateurs vérifiée")
+
+@pytest.mark.asyncio
+async def test_list_users_paginated(async_client, admin_user, normal_user):
+    headers = {"X-User": admin_user.username}
+    resp = await async_client.get("/admin/users", params={"limit": 1}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert len(resp.json()) == 1
+    assert int(resp.headers["X-Total-Count"]) >= 2
+    next_after_id = resp.headers["X-Next-After-Id"]
+    assert next_after_id == str(resp.json()[0]["id"])
+    assert 'rel="next"' in resp.headers["Link"] and f"after_id={next_after_id}" in resp.headers["Link"]
+    resp2 = await async_client.get("/admin/users", params={"limit": 1, "after_id": next_after_id}, headers=headers)
+    assert resp2.json()[0]["id"] > resp.json()[0]["id"]
+    assert resp2.headers["ETag"] != resp.headers["ETag"]
+    # Suivre les pages jusqu'à l'absence de X-Next-After-Id lit toute la table
+    seen, params = [], {"limit": 1}
+    while True:
+        page = await async_client.get("/admin/users", params=params, headers=headers)
+        seen.extend(u["id"] for u in page.json())
+        if "X-Next-After-Id" not in page.headers:
+            break
+        params["after_id"] = page.headers["X-Next-After-Id"]
+    assert seen == sorted(seen) and len(seen) == int(resp.headers["X-Total-Count"])
+    resp3 = await async_client.get("/admin/users", params={"q": normal_user.username.upper()}, headers=headers)
+    assert [u["username"] for u in resp3.json()] == [normal_user.username]
+    assert resp3.headers["X-Total-Count"] == "1"
+    logger.info("Pagination et filtre de la liste des utilisateurs vérifiés")
+
+@pytest.mark.asyncio
+async def test_bulk_delete_users(async_client, admin_user, normal_user):
+    headers = {"X-User": admin_user.username}
+    resp = await async_client.post(
+        "/admin/users/bulk-delete", json={"ids": [normal_user.id, 999999]}, headers=headers
+    )
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["deleted"] == [normal_user.id]
+    resp2 = await async_client.get("/admin/users", headers=headers)
+    assert normal_user.username not in [u["username"] for u in resp2.json()]
+    own = await async_client.post("/admin/users/bulk-delete", json={"ids": [admin_user.id]}, headers=headers)
+    assert own.status_code == 400
+    own_single = await async_client.delete(f"/admin/users/{admin_user.id}", headers=headers)
+    assert own_single.status_code == 400
+    logger.info(f"Suppression par lot de {normal_user.username} vérifiée, auto-suppression refusée")
+
+def _before_horizon(extra_seconds: float) -> datetime:
+    # Antidater plutôt qu'attendre FEED_SAFETY_LAG : la ligne est déjà derrière l'horizon du flux
+    return datetime.utcnow() - timedelta(seconds=FEED_SAFETY_LAG + extra_seconds)
+
+@pytest.mark.asyncio
+async def test_user_change_feed(async_client, db_session, admin_user, normal_user):
+    headers = {"X-User": admin_user.username}
+    await db_session.execute(
+        update(User).where(User.id.in_([admin_user.id, normal_user.id])).values(updated_at=_before_horizon(10))
+    )
+    await db_session.commit()
+    first = await async_client.get("/admin/users/changes", params={"limit": 1}, headers=headers)
+    assert first.status_code == 200, first.text
+    cursor = first.json()["next_cursor"]
+    seen = {c["id"]: c["op"] for c in first.json()["changes"]}
+    while True:
+        resp = await async_client.get("/admin/users/changes", params={"since": cursor, "limit": 1}, headers=headers)
+        page = resp.json()
+        seen.update({c["id"]: c["op"] for c in page["changes"]})
+        cursor = page["next_cursor"]
+        if not page["has_more"]:
+            break
+    assert seen[admin_user.id] == "upsert" and seen[normal_user.id] == "upsert"
+
+    # Une suppression apparaît après le curseur courant, sous forme de tombe
+    await async_client.delete(f"/admin/users/{normal_user.id}", headers=headers)
+    await db_session.execute(
+        update(UserTombstone).where(UserTombstone.user_id == normal_user.id).values(deleted_at=_before_horizon(5))
+    )
+    await db_session.commit()
+    resp = await async_client.get("/admin/users/changes", params={"since": cursor}, headers=headers)
+    changes = resp.json()["changes"]
+    assert [(c["id"], c["op"]) for c in changes] == [(normal_user.id, "delete")]
+    as_tuple = lambda c: tuple(map(int, c.split("-")))
+    assert as_tuple(resp.json()["next_cursor"]) > as_tuple(cursor)
+    # Page vide : le curseur avance quand même jusqu'à l'horizon du flux
+    cursor = resp.json()["next_cursor"]
+    empty = await async_client.get("/admin/users/changes", params={"since": cursor}, headers=headers)
+    assert empty.json()["changes"] == [] and empty.json()["has_more"] is False
+    assert as_tuple(empty.json()["next_cursor"]) > as_tuple(cursor)
+    assert as_tuple(empty.json()["next_cursor"])[1] == 0
+    bad = await async_client.get("/admin/users/changes", params={"since": "pas-un-curseur"}, headers=headers)
+    assert bad.status_code == 400
+    logger.info("Flux de modifications des utilisateurs vérifié (modifications, suppression, pagination)")
+
+@pytest.mark.asyncio
+async def test_search_users_ranked(async_client, admin_user, normal_user):
+    headers = {"X-User": admin_user.username}
+    suffix = normal_user.username.split("_", 1)[1]
+    # Préfixe, insensible à la casse
+    resp = await async_client.get("/admin/users/search", params={"q": "BOB_"}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert normal_user.username in [u["username"] for u in resp.json()]
+    # Sous-chaîne : l'égalité exacte passe avant les autres correspondances
+    resp2 = await async_client.get("/admin/users/search", params={"q": suffix}, headers=headers)
+    assert resp2.status_code == 200, resp2.text
+    assert [u["username"] for u in resp2.json()][0] == normal_user.username
+    resp3 = await async_client.get("/admin/users/search", params={"q": normal_user.email}, headers=headers)
+    assert resp3.json()[0]["id"] == normal_user.id
+    assert int(resp3.headers["X-Total-Count"]) >= 1
+    resp4 = await async_client.get("/admin/users/search", params={"q": "zzz_introuvable_zzz"}, headers=headers)
+    assert resp4.json() == []
+    assert resp4.headers["X-Total-Count"] == "0"
+    logger.info("Recherche admin par préfixe, sous-chaîne et email vérifiée")
+
+@pytest.mark.asyncio
+async def test_audit_log_records_auth_and_admin_events(async_client, admin_user, normal_user):
+    headers = {"X-User": admin_user.username}
+    resp = await async_client.post("/users/login", json={"username": normal_user.username, "password": "BobPass!23"})
+    assert resp.status_code == 200, resp.text
+    resp = await async_client.delete(f"/admin/users/{normal_user.id}", headers=headers)
+    assert resp.status_code == 204, resp.text
+    # Écriture différée : on attend le prochain lot
+    events = []
+    for _ in range(20):
+        page = await async_client.get("/admin/audit", params={"actor": admin_user.username}, headers=headers)
+        assert page.status_code == 200, page.text
+        events = page.json()["events"]
+        if events:
+            break
+        await asyncio.sleep(0.25)
+    assert events and events[0]["event_type"] == "admin.user_delete"
+    assert events[0]["target"] == str(normal_user.id)
+    logins = await async_client.get(
+        "/admin/audit", params={"actor": normal_user.username, "event_type": "auth.login"}, headers=headers
+    )
+    assert logins.json()["events"][0]["success"] is True
+    first = await async_client.get("/admin/audit", params={"limit": 1}, headers=headers)
+    cursor = first.json()["next_before_id"]
+    assert cursor is not None
+    second = await async_client.get("/admin/audit", params={"limit": 1, "before_id": cursor}, headers=headers)
+    assert all(e["id"] < cursor for e in second.json()["events"])
+    logger.info("Journal d'audit vérifié (login, suppression admin, pagination par curseur)")
+
+@pytest.mark.asyncio
+async def test_runtime_metrics(async_client, admin_user, normal_user):
+    resp = await async_client.get("/admin/metrics", headers={"X-User": admin_user.username})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert {"default", "passwords"} <= set(data["jobs"])
+    assert data["jobs"]["passwords"]["maxsize"] > 0
+    assert "pending" in data["audit"]
+    assert data["key_cache"]["capacity"] >= 0
+    assert {"calls", "shared", "timeouts"} <= set(data["user_reads"])
+    assert {"timeouts", "statement_timeouts", "cancelled_on_disconnect"} <= set(data["deadlines"])
+    denied = await async_client.get("/admin/metrics", headers={"X-User": normal_user.username})
+    assert denied.status_code == 401
+    logger.info("Métriques d'exécution exposées aux admins uniquement")
+
+@pytest.mark.asyncio
+async def test_slow_query_report(async_client, admin_user, normal_user):
+    resp = await async_client.get("/admin/db/slow-queries?limit=5", headers={"X-User": admin_user.username})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert {t["table"] for t in data["tables"]} == {"users", "user_sensitive_data"}
+    assert all("seq_scan_flag" in t for t in data["tables"])
+    if data["available"]:
+        assert len(data["top_by_total_time"]) <= 5
+        assert {"query", "calls", "total_ms", "mean_ms"} <= set(data["top_by_mean_time"][0])
+        assert isinstance(data["seq_scan_suspects"], list)
+        assert data["hidden_queries"] >= 0
+        assert all(s["query"] != "<insufficient privilege>" for s in data["seq_scan_suspects"])
+    denied = await async_client.get("/admin/db/slow-queries", headers={"X-User": normal_user.username})
+    assert denied.status_code == 401
+    logger.info("Rapport des requêtes lentes exposé aux admins uniquement")
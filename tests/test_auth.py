@@ -1,5 +1,14 @@
 import pytest
 import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from jose import jwt
+from sqlalchemy import func, select, update
+import api.db.services as services
+from api.core.crypto import generate_user_key
+from api.core.sessions import SessionSweeper
+from api.db.models import IdempotencyKey, UserSession
 from tests.logger import logger
 
 @pytest.mark.asyncio
@@ -54,3 +63,216 @@ async def test_login_and_refresh_cycle(async_client):
     )
     assert resp3.status_code == 401
     logger.info("Ancien refresh token invalidé comme attendu pour 'eve'")
+
+@pytest.mark.asyncio
+async def test_jwks_exposes_signing_key(async_client):
+    resp = await async_client.post("/users/register", json={
+        "username": "jwksuser", "email": "jwks@example.com", "password": "JwksPass!23"
+    })
+    assert resp.status_code == 201, resp.text
+    resp = await async_client.post("/users/login", json={"username": "jwksuser", "password": "JwksPass!23"})
+    access = resp.json()["access_token"]
+    kid = jwt.get_unverified_header(access)["kid"]
+
+    jwks = await async_client.get("/.well-known/jwks.json")
+    assert jwks.status_code == 200
+    assert "max-age" in jwks.headers["Cache-Control"]
+    keys = {k["kid"]: k for k in jwks.json()["keys"]}
+    assert kid in keys
+    claims = jwt.decode(access, keys[kid], algorithms=[keys[kid]["alg"]])
+    assert claims["sub"] == "jwksuser"
+    logger.info("Vérification hors ligne d'un access token via le JWKS réussie")
+
+@pytest.mark.asyncio
+async def test_batch_introspection(async_client):
+    secret = os.getenv("INTROSPECTION_SECRET")
+    if not secret:
+        pytest.skip("INTROSPECTION_SECRET non défini")
+    await async_client.post("/users/register", json={
+        "username": "gateway_user", "email": "gw@example.com", "password": "GwPass!23"
+    })
+    tok = (await async_client.post("/users/login", json={"username": "gateway_user", "password": "GwPass!23"})).json()
+    headers = {"X-Introspection-Secret": secret}
+
+    resp = await async_client.post("/auth/introspect", headers=headers, json={
+        "tokens": [tok["access_token"], tok["refresh_token"], "not-a-jwt"]
+    })
+    assert resp.status_code == 200, resp.text
+    access, refresh, garbage = resp.json()["results"]
+    assert access["active"] and access["sub"] == "gateway_user" and access["token_type"] == "access"
+    assert refresh["active"] and refresh["token_type"] == "refresh"
+    assert not garbage["active"]
+    assert 0 < resp.json()["ttl"] <= access["cache_ttl"]
+
+    await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {tok['refresh_token']}"})
+    resp = await async_client.post("/auth/introspect", headers=headers, json={
+        "tokens": [tok["refresh_token"]], "scopes": ["read:profile"]
+    })
+    assert resp.json()["results"][0]["active"] is False
+
+    resp = await async_client.post("/auth/introspect", headers={"X-Introspection-Secret": "wrong"}, json={"tokens": ["x"]})
+    assert resp.status_code == 401
+
+@pytest.mark.asyncio
+async def test_sessions_per_device(async_client):
+    payload = {"username": "trent", "email": "trent@example.com", "password": "TrentPass!23"}
+    resp = await async_client.post("/users/register", json=payload)
+    assert resp.status_code == 201, resp.text
+    creds = {"username": "trent", "password": "TrentPass!23"}
+    laptop = (await async_client.post("/users/login", json=creds)).json()
+    phone = (await async_client.post("/users/login", json=creds)).json()
+    # Un second login n'invalide pas la première session
+    resp = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {laptop['refresh_token']}"})
+    assert resp.status_code == 200, resp.text
+    laptop = resp.json()
+    resp = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {phone['refresh_token']}"})
+    assert resp.status_code == 200, resp.text
+    # Déconnexion du laptop : sa session seule est fermée
+    resp = await async_client.post("/users/logout", headers={"Authorization": f"Bearer {laptop['access_token']}"})
+    assert resp.status_code == 200
+    resp = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {laptop['refresh_token']}"})
+    assert resp.status_code == 401
+    logger.info("Sessions par appareil et déconnexion ciblée vérifiées pour 'trent'")
+
+@pytest.mark.asyncio
+async def test_refresh_token_reuse_revokes_session(async_client):
+    payload = {"username": "mallory", "email": "mallory@example.com", "password": "MalloryPass!23"}
+    await async_client.post("/users/register", json=payload)
+    tok = (await async_client.post("/users/login", json={"username": "mallory", "password": "MalloryPass!23"})).json()
+    rotated = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {tok['refresh_token']}"})
+    assert rotated.status_code == 200, rotated.text
+    # Rejeu immédiat (réponse perdue, onglet concurrent) : fenêtre de grâce, la session reste ouverte
+    retried = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {tok['refresh_token']}"})
+    assert retried.status_code == 200, retried.text
+    # Le token d'origine n'est plus ni courant ni précédent : la session entière est fermée
+    replay = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {tok['refresh_token']}"})
+    assert replay.status_code == 401
+    for token in (rotated.json()["refresh_token"], retried.json()["refresh_token"]):
+        resp = await async_client.post("/auth/refresh", headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 401
+    logger.info("Réutilisation d'un refresh token détectée et session fermée pour 'mallory'")
+
+@pytest.mark.asyncio
+async def test_idempotent_refresh_and_register(async_client):
+    # Clés uniques : les réponses restent aussi dans la mémoire des workers entre deux exécutions
+    reg_key, refresh_key = uuid.uuid4().hex, uuid.uuid4().hex
+    payload = {"username": "idem", "email": "idem@example.com", "password": "IdemPass!23"}
+    first = await async_client.post("/users/register", json=payload, headers={"Idempotency-Key": reg_key})
+    assert first.status_code == 201, first.text
+    replay = await async_client.post("/users/register", json=payload, headers={"Idempotency-Key": reg_key})
+    assert replay.status_code == 201
+    assert replay.json() == first.json()
+    assert replay.headers.get("Idempotent-Replayed") == "true"
+    other = await async_client.post(
+        "/users/register", json={**payload, "username": "idem2"}, headers={"Idempotency-Key": reg_key}
+    )
+    assert other.status_code == 422
+
+    resp = await async_client.post("/users/login", json={"username": "idem", "password": "IdemPass!23"})
+    refresh = resp.json()["refresh_token"]
+    headers = {"Authorization": f"Bearer {refresh}", "Idempotency-Key": refresh_key}
+    # Deux essais concurrents puis un essai tardif : une seule rotation, la même paire de tokens
+    results = await asyncio.gather(
+        async_client.post("/auth/refresh", headers=headers),
+        async_client.post("/auth/refresh", headers=headers),
+    )
+    late = await async_client.post("/auth/refresh", headers=headers)
+    assert all(r.status_code == 200 for r in (*results, late)), [r.text for r in results]
+    assert len({r.json()["refresh_token"] for r in (*results, late)}) == 1
+    rotated = await async_client.post(
+        "/auth/refresh", headers={"Authorization": f"Bearer {late.json()['refresh_token']}"}
+    )
+    assert rotated.status_code == 200
+    logger.info("Rejeu idempotent de /users/register et /auth/refresh vérifié")
+
+@pytest.mark.asyncio
+async def test_idempotency_table_holds_no_secrets(async_client, db_session):
+    payload = {"username": "sealed", "email": "sealed@example.com", "password": "SealedPass!23"}
+    await async_client.post("/users/register", json=payload)
+    resp = await async_client.post(
+        "/users/login", json={"username": "sealed", "password": "SealedPass!23"},
+        headers={"Idempotency-Key": uuid.uuid4().hex},
+    )
+    assert resp.status_code == 200, resp.text
+    rows = (await db_session.execute(select(IdempotencyKey.fingerprint, IdempotencyKey.response_body))).all()
+    # Ni le token émis (réponse chiffrée ou non conservée), ni une empreinte recalculable du mot de passe
+    for fingerprint, body in rows:
+        assert resp.json()["refresh_token"].encode() not in (body or b"")
+        assert b"SealedPass!23" not in (body or b"")
+    logger.info("Aucun token ni mot de passe en clair dans idempotency_keys")
+
+async def _session_owner(db_session):
+    unique = uuid.uuid4().hex[:8]
+    return await services.create_user(
+        db_session,
+        username=f"sess_{unique}",
+        email=f"sess_{unique}@example.com",
+        password="SessPass!23",
+        encryption_key=generate_user_key(),
+    )
+
+@pytest.mark.asyncio
+async def test_session_cap_closes_oldest(db_session, monkeypatch):
+    monkeypatch.setattr(services, "MAX_SESSIONS_PER_USER", 3)
+    user = await _session_owner(db_session)
+    # Dates de création antidatées et croissantes : la session qu'on vient d'ouvrir reste la plus récente
+    start = datetime.utcnow() - timedelta(hours=1)
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    closed = []
+    for i in range(5):
+        closed.append(await services.create_session(
+            db_session, user.id, f"sid{i}-{user.id}", f"{i:064d}", expires_at
+        ))
+        await db_session.execute(
+            update(UserSession).where(UserSession.id == f"sid{i}-{user.id}")
+            .values(created_at=start + timedelta(seconds=i))
+        )
+    await db_session.commit()
+    assert closed == [0, 0, 0, 1, 1]
+    sids = (await db_session.execute(
+        select(UserSession.id).where(UserSession.user_id == user.id).order_by(UserSession.created_at)
+    )).scalars().all()
+    assert sids == [f"sid{i}-{user.id}" for i in (2, 3, 4)]
+    logger.info("Plafond de sessions : les plus anciennes sont fermées")
+
+@pytest.mark.asyncio
+async def test_delete_expired_sessions_by_batch(db_session):
+    user = await _session_owner(db_session)
+    now = datetime.utcnow()
+    for i in range(5):
+        db_session.add(UserSession(
+            id=f"old{i}-{user.id}", user_id=user.id, refresh_token_hash=f"{i:064d}",
+            expires_at=now - timedelta(minutes=1),
+        ))
+    db_session.add(UserSession(
+        id=f"live-{user.id}", user_id=user.id, refresh_token_hash="f" * 64, expires_at=now + timedelta(days=1),
+    ))
+    await db_session.commit()
+    assert await services.delete_expired_sessions(db_session, 3) == 3
+    assert await services.delete_expired_sessions(db_session, 3) == 2
+    assert await services.delete_expired_sessions(db_session, 3) == 0
+    await db_session.commit()
+    remaining = (await db_session.execute(
+        select(UserSession.id).where(UserSession.user_id == user.id)
+    )).scalars().all()
+    assert remaining == [f"live-{user.id}"]
+
+@pytest.mark.asyncio
+async def test_sweeper_purges_without_start(db_session):
+    user = await _session_owner(db_session)
+    now = datetime.utcnow()
+    for i in range(7):
+        db_session.add(UserSession(
+            id=f"exp{i}-{user.id}", user_id=user.id, refresh_token_hash=f"{i:064d}",
+            expires_at=now - timedelta(minutes=1),
+        ))
+    await db_session.commit()
+    # Lots de 2 : plusieurs transactions courtes pour un même passage, sans start() préalable
+    sweeper = SessionSweeper(interval=0, batch_size=2, pause=0)
+    assert await sweeper.sweep() >= 7
+    assert sweeper.deleted >= 7
+    count = (await db_session.execute(
+        select(func.count()).select_from(UserSession).where(UserSession.user_id == user.id)
+    )).scalar_one()
+    assert count == 0
+    logger.info("Purge des sessions expirées par lots")
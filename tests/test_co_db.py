@@ -1,5 +1,8 @@
 import pytest
-from api.db.session import connect_to_db
+from sqlalchemy.pool import NullPool
+from api.db.session import connect_to_db, engine_options
+from api.db.base import init_db, get_schema_version
+from api.db.migrate import get_head_revision
 from tests.logger import logger
 
 @pytest.mark.asyncio
@@ -9,3 +12,20 @@ async def test_database_connection_does_not_fail():
     except Exception as e:
         logger.error(f"Échec de la connexion à la DB : {e}")
         pytest.fail(f"Échec de la connexion à la DB : {e}")
+
+@pytest.mark.asyncio
+async def test_schema_version_matches_head():
+    assert await get_schema_version() == get_head_revision()
+    await init_db(max_retries=1)
+
+def test_external_pool_mode_options():
+    options = engine_options("external", 0)
+    assert options["poolclass"] is NullPool
+    connect_args = options["connect_args"]
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    # Noms uniques : pas de collision entre clients qui partagent une connexion serveur du pooler
+    name = connect_args["prepared_statement_name_func"]
+    assert name() != name()
+    small = engine_options("external", 3)
+    assert small["pool_size"] == 3 and small["max_overflow"] == 0
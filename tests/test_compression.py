@@ -0,0 +1,177 @@
+import gzip
+import zlib
+
+import pytest
+from starlette.datastructures import Headers
+
+from api.core.compression import ENCODERS, CompressionMiddleware, choose_encoding
+from tests.logger import logger
+
+LARGE_BODY = b'{"users": [' + b",".join(b'{"id": %d, "username": "user%d"}' % (i, i) for i in range(200)) + b"]}"
+
+def _app(body: bytes, content_type: str = "application/json", extra_headers=()):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+        headers.extend(extra_headers)
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+async def _call(app, path: str = "/users", accept_encoding: str = "gzip"):
+    """Appelle l'application ASGI directement : corps brut, sans décodage par le client HTTP."""
+    scope = {
+        "type": "http", "method": "GET", "path": path,
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    headers = Headers(raw=messages[0]["headers"])
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return headers, body
+
+@pytest.mark.asyncio
+async def test_minimum_size_threshold():
+    middleware = CompressionMiddleware(_app(b'{"ok": true}'), minimum_size=1024)
+    headers, body = await _call(middleware)
+    assert "content-encoding" not in headers
+    assert body == b'{"ok": true}'
+
+    middleware = CompressionMiddleware(_app(LARGE_BODY), minimum_size=1024)
+    headers, body = await _call(middleware)
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(body) < len(LARGE_BODY)
+    assert gzip.decompress(body) == LARGE_BODY
+    logger.info("Compression au-delà de minimum_size uniquement")
+
+def test_negotiation_order():
+    expected_best = next(iter(ENCODERS))
+    assert choose_encoding("gzip, br, zstd") == expected_best
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("*") == expected_best
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+    # La qualité demandée par le client passe avant la préférence du serveur
+    assert choose_encoding("zstd;q=0.1, br;q=0.2, gzip") == "gzip"
+    assert choose_encoding("gzip;q=0, br;q=0, zstd;q=0") is None
+    if "br" in ENCODERS:
+        assert choose_encoding("gzip, br") == "br"
+    if "zstd" in ENCODERS:
+        assert list(ENCODERS)[:1] == ["zstd"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", list(ENCODERS))
+async def test_each_encoding_round_trips(encoding):
+    headers, body = await _call(CompressionMiddleware(_app(LARGE_BODY)), accept_encoding=encoding)
+    assert headers["content-encoding"] == encoding
+    if encoding == "gzip":
+        decoded = gzip.decompress(body)
+    elif encoding == "br":
+        import brotli
+        decoded = brotli.decompress(body)
+    else:
+        import zstandard
+        decoded = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    assert decoded == LARGE_BODY
+
+@pytest.mark.asyncio
+async def test_skips_encoded_and_excluded_content_types():
+    already = _app(LARGE_BODY, extra_headers=[(b"content-encoding", b"br")])
+    headers, body = await _call(CompressionMiddleware(already))
+    assert headers["content-encoding"] == "br" and body == LARGE_BODY
+
+    for content_type in ("image/png", "application/zip", "application/pdf", "font/woff2"):
+        headers, body = await _call(CompressionMiddleware(_app(LARGE_BODY, content_type)))
+        assert "content-encoding" not in headers, content_type
+        assert body == LARGE_BODY
+
+    headers, _ = await _call(CompressionMiddleware(_app(LARGE_BODY, "image/svg+xml")))
+    assert headers["content-encoding"] == "gzip"
+    logger.info("Contenus déjà encodés et types exclus laissés tels quels")
+
+@pytest.mark.asyncio
+async def test_vary_and_weak_etag():
+    app = _app(LARGE_BODY, extra_headers=[(b"etag", b'"abc"'), (b"vary", b"Authorization")])
+    headers, _ = await _call(CompressionMiddleware(app))
+    vary = {v.strip().lower() for v in headers["vary"].split(",")}
+    assert {"accept-encoding", "authorization"} <= vary
+    assert headers["etag"] == 'W/"abc"'
+
+@pytest.mark.asyncio
+async def test_per_route_levels():
+    middleware = CompressionMiddleware(
+        _app(LARGE_BODY), level=9, route_levels={"/admin": 1, "/admin/export": 0}
+    )
+    assert middleware.level_for("/admin/users") == 1
+    assert middleware.level_for("/admin/export/csv") == 0
+    assert middleware.level_for("/users/profile") == 9
+
+    def gzip_at(level: int) -> bytes:
+        c = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return c.compress(LARGE_BODY) + c.flush(zlib.Z_FINISH)
+
+    _, body = await _call(middleware, path="/admin/users")
+    assert body == gzip_at(1)
+    _, body = await _call(middleware, path="/users")
+    assert body == gzip_at(9)
+    headers, body = await _call(middleware, path="/admin/export/csv")
+    assert "content-encoding" not in headers and body == LARGE_BODY
+    logger.info("Niveau de compression par préfixe de route (0 = désactivée)")
+
+def _streamed_app(chunks, content_type: str = "application/json"):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type.encode())]})
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return app
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", list(ENCODERS))
+async def test_streamed_response_compressed_chunk_by_chunk(encoding):
+    # Réponse en plusieurs blocs (StreamingResponse) : chaque bloc est compressé et transmis aussitôt
+    chunks = [LARGE_BODY[i:i + 500] for i in range(0, len(LARGE_BODY), 500)]
+    middleware = CompressionMiddleware(_streamed_app(chunks), minimum_size=1024)
+    scope = {"type": "http", "method": "GET", "path": "/stream", "headers": [(b"accept-encoding", encoding.encode())]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    headers = Headers(raw=messages[0]["headers"])
+    bodies = messages[1:]
+    assert headers["content-encoding"] == encoding
+    # Taille inconnue à l'avance : pas de Content-Length, transfert par blocs
+    assert "content-length" not in headers
+    # Un message compressé par bloc reçu (vidage à chaque bloc), puis la fin du flux
+    assert len(bodies) >= len(chunks) // 2
+    assert all(m.get("more_body") for m in bodies[:-1]) and not bodies[-1].get("more_body", False)
+    stream = b"".join(m.get("body", b"") for m in bodies)
+    if encoding == "gzip":
+        decoded = gzip.decompress(stream)
+    elif encoding == "br":
+        import brotli
+        decoded = brotli.decompress(stream)
+    else:
+        import zstandard
+        decoded = zstandard.ZstdDecompressor().decompressobj().decompress(stream)
+    assert decoded == LARGE_BODY
+    logger.info(f"Réponse en {len(chunks)} blocs compressée à la volée ({encoding})")
+
+@pytest.mark.asyncio
+async def test_streamed_small_first_chunk_still_compressed():
+    # Le seuil minimum_size ne s'applique qu'aux corps complets : un premier bloc court d'un flux est compressé
+    chunks = [b"[", LARGE_BODY, b"]"]
+    headers, body = await _call(CompressionMiddleware(_streamed_app(chunks), minimum_size=1024))
+    assert headers["content-encoding"] == "gzip" and "content-length" not in headers
+    assert gzip.decompress(body) == b"[" + LARGE_BODY + b"]"
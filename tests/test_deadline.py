@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+import api.db.session as db_sess
+from api.core.deadline import DeadlineMiddleware, current_deadline, deadline_stats, statement_timeout_ms
+from api.core.ratelimit import PasswordWorkGate
+from api.db.session import QUERY_CANCELED
+from tests.logger import logger
+
+async def _call(app, path: str):
+    scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+    messages = []
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnect.set()
+    return messages
+
+@pytest.mark.asyncio
+async def test_route_budget_exceeded_returns_504():
+    seen = {}
+
+    async def slow_app(scope, receive, send):
+        seen["timeout_ms"] = statement_timeout_ms()
+        await asyncio.sleep(5)
+
+    app = DeadlineMiddleware(slow_app, default=10, route_budgets={"/lent": 0.2})
+    before = deadline_stats.timeouts
+    start = time.monotonic()
+    messages = await _call(app, "/lent")
+    assert time.monotonic() - start < 1
+    assert messages[0]["status"] == 504
+    assert json.loads(messages[1]["body"]) == {"detail": "Request deadline exceeded"}
+    assert deadline_stats.timeouts == before + 1
+    # Le budget restant est visible depuis la route (contextvar), puis effacé après la requête
+    assert 0 < seen["timeout_ms"] <= 200
+    assert current_deadline.get() is None
+    logger.info("Échéance dépassée : 504 renvoyée")
+
+@pytest.mark.asyncio
+async def test_route_without_budget_runs_to_completion():
+    async def app_ok(scope, receive, send):
+        assert statement_timeout_ms() is None
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    app = DeadlineMiddleware(app_ok, default=10, route_budgets={"/libre": 0})
+    messages = await _call(app, "/libre")
+    assert messages[0]["status"] == 200
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_running_route():
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        started.set()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"trop tard"})
+
+    async def receive():
+        # Le client part pendant que la route travaille encore
+        await started.wait()
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    app = DeadlineMiddleware(slow_app, default=10, route_budgets={})
+    before_cancelled, before_timeouts = deadline_stats.cancelled, deadline_stats.timeouts
+    start = time.monotonic()
+    await app({"type": "http", "method": "GET", "path": "/lent", "headers": []}, receive, send)
+    assert time.monotonic() - start < 1
+    assert cancelled.is_set()
+    assert messages == []
+    assert deadline_stats.cancelled == before_cancelled + 1
+    assert deadline_stats.timeouts == before_timeouts
+    logger.info("Déconnexion du client : route annulée sans réponse")
+
+@pytest.mark.asyncio
+async def test_deadline_reaches_sessions_outside_get_db():
+    # Une session ouverte hors get_db (lecture mutualisée, idempotence) hérite du budget de la requête
+    token = current_deadline.set(time.monotonic() + 0.2)
+    try:
+        async with db_sess.SessionLocal() as session:
+            with pytest.raises(DBAPIError) as exc_info:
+                await session.execute(text("SELECT pg_sleep(2)"))
+    finally:
+        current_deadline.reset(token)
+    assert getattr(exc_info.value.orig, "sqlstate", None) == QUERY_CANCELED
+    # Hors requête : pas de statement_timeout
+    async with db_sess.SessionLocal() as session:
+        assert (await session.execute(text("SHOW statement_timeout"))).scalar_one() == "0"
+    logger.info("statement_timeout appliqué à une session hors get_db")
+
+@pytest.mark.asyncio
+async def test_password_gate_keeps_permit_until_thread_ends():
+    gate = PasswordWorkGate(concurrency=1, max_queue=10, max_wait=5)
+    caller = asyncio.create_task(gate.run(time.sleep, 0.3))
+    await asyncio.sleep(0.05)
+    caller.cancel()
+    await asyncio.gather(caller, return_exceptions=True)
+    # L'appelant est parti mais le thread tourne encore : la place reste prise
+    assert gate.running == 1 and gate.abandoned == 1
+    start = time.monotonic()
+    assert await gate.run(lambda: "suivant") == "suivant"
+    assert time.monotonic() - start >= 0.15
+    assert gate.running == 0
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+import api.core.jobs as jobs_module
+from api.core.jobs import JobQueue, JobRunner, parse_queue_specs
+from tests.logger import logger
+
+def test_parse_queue_specs():
+    assert parse_queue_specs("default=1000:2, passwords=200:1") == {"default": (1000, 2), "passwords": (200, 1)}
+    assert parse_queue_specs("solo=") == {"solo": (1000, 1)}
+
+@pytest.mark.asyncio
+async def test_retries_with_backoff(monkeypatch):
+    delays = []
+
+    def fixed_backoff(attempt, base, maximum):
+        delays.append((attempt, base, maximum))
+        return 0.05 * attempt
+
+    monkeypatch.setattr(jobs_module, "backoff_delay", fixed_backoff)
+    queue = JobQueue("test", maxsize=10, workers=1, max_attempts=3, backoff_base=0.05, backoff_max=1)
+    calls = []
+
+    async def flaky():
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) < 3:
+            raise RuntimeError("échec temporaire")
+
+    queue.start()
+    assert queue.submit(flaky)
+    assert await queue.drain(5)
+    metrics = queue.metrics()
+    assert len(calls) == 3
+    assert metrics["retried"] == 2 and metrics["completed"] == 1 and metrics["failed"] == 0
+    # Backoff demandé avec les paramètres de la file, puis respecté entre deux essais
+    assert delays == [(1, 0.05, 1), (2, 0.05, 1)]
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    assert gaps[0] >= 0.045 and gaps[1] >= 0.095
+    logger.info(f"Essais espacés de {[round(g, 3) for g in gaps]}s")
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts():
+    queue = JobQueue("test", maxsize=10, workers=1, max_attempts=2, backoff_base=0.01, backoff_max=0.05)
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        raise RuntimeError("toujours en échec")
+
+    queue.start()
+    queue.submit(broken)
+    assert await queue.drain(5)
+    assert len(calls) == 2
+    assert queue.metrics()["failed"] == 1 and queue.metrics()["retried"] == 1
+
+@pytest.mark.asyncio
+async def test_queue_full_rejects_without_waiting():
+    queue = JobQueue("test", maxsize=2, workers=1)
+
+    async def noop():
+        pass
+
+    # Workers non démarrés : la file se remplit
+    assert queue.submit(noop) and queue.submit(noop)
+    assert queue.submit(noop) is False
+    metrics = queue.metrics()
+    assert metrics["rejected"] == 1 and metrics["submitted"] == 2 and metrics["size"] == 2
+
+    queue.start()
+    assert await queue.drain(5)
+    assert queue.metrics()["completed"] == 2
+
+@pytest.mark.asyncio
+async def test_drain_runs_pending_jobs():
+    queue = JobQueue("test", maxsize=50, workers=2)
+    done = []
+
+    async def work(i):
+        await asyncio.sleep(0.01)
+        done.append(i)
+
+    for i in range(20):
+        queue.submit(work, i)
+    queue.start()
+    assert await queue.drain(5)
+    assert sorted(done) == list(range(20))
+    assert queue.metrics()["size"] == 0
+
+@pytest.mark.asyncio
+async def test_drain_timeout_returns_false():
+    queue = JobQueue("test", maxsize=10, workers=1)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    queue.start()
+    queue.submit(slow)
+    queue.submit(slow)
+    await started.wait()
+    assert await queue.drain(0.1) is False
+    # Les workers sont arrêtés malgré le dépassement
+    assert queue.metrics()["completed"] == 0
+
+@pytest.mark.asyncio
+async def test_ttl_expires_queued_job():
+    queue = JobQueue("test", maxsize=10, workers=1)
+    ran = []
+
+    async def sensitive(secret):
+        ran.append(secret)
+
+    queue.submit(sensitive, "expiré", ttl=0.05)
+    queue.submit(sensitive, "à temps", ttl=5)
+    await asyncio.sleep(0.1)
+    queue.start()
+    assert await queue.drain(5)
+    assert ran == ["à temps"]
+    assert queue.metrics()["expired"] == 1
+
+@pytest.mark.asyncio
+async def test_ttl_stops_retries(monkeypatch):
+    monkeypatch.setattr(jobs_module, "backoff_delay", lambda attempt, base, maximum: 0.2)
+    queue = JobQueue("test", maxsize=10, workers=1, max_attempts=5, backoff_base=0.2, backoff_max=0.2)
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        raise RuntimeError("échec")
+
+    queue.start()
+    queue.submit(broken, ttl=0.1)
+    assert await queue.drain(5)
+    assert len(calls) == 1
+    assert queue.metrics()["expired"] == 1 and queue.metrics()["failed"] == 0
+
+@pytest.mark.asyncio
+async def test_runner_falls_back_to_default_queue():
+    runner = JobRunner({"default": (10, 1)})
+    done = []
+
+    async def work():
+        done.append(True)
+
+    runner.start()
+    assert runner.submit("inconnue", work)
+    assert await runner.drain(5)
+    assert done == [True]
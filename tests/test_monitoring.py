@@ -5,3 +5,9 @@ async def test_health_check(async_client):
     resp = await async_client.get("/health")
     assert resp.status_code == 200, resp.text
     assert resp.json() == {"status": "ok"}
+
+@pytest.mark.asyncio
+async def test_ready_after_warm_up(async_client):
+    resp = await async_client.get("/ready")
+    assert resp.status_code == 200, resp.text
+    assert resp.json() == {"status": "ready"}
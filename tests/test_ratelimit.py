@@ -0,0 +1,22 @@
+from starlette.requests import Request
+
+import api.core.ratelimit as ratelimit
+from api.core.ratelimit import client_ip, parse_trusted_proxies
+
+def _request(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "client": (peer, 40000), "headers": headers})
+
+def test_forwarded_for_ignored_from_untrusted_peer(monkeypatch):
+    monkeypatch.setattr(ratelimit, "trusted_proxies", parse_trusted_proxies("172.16.0.0/12"))
+    assert client_ip(_request("203.0.113.7", "1.2.3.4")) == "203.0.113.7"
+
+def test_forwarded_for_from_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(ratelimit, "trusted_proxies", parse_trusted_proxies("172.16.0.0/12, 10.0.0.1"))
+    # L'entrée la plus à gauche est fournie par le client : seule la première hors proxys fait foi
+    assert client_ip(_request("172.18.0.5", "6.6.6.6, 198.51.100.2, 10.0.0.1")) == "198.51.100.2"
+    assert client_ip(_request("172.18.0.5")) == "172.18.0.5"
+
+def test_no_trusted_proxies_by_default(monkeypatch):
+    monkeypatch.setattr(ratelimit, "trusted_proxies", parse_trusted_proxies(""))
+    assert client_ip(_request("172.18.0.5", "1.2.3.4")) == "172.18.0.5"
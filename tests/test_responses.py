@@ -0,0 +1,43 @@
+import datetime
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+
+import api.core.responses as responses
+from api.core.responses import FastJSONResponse, rows_to_dicts, trusted_json
+from tests.logger import logger
+
+CREATED_AT = datetime.datetime(2025, 4, 14, 18, 48, 3, 484480)
+ROWS = [(1, "alice", CREATED_AT, None), (2, "bob", CREATED_AT.replace(microsecond=0), "Bio")]
+KEYS = ("id", "username", "created_at", "bio")
+
+def test_rows_to_dicts_serializes_datetimes_and_none():
+    payload = rows_to_dicts(ROWS, KEYS)
+    assert payload[0] == {"id": 1, "username": "alice", "created_at": CREATED_AT, "bio": None}
+    decoded = json.loads(trusted_json(payload).body)
+    assert decoded[0]["created_at"] == "2025-04-14T18:48:03.484480"
+    assert decoded[0]["bio"] is None
+    assert decoded[1]["created_at"] == "2025-04-14T18:48:03"
+    logger.info("Lignes SQL encodées : dates ISO 8601, None -> null")
+
+@pytest.mark.parametrize("with_orjson", [True, False])
+def test_json_dumps_fallback_matches_orjson(monkeypatch, with_orjson):
+    if with_orjson and responses.orjson is None:
+        pytest.skip("orjson non installé")
+    if not with_orjson:
+        monkeypatch.setattr(responses, "orjson", None)
+    body = responses.json_dumps({"at": CREATED_AT, "day": CREATED_AT.date(), "bio": None, "name": "Élodie"})
+    assert json.loads(body) == {"at": "2025-04-14T18:48:03.484480", "day": "2025-04-14", "bio": None, "name": "Élodie"}
+
+def test_fast_json_headers_match_json_response():
+    content = {"id": 1, "username": "alice", "bio": None, "roles": ["user"]}
+    expected = JSONResponse(content)
+    for response in (FastJSONResponse(content), trusted_json(content)):
+        assert response.body == expected.body
+        assert response.headers["content-type"] == expected.headers["content-type"] == "application/json"
+        assert response.headers["content-length"] == expected.headers["content-length"]
+        assert response.status_code == expected.status_code
+    custom = trusted_json(content, status_code=201, headers={"ETag": '"v1"'})
+    assert custom.status_code == 201 and custom.headers["etag"] == '"v1"'
+    logger.info("FastJSONResponse / trusted_json : mêmes en-têtes que JSONResponse")
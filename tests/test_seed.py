@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import select
+
+from api.core.crypto import decrypt_sensitive_data
+from api.db.models import User, UserSensitiveData
+from api.db.seed import SEED_PASSWORD, seed
+from tests.logger import logger
+
+SEED_COUNT = 100
+
+@pytest.mark.asyncio
+async def test_seed_smoke(async_client, db_session):
+    # Deux lots, un seul processus de génération : ids réservés, COPY, bios chiffrées
+    inserted = await seed(SEED_COUNT, batch_size=60, workers=1, prefix="smoke", admins=1, with_bio=True)
+    assert inserted == SEED_COUNT
+
+    rows = (await db_session.execute(
+        select(User.id, User.username, User.role, User.encryption_key, UserSensitiveData.encrypted_bio)
+        .join(UserSensitiveData, UserSensitiveData.user_id == User.id)
+        .where(User.username.like("smoke%"))
+        .order_by(User.username)
+    )).all()
+    # Chaque utilisateur a sa ligne user_sensitive_data, liée par l'id réservé sur la séquence
+    assert len(rows) == SEED_COUNT
+    assert len({row.id for row in rows}) == SEED_COUNT
+    assert [row.role for row in rows[:2]] == ["admin", "user"]
+    for row in rows:
+        assert decrypt_sensitive_data(row.encrypted_bio, row.encryption_key) == f"Bio synthétique de {row.username}"
+
+    resp = await async_client.post("/users/login", json={"username": rows[-1].username, "password": SEED_PASSWORD})
+    assert resp.status_code == 200, resp.text
+    assert "access_token" in resp.json()
+
+    # La séquence reste cohérente : une inscription après le seed obtient un id libre
+    max_id = max(row.id for row in rows)
+    resp = await async_client.post("/users/register", json={
+        "username": "afterseed", "email": "afterseed@example.com", "password": "pwd1234"
+    })
+    assert resp.status_code == 201, resp.text
+    new_id = (await db_session.execute(select(User.id).where(User.username == "afterseed"))).scalar_one()
+    assert new_id > max_id
+    logger.info(f"Seed de {SEED_COUNT} utilisateurs vérifié (bios, login)")
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from api.core.singleflight import SingleFlight
+
+def _counting_read(delay: float):
+    calls = []
+
+    async def read():
+        calls.append(len(calls) + 1)
+        number = len(calls)
+        await asyncio.sleep(delay)
+        return number
+
+    return read, calls
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_read():
+    flight = SingleFlight("test", timeout=5)
+    read, calls = _counting_read(0.05)
+    results = await asyncio.gather(*(flight.do("k", read) for _ in range(10)))
+    assert results == [1] * 10
+    assert calls == [1]
+    assert flight.metrics()["shared"] == 9 and flight.metrics()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_read_older_than_max_age_is_not_joined():
+    flight = SingleFlight("test", timeout=5)
+    read, calls = _counting_read(0.3)
+    first = asyncio.create_task(flight.do("k", read, max_age=0.1))
+    await asyncio.sleep(0.01)
+    joined = asyncio.create_task(flight.do("k", read, max_age=0.1))
+    await asyncio.sleep(0.15)
+    # Arrivé après la fenêtre : nouvelle lecture, le résultat partagé serait trop ancien
+    late = asyncio.create_task(flight.do("k", read, max_age=0.1))
+    assert await first == 1 and await joined == 1
+    assert await late == 2
+    assert flight.metrics()["too_old"] == 1
+    assert flight.metrics()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_error_is_shared_and_key_released():
+    flight = SingleFlight("test", timeout=5)
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("base indisponible")
+
+    results = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    read, _ = _counting_read(0)
+    assert await flight.do("k", read) == 1
+
+@pytest.mark.asyncio
+async def test_each_caller_waits_its_own_budget():
+    flight = SingleFlight("test", timeout=5)
+    read, calls = _counting_read(0.3)
+    short = asyncio.create_task(flight.do("k", read, wait=0.05))
+    await asyncio.sleep(0.01)
+    long = asyncio.create_task(flight.do("k", read, wait=2))
+    # Le premier appelant abandonne à son échéance ; la lecture continue pour le second
+    with pytest.raises(asyncio.TimeoutError):
+        await short
+    assert await long == 1
+    assert calls == [1]
+    assert flight.metrics()["timeouts"] == 1
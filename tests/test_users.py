@@ -1,4 +1,16 @@
+import asyncio
 import pytest
+from cryptography.fernet import Fernet
+from sqlalchemy import update
+import api.core.crypto as crypto
+import api.db.services as services
+from api.core.crypto import KeyCache, MasterKeyring, RotationWatcher, generate_user_key
+from api.db.models import User
+from api.db.services import get_user_encryption_key, record_key_rotation, rewrap_user_keys
+from tests.logger import logger
+
+# Assez de connexions pour interroger chaque worker de l'API (compteurs /admin/metrics par process)
+METRICS_SAMPLES = 32
 
 @pytest.mark.order(1)
 @pytest.mark.asyncio
@@ -33,3 +45,171 @@ async def test_login_user_returns_tokens(async_client):
     assert isinstance(data["access_token"], str)
     assert isinstance(data["refresh_token"], str)
     assert data["token_type"] == "bearer"
+
+@pytest.mark.asyncio
+async def test_profile_conditional_get(async_client):
+    await async_client.post("/users/register", json={
+        "username": "etaguser",
+        "email": "etag@example.com",
+        "password": "pwd1234",
+        "bio": "bio initiale"
+    })
+    resp = await async_client.get("/users/profile", headers={"X-User": "etaguser"})
+    assert resp.status_code == 200
+    assert resp.json()["bio"] == "bio initiale"
+    etag = resp.headers["ETag"]
+    assert "Last-Modified" in resp.headers
+    resp2 = await async_client.get("/users/profile", headers={"X-User": "etaguser", "If-None-Match": etag})
+    assert resp2.status_code == 304
+
+@pytest.mark.asyncio
+async def test_login_rate_limited_per_username(async_client):
+    statuses = []
+    for _ in range(12):
+        resp = await async_client.post("/users/login", json={
+            "username": "ghost_ratelimit",
+            "password": "wrong-password"
+        })
+        statuses.append(resp.status_code)
+    assert statuses[0] == 401
+    assert statuses[-1] == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+
+@pytest.mark.asyncio
+async def test_patch_profile(async_client):
+    await async_client.post("/users/register", json={
+        "username": "patchuser",
+        "email": "patch@example.com",
+        "password": "pwd1234",
+        "bio": "avant"
+    })
+    headers = {"X-User": "patchuser"}
+    etag = (await async_client.get("/users/profile", headers=headers)).headers["ETag"]
+
+    resp = await async_client.patch("/users/profile", headers=headers, json={"bio": "après"})
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["bio"] == "après"
+    assert resp.json()["email"] == "patch@example.com"
+
+    resp = await async_client.patch("/users/profile", headers=headers, json={
+        "email": "patch2@example.com", "password": "newpwd123"
+    })
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["email"] == "patch2@example.com"
+    assert resp.json()["bio"] == "après"
+
+    login = await async_client.post("/users/login", json={"username": "patchuser", "password": "newpwd123"})
+    assert login.status_code == 200
+    stale = await async_client.get("/users/profile", headers={**headers, "If-None-Match": etag})
+    assert stale.status_code == 200
+    assert stale.json()["bio"] == "après"
+
+    unknown = await async_client.patch("/users/profile", headers={"X-User": "ghost_patch"}, json={"password": "x1234567"})
+    assert unknown.status_code == 401
+
+@pytest.mark.asyncio
+async def test_user_key_is_wrapped(async_client, db_session, monkeypatch):
+    old_master, new_master = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+    keyring = MasterKeyring(f"old:{old_master},new:{new_master}", "old")
+    monkeypatch.setattr(crypto, "master_keys", keyring)
+    monkeypatch.setattr(services, "master_keys", keyring)
+
+    # Nouvelle clé : enveloppée par la clé maître active, jamais en clair
+    wrapped = crypto.generate_user_key()
+    assert wrapped.startswith("old$")
+    data_key = keyring.unwrap(wrapped)
+    assert data_key not in wrapped
+
+    for name in ("wrapuser", "legacyuser"):
+        resp = await async_client.post("/users/register", json={
+            "username": name, "email": f"{name}@example.com", "password": "pwd1234", "bio": "bio chiffrée"
+        })
+        assert resp.status_code == 201, resp.text
+    # Ancien format : clé de données en clair, sans préfixe kid$
+    legacy_key = Fernet.generate_key().decode()
+    secret = crypto.encrypt_sensitive_data("donnée ancienne", legacy_key)
+    await db_session.execute(update(User).where(User.username == "wrapuser").values(encryption_key=wrapped))
+    await db_session.execute(update(User).where(User.username == "legacyuser").values(encryption_key=legacy_key))
+    await db_session.commit()
+    assert keyring.unwrap(legacy_key) == legacy_key
+    assert keyring.needs_rewrap(legacy_key) and not keyring.needs_rewrap(wrapped)
+
+    # Rotation : tout passe sous la nouvelle clé maître, les clés de données ne changent pas
+    keyring.active_kid = "new"
+    after_id, total = 0, 0
+    while after_id is not None:
+        rewrapped, after_id = await rewrap_user_keys(db_session, after_id, 1)
+        total += rewrapped
+    await db_session.commit()
+    assert total >= 2
+    stored = await get_user_encryption_key(db_session, "wrapuser")
+    assert stored.startswith("new$") and keyring.unwrap(stored) == data_key
+    stored_legacy = await get_user_encryption_key(db_session, "legacyuser")
+    assert stored_legacy.startswith("new$") and keyring.unwrap(stored_legacy) == legacy_key
+    assert crypto.decrypt_sensitive_data(secret, stored_legacy) == "donnée ancienne"
+    # Deuxième passage : plus rien à ré-envelopper
+    rewrapped, after_id = await rewrap_user_keys(db_session, 0, 1000)
+    assert rewrapped == 0
+
+@pytest.mark.asyncio
+async def test_key_cache_cleared_on_rotation(db_session):
+    cache = KeyCache(capacity=10, ttl=60)
+    cache.put("old$clé", Fernet(Fernet.generate_key()))
+    watcher = RotationWatcher(cache, interval=0)
+    # Premier relevé : point de départ, le cache est conservé
+    assert await watcher.check() is False
+    assert cache.get("old$clé") is not None
+    await record_key_rotation(db_session, "new", 1)
+    await db_session.commit()
+    assert await watcher.check() is True
+    assert cache.get("old$clé") is None
+    assert cache.metrics()["invalidations"] == 1
+    assert await watcher.check() is False
+
+@pytest.mark.asyncio
+async def test_profile_reads_with_wrapped_key(async_client):
+    await async_client.post("/users/register", json={
+        "username": "cacheuser",
+        "email": "cache@example.com",
+        "password": "pwd1234",
+        "bio": "bio chiffrée"
+    })
+    # Deuxième lecture servie par le cache de clés du worker
+    for _ in range(2):
+        resp = await async_client.get("/users/profile", headers={"X-User": "cacheuser"})
+        assert resp.status_code == 200
+        assert resp.json()["bio"] == "bio chiffrée"
+
+async def _user_reads_shared(async_client, admin: str) -> dict:
+    """Compteur `shared` des lectures mutualisées par worker (pid) : une nouvelle connexion par requête."""
+    shared = {}
+    for _ in range(METRICS_SAMPLES):
+        resp = await async_client.get("/admin/metrics", headers={"X-User": admin, "Connection": "close"})
+        assert resp.status_code == 200, resp.text
+        shared[resp.json()["pid"]] = resp.json()["user_reads"]["shared"]
+    return shared
+
+@pytest.mark.asyncio
+async def test_concurrent_profile_reads(async_client, db_session):
+    await async_client.post("/users/register", json={
+        "username": "burstuser",
+        "email": "burst@example.com",
+        "password": "pwd1234",
+        "bio": "rafale"
+    })
+    await services.create_user(
+        db_session, username="burstadmin", email="burstadmin@example.com",
+        password="AdminPass!23", role="admin", encryption_key=generate_user_key(),
+    )
+    before = await _user_reads_shared(async_client, "burstadmin")
+    # Lectures identiques simultanées : mutualisées côté API, chaque appelant reçoit le même profil
+    responses = await asyncio.gather(*(
+        async_client.get("/users/profile", headers={"X-User": "burstuser"}) for _ in range(50)
+    ))
+    assert all(r.status_code == 200 for r in responses)
+    assert {r.json()["bio"] for r in responses} == {"rafale"}
+    after = await _user_reads_shared(async_client, "burstadmin")
+    # Compteurs par worker : delta sur les workers vus avant et après la rafale
+    shared = sum(after[pid] - before[pid] for pid in after.keys() & before.keys())
+    assert shared > 0, (before, after)
+    logger.info(f"Rafale de profils : {shared} lecture(s) mutualisée(s)")